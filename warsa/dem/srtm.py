@@ -4,11 +4,13 @@ import zipfile
 import ftplib
 import time
 from osgeo import ogr
-from cookielib import CookieJar
 from urllib2 import urlopen
 from bs4 import BeautifulSoup
 from os.path import basename, splitext
 from warsa.config import read_config, decrypt
+from warsa.precipitation.satellite.ftp_pool import FTPSession, list_ftp_dir_lines
+from warsa.utils.http_pool import HTTPDownloadPool
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file
 from girs.feat.layers import LayersReader, LayersWriter, FieldDefinition
 from girs.feat.geom import create_polygon
 from girs.srs import get_srs
@@ -121,27 +123,29 @@ def get_srtm_3arc(srtm_dir):
 
 
 def download_srtm_3arc(target_dir, url='srtm.csi.cgiar.org',
-                       source_dir='/SRTM_V41/SRTM_Data_GeoTiff/'):
-    ftp = None
+                       source_dir='/SRTM_V41/SRTM_Data_GeoTiff/', retry_policy=None):
+    session = None
     try:
-        ftp = ftplib.FTP(url)
-        ftp.cwd(source_dir)
-        source_files = []
-        ftp.retrlines('LIST', source_files.append)
+        # reconnected after transient errors, see ftp_pool.FTPSession
+        session = FTPSession(url, retry_policy=retry_policy)
+        source_files = session.call(list_ftp_dir_lines, source_dir)
         source_files = set([d.split()[-1] for d in source_files] if os.path.isdir(target_dir) else [])
         target_files = set(f for f in os.listdir(target_dir) if f.endswith('.zip'))
         files_to_download = sorted(list(source_files - target_files))
         for i, file_name in enumerate(files_to_download):
             dt0 = time.time()
             print '{}: downloading {}'.format(i, file_name),
-            with open(os.path.join(target_dir, file_name), 'wb') as srtm_file:
-                ftp.retrbinary('RETR %s' % file_name, srtm_file.write)
-            print ' done in {} seconds.'.format(time.time() - dt0)
+            try:
+                session.call(retrieve_ftp_file, source_dir.rstrip('/') + '/' + file_name,
+                             os.path.join(target_dir, file_name))
+                print ' done in {} seconds.'.format(time.time() - dt0)
+            except ftplib.all_errors, e:
+                print ' failed in {} seconds (partial file kept): {}'.format(time.time() - dt0, e)
     except Exception, e:
         print e
     finally:
-        if ftp:
-            ftp.close()
+        if session:
+            session.close()
 
 
 # =============================================================================
@@ -272,56 +276,43 @@ def download_srtm_1arcsec_from_layers(layers, **kwargs):
     download_srtm_1arcsec_from_tile_names(srtm_filenames)
 
 
-def download_srtm_1arcsec_from_tile_names(tilenames_source):
+def download_srtm_1arcsec_from_tile_names(tilenames_source, workers=4, url=None, credentials=None):
     """Download SRTM 1 arcsec files given in filenames_source
 
-    Files are only downloaded if not found in the local SRTM directory
+    Files are only downloaded if not found in the local SRTM directory. Files are downloaded by parallel workers
+    keeping their connections alive, written while received and resumed after interrupted transfers (see
+    HTTPDownloadPool).
 
     :param tilenames_source: file names to download
     :type tilenames_source: list of str
-    :return:
+    :param workers: number of parallel downloads
+    :param url: server directory, default get_srtm_1arcsec_url()
+    :param credentials: dictionary host -> (user, password), default the Earthdata login from the config file
+    :return: list of file names not downloaded
     """
     if not tilenames_source:
-        return
+        return []
     # See: https://wiki.earthdata.nasa.gov/display/EL/How+To+Access+Data+With+Python
-    config = read_config()
-    # srtm_url = 'https://e4ftl01.cr.usgs.gov/SRTM/SRTMGL1.003/2000.02.11/'
-    # srtm_url = 'https://e4ftl01.cr.usgs.gov//MODV6_Dal_D/SRTM/SRTMGL1.003/2000.02.11'
-    srtm_url = 'https://e4ftl01.cr.usgs.gov/MEASURES/SRTMGL1.003/2000.02.11/'
-    srtm_usr = config.get('dem', '1arcsec_usr')
-    srtm_pwd = config.get('dem', '1arcsec_pwd')
+    srtm_url = url or get_srtm_1arcsec_url()
+    if credentials is None:
+        config = read_config()
+        usr, pwd = decrypt(config.get('dem', '1arcsec_usr'), config.get('dem', '1arcsec_pwd'))
+        credentials = {'urs.earthdata.nasa.gov': (usr, pwd)}
     srtm_dir = get_srtm_1arcsec_dir()
+    if not os.path.isdir(srtm_dir):
+        os.makedirs(srtm_dir)
 
     tilenames_target = [f for f in os.listdir(srtm_dir) if f.endswith('hgt.zip')]
-    tilenames_source = set(tilenames_source) - set(tilenames_target)
+    tilenames_source = sorted(set(tilenames_source) - set(tilenames_target))
     print 'Downloading {} SRTM 1 arc files'.format(len(tilenames_source))
 
-    usr, pwd = decrypt(srtm_usr, srtm_pwd)
-    password_manager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-    password_manager.add_password(None, "https://urs.earthdata.nasa.gov", usr, pwd)
-    cj = CookieJar()
-    opener = urllib2.build_opener(
-        urllib2.HTTPBasicAuthHandler(password_manager),
-        # urllib2.HTTPHandler(debuglevel=1),    # Uncomment these two lines to see
-        # urllib2.HTTPSHandler(debuglevel=1),   # details of the requests/responses
-        urllib2.HTTPCookieProcessor(cj))
-    urllib2.install_opener(opener)
-
-    for i, filename_source in enumerate(tilenames_source):
-        t0 = time.time()
-        print '{}: downloading {}'.format(i+1, filename_source),
-        file_url = srtm_url + filename_source
-        req = urllib2.Request(file_url)
-        response = None
-        try:
-            response = urllib2.urlopen(req)
-            body = response.read()
-            with open(os.path.join(srtm_dir, filename_source), 'wb') as f:
-                f.write(body)
-            print ' done in {} seconds'.format(time.time()-t0)
-        finally:
-            if response:
-                response.close()
+    t0 = time.time()
+    pool = HTTPDownloadPool(workers, credentials)
+    results = pool.map([(srtm_url + f, os.path.join(srtm_dir, f)) for f in tilenames_source])
+    failed = [os.path.basename(local_filename) for _, local_filename, downloaded in results if not downloaded]
+    print '{} files downloaded in {:.1f} seconds ({} connections, {} requests), {} failed'.format(
+        len(results) - len(failed), time.time() - t0, pool.connects, pool.requests, len(failed))
+    return failed
 
 
 def download_srtm_1arcsec():
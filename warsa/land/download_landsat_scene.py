@@ -16,6 +16,10 @@ import subprocess
 import optparse
 import datetime
 import csv
+import tarfile
+from warsa.land.scene_catalog import CATALOG_FILENAME, LandsatMetadataCatalog
+from warsa.land.segmented_download import download_segmented, open_range
+from warsa.land.tgz_extract import extract_landsat_tgz
 
 
 ###########################################################################
@@ -134,6 +138,43 @@ def downloadChunks(url, rep, nom_fic):
     return rep, nom_fic
 
 
+def downloadSegments(url, rep, nom_fic, segments=4):
+    """ Downloads large files in segments, each over its own connection (see segmented_download.download_segmented)
+    An interrupted download is resumed at the next call.
+    """
+    try:
+        req, total_size, _ = open_range(url, 0, 1)
+        if (req.info().gettype() == 'text/html'):
+            print "erreur : le fichier est au format html"
+            lignes = req.read()
+            if lignes.find('Download Not Found') > 0:
+                raise TypeError
+            else:
+                print lignes
+                print sys.exit(-1)
+        req.close()
+        if (total_size is None or total_size < 50000):
+            print "Error: The file is too small to be a Landsat Image"
+            print url
+            sys.exit(-1)
+        print('Downloading {0} ({1}) in {2} segments:'.format(nom_fic, sizeof_fmt(total_size), segments))
+        download_segmented(url, os.path.join(rep, nom_fic), segments)
+    except urllib2.HTTPError, e:
+        if e.code == 500:
+            pass  # File doesn't exist
+        else:
+            print "HTTP Error:", e.code, url
+        return False
+    except urllib2.URLError, e:
+        print "URL Error:", e.reason, url
+        return False
+    except IOError, e:
+        print "Error:", e
+        return False
+
+    return rep, nom_fic
+
+
 ##################
 def cycle_day(path):
     """ provides the day in cycle given the path number
@@ -207,6 +248,31 @@ def unzipimage(tgzfile, outputdir):
     return success
 
 
+#############################"Extract tgz file in-process, only the requested bands if the cloud cover is below the limit
+def extractimage(tgzfile, outputdir, bands=None, cloud_limit=None):
+    """ Same as unzipimage followed by check_cloud_limit, without writing the bands of images exceeding cloud_limit
+    (see tgz_extract.extract_landsat_tgz)
+    :return: tuple (success, removed), removed is 1 if the image was not extracted because of the cloud cover
+    """
+    success = 0
+    removed = 0
+    filename = os.path.join(outputdir, tgzfile + '.tgz')
+    if os.path.exists(filename):
+        print "\nextracting..."
+        try:
+            cloudcover, written = extract_landsat_tgz(filename, os.path.join(outputdir, tgzfile), bands, cloud_limit)
+            if not written:
+                print "Image was not extracted because the cloud cover value of " + str(
+                    cloudcover) + " exceeded the limit defined by the user!"
+                removed = 1
+            success = 1
+        except (IOError, EOFError, tarfile.TarError), e:
+            print 'Failed to extract %s: %s' % (tgzfile, e)
+            return success, removed
+        os.remove(filename)
+    return success, removed
+
+
 #############################"Read image metadata
 def read_cloudcover_in_metadata(image_path):
     output_list = []
@@ -263,6 +329,21 @@ def find_in_collection_metadata(collection_file, cc_limit, date_start, date_end,
     return sceneID
 
 
+#############################"Find image with desired specs in the indexed catalog of the usgs collection metadata
+def find_in_collection_catalog(collection_file, cc_limit, date_start, date_end, wr2path, wr2row):
+    """ Same as find_in_collection_metadata using the catalog (sqlite) saved next to collection_file
+    collection_file is imported into the catalog the first time and again after it was updated
+    """
+    print "Searching for images in catalog..."
+    catalog = LandsatMetadataCatalog(os.path.join(os.path.dirname(collection_file), CATALOG_FILENAME))
+    try:
+        catalog.refresh([collection_file])
+        return catalog.find_min_cloud_cover(wr2path, wr2row, date_start, date_end, cc_limit,
+                                            LandsatMetadataCatalog.get_collection(collection_file))
+    finally:
+        catalog.close()
+
+
 #############################"Write info to logfile
 def log(location, info):
     logfile = os.path.join(location, 'log.txt')
@@ -324,6 +405,10 @@ def main():
         parser.add_option("--station", dest="station", action="store", type="string", \
                           help="Station acronym (3 letters) of the receiving station where the file is downloaded",
                           default=None)
+        parser.add_option("--bands", dest="bands", action="store", type="string", \
+                          help="Bands to extract, comma separated (ex B4,B5,BQA), default all", default=None)
+        parser.add_option("--segments", dest="segments", action="store", type="int", \
+                          help="Number of parallel segments of each download (1: single stream)", default=4)
         parser.add_option("-k", "--updatecatalogfiles", dest="updatecatalogfiles", action="store", type="choice", \
                           help="Update catalog metadata files", choices=['update', 'noupdate'], default='noupdate')
 
@@ -340,6 +425,7 @@ def main():
 
     print options.station, options.dir
     rep = options.output
+    bands = options.bands.split(',') if options.bands else None
     if not os.path.exists(rep):
         os.mkdir(rep)
         if options.option == 'liste':
@@ -448,21 +534,21 @@ def main():
                     elif os.path.isfile(tgzfile):
                         print '   product %s already downloaded' % nom_prod
                         if options.unzip != None:
-                            p = unzipimage(nom_prod, rep_scene)
+                            p, removed = extractimage(nom_prod, rep_scene, bands, options.clouds)
                             if p == 1 and options.clouds != None:
-                                check = check_cloud_limit(lsdestdir, options.clouds)
+                                check = removed
                                 if check == 0:
                                     downloaded_ids.append(nom_prod)
                     else:
                         try:
-                            downloadChunks(url, "%s" % rep_scene, nom_prod + '.tgz')
+                            downloadSegments(url, "%s" % rep_scene, nom_prod + '.tgz', options.segments)
                         except:
                             print '   product %s not found' % nom_prod
                             notfound = True
                         if notfound != True and options.unzip != None:
-                            p = unzipimage(nom_prod, rep_scene)
+                            p, removed = extractimage(nom_prod, rep_scene, bands, options.clouds)
                             if p == 1 and options.clouds != None:
-                                check = check_cloud_limit(lsdestdir, options.clouds)
+                                check = removed
                                 if check == 0:
                                     downloaded_ids.append(nom_prod)
         log(rep, downloaded_ids)
@@ -516,7 +602,7 @@ def main():
 
         notfound = False
 
-        nom_prod = find_in_collection_metadata(collection_file, options.clouds, date_start, date_end, path, row)
+        nom_prod = find_in_collection_catalog(collection_file, options.clouds, date_start, date_end, path, row)
         if nom_prod == '':
             sys.exit('No image was found in the catalog with the given specifications! Exiting...')
         else:
@@ -530,7 +616,7 @@ def main():
         elif os.path.isfile(tgzfile):
             print '   product %s already downloaded' % nom_prod
             if options.unzip != None:
-                p = unzipimage(nom_prod, rep_scene)
+                p, _ = extractimage(nom_prod, rep_scene, bands)
                 if p == 1:
                     downloaded_ids.append(nom_prod)
                     check = 0
@@ -539,14 +625,14 @@ def main():
                 for collectionid in repert:
                     url = "http://earthexplorer.usgs.gov/hydro_cst_download/%s/%s/STANDARD/EE" % (collectionid, nom_prod)
                     try:
-                        downloadChunks(url, "%s" % rep_scene, nom_prod + '.tgz')
+                        downloadSegments(url, "%s" % rep_scene, nom_prod + '.tgz', options.segments)
                     except:
                         print '   product %s not found' % nom_prod
                         notfound = True
                     if notfound != True and options.unzip != None:
-                        p = unzipimage(nom_prod, rep_scene)
+                        p, removed = extractimage(nom_prod, rep_scene, bands, options.clouds)
                         if p == 1 and options.clouds != None:
-                            check = check_cloud_limit(lsdestdir, options.clouds)
+                            check = removed
                             if check == 0:
                                 downloaded_ids.append(nom_prod)
         log(rep, downloaded_ids)
@@ -579,7 +665,7 @@ def main():
                 else:
                     connect_earthexplorer_no_proxy(usgs)
 
-                downloadChunks(url, rep + '/' + site, produit + '.tgz')
+                downloadSegments(url, rep + '/' + site, produit + '.tgz', options.segments)
             except TypeError:
                 print 'produit %s non trouve' % produit
 
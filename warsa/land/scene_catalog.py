@@ -0,0 +1,158 @@
+import os
+import csv
+import sqlite3
+import threading
+
+CATALOG_FILENAME = 'landsat_metadata.sqlite'
+
+
+def _to_int(s):
+    try:
+        return int(s)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(s):
+    try:
+        return float(s)
+    except (TypeError, ValueError):
+        return None
+
+
+class LandsatMetadataCatalog(object):
+    """Indexed catalog (sqlite) of the scenes listed in the USGS Landsat bulk metadata files (csv)
+
+    Each csv file is imported once into the table scenes with the columns needed to search scenes (sceneID, path, row,
+    acquisition date, cloud cover and data type), indexed on path, row and acquisition date. The size and modification
+    time of each imported csv file are recorded; a csv file replaced by getmetadatafiles(..., 'update') is imported
+    again at the next refresh, the others are not read.
+
+    Usage:
+        catalog = LandsatMetadataCatalog(os.path.join(catalog_dir, CATALOG_FILENAME))
+        catalog.refresh([os.path.join(catalog_dir, 'LANDSAT_8.csv')])
+        scene_id = catalog.find_min_cloud_cover(198, 30, date_start, date_end, cc_limit=20)
+    """
+
+    def __init__(self, filename):
+        """
+
+        :param filename: sqlite file name
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        d = os.path.dirname(filename)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS scenes (sceneID TEXT, collection TEXT, path INTEGER, '
+                              'row INTEGER, acquisitionDate TEXT, cloudCoverFull REAL, data_type TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS scenes_path_row_date ON scenes (path, row, acquisitionDate)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS scenes_collection ON scenes (collection)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sources (collection TEXT PRIMARY KEY, size INTEGER, '
+                              'mtime REAL)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM scenes').fetchone()[0]
+
+    @staticmethod
+    def get_collection(csv_filename):
+        """Return the name of the collection of csv_filename, e.g., LANDSAT_8"""
+        return os.path.splitext(os.path.basename(csv_filename))[0]
+
+    def is_current(self, csv_filename):
+        """Return True if csv_filename was imported and has not changed since"""
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime FROM sources WHERE collection = ?',
+                                    (self.get_collection(csv_filename),)).fetchone()
+        return row is not None and row[0] == os.path.getsize(csv_filename) and \
+            row[1] == os.path.getmtime(csv_filename)
+
+    def import_csv(self, csv_filename):
+        """Replace the scenes of the collection of csv_filename by the scenes found in csv_filename
+
+        The csv file is read in a streaming pass and imported in a single transaction.
+
+        :return: number of scenes imported
+        """
+        collection = self.get_collection(csv_filename)
+
+        def rows(f):
+            for r in csv.DictReader(f):
+                yield (r.get('sceneID'), collection, _to_int(r.get('path')), _to_int(r.get('row')),
+                       (r.get('acquisitionDate') or '')[:10], _to_float(r.get('cloudCoverFull')), r.get('DATA_TYPE_L1'))
+
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM scenes WHERE collection = ?', (collection,))
+                with open(csv_filename, 'rb') as f:
+                    self.conn.executemany('INSERT INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?)', rows(f))
+                self.conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                                  (collection, os.path.getsize(csv_filename), os.path.getmtime(csv_filename)))
+                return self.conn.execute('SELECT COUNT(*) FROM scenes WHERE collection = ?',
+                                         (collection,)).fetchone()[0]
+
+    def refresh(self, csv_filenames, verbose=True):
+        """Import the csv files not imported yet or changed since imported (see is_current)
+
+        :param csv_filenames: list of bulk metadata csv files. Files not found are ignored
+        :return: list of the csv files imported
+        """
+        imported = []
+        for csv_filename in csv_filenames:
+            if not os.path.isfile(csv_filename) or self.is_current(csv_filename):
+                continue
+            if verbose:
+                print 'Importing {} into the catalog...'.format(os.path.basename(csv_filename)),
+            n = self.import_csv(csv_filename)
+            if verbose:
+                print '{} scenes'.format(n)
+            imported.append(csv_filename)
+        return imported
+
+    def find(self, path, row, date_start=None, date_end=None, cc_limit=None, collection=None, exclude_pr=True):
+        """Return the scenes of path/row acquired after date_start and before date_end (both excluded)
+
+        :param path: WRS-2 path
+        :param row: WRS-2 row
+        :param date_start: datetime or None
+        :param date_end: datetime or None
+        :param cc_limit: maximum cloud cover (cloudCoverFull) or None
+        :param collection: collection name (see get_collection) or None for all imported collections
+        :param exclude_pr: if True, scenes of data type 'PR' are excluded
+        :return: list of tuples (sceneID, acquisitionDate, cloudCoverFull) ordered by cloud cover and, for the same
+            cloud cover, by their order in the csv file
+        """
+        sql = 'SELECT sceneID, acquisitionDate, cloudCoverFull FROM scenes WHERE path = ? AND row = ?'
+        args = [int(path), int(row)]
+        if date_start is not None:
+            sql += ' AND acquisitionDate > ?'
+            args.append(date_start.strftime('%Y-%m-%d'))
+        if date_end is not None:
+            sql += ' AND acquisitionDate < ?'
+            args.append(date_end.strftime('%Y-%m-%d'))
+        if cc_limit is not None:
+            sql += ' AND cloudCoverFull <= ?'
+            args.append(float(cc_limit))
+        if collection is not None:
+            sql += ' AND collection = ?'
+            args.append(collection)
+        if exclude_pr:
+            sql += " AND data_type != 'PR'"
+        with self.lock:
+            return self.conn.execute(sql + ' ORDER BY cloudCoverFull, rowid', args).fetchall()
+
+    def find_min_cloud_cover(self, path, row, date_start=None, date_end=None, cc_limit=None, collection=None):
+        """Return the sceneID with the lowest cloud cover (see find) or '' if no scene was found. For the same cloud
+        cover, the last scene in the csv file is returned (as find_in_collection_metadata does)
+        """
+        scenes = self.find(path, row, date_start, date_end, cc_limit, collection)
+        if not scenes:
+            return ''
+        return [s for s in scenes if s[2] == scenes[0][2]][-1][0]
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import urllib2
+import threading
+from warsa.utils.http_pool import is_transient_http_error
+from warsa.utils.partfile import part_filename, replace_file
+from warsa.utils.retry import RetryPolicy
+
+SEGMENTS_SUFFIX = '.segments'
+
+
+def segments_filename(local_filename):
+    return local_filename + SEGMENTS_SUFFIX
+
+
+def split_segments(size, n):
+    """Return n contiguous segments [begin, end, received] covering size bytes, end is exclusive"""
+    n = max(1, min(int(n), size))
+    bounds = [size * i // n for i in range(n + 1)]
+    return [[bounds[i], bounds[i + 1], 0] for i in range(n)]
+
+
+class SegmentMap(object):
+    """Progress of a segmented download saved next to the partial file (local_filename + '.segments')
+
+    Each segment is a list [begin, end, received]: bytes begin to begin + received - 1 of the file were written to the
+    partial file. The map is saved after the data has been flushed, so that it never counts bytes not written.
+    """
+
+    def __init__(self, filename, url=None, size=None, segments=None):
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.segments = segments or []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filename):
+        """Return the map saved in filename or None if not found or unreadable"""
+        if not os.path.isfile(filename):
+            return None
+        try:
+            with open(filename) as f:
+                d = json.load(f)
+            return cls(filename, d['url'], d['size'], d['segments'])
+        except (ValueError, KeyError):
+            return None
+
+    def save(self):
+        with self.lock:
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'w') as f:
+                json.dump({'url': self.url, 'size': self.size, 'segments': self.segments}, f)
+            replace_file(tmp_filename, self.filename)
+
+    def remove(self):
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def add(self, i, n):
+        with self.lock:
+            self.segments[i][2] += n
+
+    def received(self):
+        return sum([s[2] for s in self.segments])
+
+    def is_complete(self):
+        return all([s[0] + s[2] == s[1] for s in self.segments])
+
+
+def open_range(url, begin, end=None, timeout=600):
+    """Open url requesting bytes begin to end - 1 (to the end of the file if end is None)
+
+    The request goes through the installed urllib2 opener, i.e., it carries the cookies of a previous login.
+
+    :return: tuple (response, total size or None, True if the server honored the range)
+    """
+    request = urllib2.Request(url)
+    request.add_header('Range', 'bytes={}-{}'.format(begin, end - 1 if end is not None else ''))
+    response = urllib2.urlopen(request, timeout=timeout)
+    content_range = response.info().getheader('Content-Range')
+    if response.getcode() == 206 and content_range:
+        total = content_range.split('/')[-1].strip()
+        return response, int(total) if total.isdigit() else None, True
+    length = response.info().getheader('Content-Length')
+    return response, int(length) if length else None, False
+
+
+def _download_segment(url, local_part_filename, segment_map, i, blocksize, timeout, progress):
+    begin, end, received = segment_map.segments[i]
+    if begin + received >= end:
+        return
+    response, _, ranged = open_range(url, begin + received, end, timeout)
+    if not ranged:
+        response.close()
+        raise IOError('{}: the server ignored the range request'.format(url))
+    try:
+        with open(local_part_filename, 'r+b') as f:
+            f.seek(begin + received)
+            while begin + received < end:
+                block = response.read(min(blocksize, end - begin - received))
+                if not block:
+                    raise IOError('{}: segment {} incomplete ({} of {} bytes)'.format(url, i, received, end - begin))
+                f.write(block)
+                f.flush()
+                received += len(block)
+                segment_map.add(i, len(block))
+                segment_map.save()
+                progress()
+    finally:
+        response.close()
+
+
+def _download_whole(url, local_part_filename, segment_map, blocksize, timeout, progress):
+    segment_map.segments[0][2] = 0  # no range support: restart from the beginning
+    response = urllib2.urlopen(url, timeout=timeout)
+    try:
+        with open(local_part_filename, 'r+b') as f:
+            while True:
+                block = response.read(blocksize)
+                if not block:
+                    break
+                f.write(block)
+                segment_map.add(0, len(block))
+                progress()
+    finally:
+        response.close()
+    if segment_map.received() != segment_map.size:
+        raise IOError('{}: incomplete download ({} of {} bytes)'.format(url, segment_map.received(),
+                                                                         segment_map.size))
+
+
+def download_segmented(url, local_filename, segments=4, blocksize=1 << 23, timeout=600, retry_policy=None,
+                       verbose=True):
+    """Download url to local_filename with segments parallel range requests
+
+    The size of the file is requested first. A partial file local_filename + '.part' of that size is preallocated
+    (sparse where supported) and each worker writes its segment at its offset. The progress of each segment is saved
+    in local_filename + '.segments', so that an interrupted download is resumed at the next call, each segment where
+    it stopped, provided that the saved map is of the same url and size. After transient errors (network, 5xx) a
+    segment is retried following retry_policy; the redirections of url are followed again before each retry, since a
+    redirect target (e.g., a signed url) may expire during a long download. The partial file is renamed to
+    local_filename only after all segments are complete and the total length was verified.
+
+    If the server does not support range requests, the file is downloaded with a single request.
+
+    :param url: url of the file, redirections are followed
+    :param local_filename: full path of the local file
+    :param segments: number of parallel segments
+    :param blocksize: size of the blocks read and written; the segment map is saved after each block
+    :param timeout: socket timeout in seconds
+    :param retry_policy: utils.retry.RetryPolicy, default RetryPolicy()
+    :param verbose: if True, outputs the progress
+    :return: size of the file
+    :raise IOError: if the download failed. The partial file and the segment map are kept
+    """
+    retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+    local_part_filename = part_filename(local_filename)
+    response, size, ranged = open_range(url, 0, 1, timeout)
+    segment_url = response.geturl()  # after redirections
+    response.close()
+    if size is None:
+        raise IOError('{}: size unknown'.format(url))
+    segment_map = SegmentMap.load(segments_filename(local_filename))
+    if segment_map is None or segment_map.url != url or segment_map.size != size or \
+            not os.path.isfile(local_part_filename) or os.path.getsize(local_part_filename) != size:
+        segment_map = SegmentMap(segments_filename(local_filename), url, size,
+                                 split_segments(size, segments if ranged else 1))
+        with open(local_part_filename, 'wb') as f:
+            f.truncate(size)  # sparse file on most file systems
+        segment_map.save()
+    if not ranged:
+        segment_map.segments = [[0, size, 0]]
+
+    time0 = time.time()
+    received0 = segment_map.received()  # resumed
+    lock = threading.Lock()
+    errors = []
+
+    def progress():
+        if verbose:
+            with lock:
+                received = segment_map.received()
+                done = int(50 * received / size)
+                mb_s = (received - received0) / 1048576.0 / max(time.time() - time0, 1e-6)
+                sys.stdout.write('\r[{}{}]{:4.0f}% {:.1f} MB/s'.format('=' * done, ' ' * (50 - done),
+                                                                     100.0 * received / size, mb_s))
+                sys.stdout.flush()
+
+    def worker(i):
+        delays = retry_policy.delays()
+        source_url = segment_url
+        while True:
+            try:
+                if ranged:
+                    _download_segment(source_url, local_part_filename, segment_map, i, blocksize, timeout, progress)
+                else:
+                    _download_whole(source_url, local_part_filename, segment_map, blocksize, timeout, progress)
+                return
+            except Exception, e:
+                delay = next(delays, None) if is_transient_http_error(e) else None
+                if delay is None:
+                    with lock:
+                        errors.append(e)
+                    return
+                time.sleep(delay)
+                source_url = url  # the redirections are followed again by open_range
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(segment_map.segments))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    if verbose:
+        print
+    if errors:
+        raise IOError('{}: {} (partial file kept, resumed at the next call)'.format(url, errors[0]))
+    received = os.path.getsize(local_part_filename)
+    if not segment_map.is_complete() or received != size:
+        raise IOError('{}: incomplete download ({} of {} bytes)'.format(url, segment_map.received(), size))
+    replace_file(local_part_filename, local_filename)
+    segment_map.remove()
+    return size
+
@@ -0,0 +1,92 @@
+import os
+import tarfile
+from warsa.utils.partfile import part_filename, replace_file
+
+
+def is_mtl_member(name):
+    return name.endswith('_MTL.txt')
+
+
+def is_band_member(name, bands):
+    """Return True if name is the file of one of the bands, e.g., LC81980302015123LGN00_B4.TIF for band 'B4'"""
+    base = os.path.splitext(os.path.basename(name))[0]
+    return any([base.endswith('_' + b) for b in bands])
+
+
+def parse_cloud_cover(mtl):
+    """Return the value of CLOUD_COVER in the content of a _MTL.txt file or None if not found"""
+    for line in mtl.splitlines():
+        tokens = line.split('=')
+        if len(tokens) == 2 and tokens[0].strip() == 'CLOUD_COVER':
+            return float(tokens[1].strip().strip('"'))
+    return None
+
+
+def _write_member(tar, member, output_dir, blocksize=1 << 20):
+    filename = os.path.join(output_dir, os.path.basename(member.name))  # never outside output_dir
+    src = tar.extractfile(member)
+    with open(part_filename(filename), 'wb') as dst:
+        for block in iter(lambda: src.read(blocksize), b''):
+            dst.write(block)
+    replace_file(part_filename(filename), filename)
+    return filename
+
+
+def extract_landsat_tgz(tgz_filename, output_dir, bands=None, cloud_limit=None):
+    """Extract a Landsat scene archive (tgz) in a streaming pass, without external tools
+
+    The archive is read sequentially until the _MTL.txt member is found. If its CLOUD_COVER exceeds cloud_limit,
+    nothing is written. Otherwise the _MTL.txt file and the members of the requested bands are written directly to
+    output_dir. Members preceding the _MTL.txt member are only decompressed, not written; if some of them are
+    requested, the archive is read a second time, stopping after the last requested member.
+
+    :param tgz_filename: full path of the archive
+    :param output_dir: directory where the files are written, created if needed
+    :param bands: list of band names, e.g., ['B4', 'B5', 'BQA'], or None for all members
+    :param cloud_limit: maximum cloud cover or None
+    :return: tuple (cloud cover or None, list of the files written). The list is empty if the cloud cover exceeds
+        cloud_limit
+    """
+    def is_requested(m):
+        return m.isfile() and (is_mtl_member(m.name) or bands is None or is_band_member(m.name, bands))
+
+    written = []
+    skipped = []
+    cloud_cover = None
+    tar = tarfile.open(tgz_filename, 'r|gz')
+    try:
+        members = iter(tar)
+        for member in members:
+            if is_mtl_member(member.name):
+                mtl = tar.extractfile(member).read()
+                cloud_cover = parse_cloud_cover(mtl)
+                if cloud_limit is not None and cloud_cover is not None and cloud_cover > cloud_limit:
+                    return cloud_cover, []
+                if not os.path.isdir(output_dir):
+                    os.makedirs(output_dir)
+                filename = os.path.join(output_dir, os.path.basename(member.name))
+                with open(filename, 'wb') as f:
+                    f.write(mtl)
+                written.append(filename)
+                break
+            if is_requested(member):
+                skipped.append(member.name)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        for member in members:  # members after _MTL.txt
+            if is_requested(member):
+                written.append(_write_member(tar, member, output_dir))
+    finally:
+        tar.close()
+    if skipped:
+        tar = tarfile.open(tgz_filename, 'r|gz')
+        try:
+            for member in tar:
+                if member.name in skipped:
+                    written.append(_write_member(tar, member, output_dir))
+                    skipped.remove(member.name)
+                    if not skipped:
+                        break
+        finally:
+            tar.close()
+    return cloud_cover, written
@@ -9,6 +9,8 @@ class ARC2AfricaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
     Format:
         daily_clim.bin.19830101.gz
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(ARC2AfricaBinFTP, self).__init__(local_dir, 'daily_clim.bin.', '.gz', None,
                                                'ftp.cpc.ncep.noaa.gov', '/fews/fewsdata/africa/arc2/bin/')
@@ -17,6 +19,10 @@ class ARC2AfricaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(filename.split('.')[-2], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('daily_clim.bin.%Y%m%d.gz')]
+
 
 class ARC2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Source:
@@ -24,6 +30,8 @@ class ARC2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
     Format:
         africa_arc.19830101.tif.zip
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(ARC2AfricaTifFTP, self).__init__(local_dir, 'africa_arc.', '.tif.zip', None,
                                                'ftp.cpc.ncep.noaa.gov', '/fews/fewsdata/africa/arc2/geotiff/')
@@ -32,4 +40,8 @@ class ARC2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(filename.split('.')[-3], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('africa_arc.%Y%m%d.tif.zip')]
+
 
@@ -1,13 +1,14 @@
-import gzip
 import os
 import numpy as np
-from osgeo import gdal, osr
 from warsa.precipitation.satellite.rasterize import Rasterizer
-from girs.rast.parameter import RasterParameters
+from warsa.precipitation.satellite.grid import ArrayRaster, get_grid
+from warsa.precipitation.satellite.subset import get_native_rows, read_native_subset
 
 
 class ARC2RFE2BinRasterize(Rasterizer):
 
+    transcodable = True
+
     def __init__(self, product_dir, nx, ny, x0, y0, output_raster_dir, **kwargs):
         super(ARC2RFE2BinRasterize, self).__init__(product_dir, output_raster_dir, '.gz', **kwargs)
         self.nx = nx
@@ -41,20 +42,25 @@ class ARC2RFE2BinRasterize(Rasterizer):
         """
 
         x_res = y_res = 0.1
-        with gzip.GzipFile(product_filename, 'rb') as gf:
-            s_data = gf.read()
-            assert len(s_data) == self.nx * self.ny * 4
-        arr = np.fromstring(s_data, dtype='>f4').astype('<f4')
-        arr = np.flipud(arr.reshape((self.ny, self.nx)))
-        nodata = -999.0
-        arr[arr < 0] = nodata
-        geo_trans = [-20.05, x_res, 0, 40.05, 0, -y_res]
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4035)  # Authalic WGS84 like in the arc2 tif version
-        raster_parameters = RasterParameters(self.nx, self.ny, geo_trans, srs.ExportToWkt(), 1, [nodata],
-                                             gdal.GDT_Float32, driver_short_name='MEM')
+        nx, ny = self.nx, self.ny
+        # Authalic WGS84 like in the arc2 tif version
+        grid = get_grid(nx, ny, [self.x0, x_res, 0, self.y0, 0, -y_res], 4035, -999.0)
+        window = self.get_window(grid.geo_trans, nx, ny)
+        if window:
+            s_data = self.read_compressed_file(product_filename, get_native_rows(window, ny, south_up=True)[1] * nx * 4)
+            arr = read_native_subset(np.frombuffer(s_data, dtype='>f4'), nx, ny, window, south_up=True).astype('<f4')
+            grid = grid.subset(window)
+        else:
+            s_data = self.read_compressed_file(product_filename)
+            assert len(s_data) == nx * ny * 4
+            arr = np.frombuffer(s_data, dtype='>f4').astype('<f4')
+            arr = np.flipud(arr.reshape((ny, nx)))
+        arr[arr < 0] = grid.nodata
+        return [(self.get_raster_file_names(product_filename)[0], ArrayRaster(grid, arr))]
+
+    def get_raster_file_names(self, product_filename):
         raster_filename = os.path.join(self.output_raster_dir, os.path.splitext(os.path.basename(product_filename))[0])
-        return [(raster_filename + '.tif', self.create_dataset(raster_parameters, arr, 'mem'))]
+        return [raster_filename + '.tif']
 
 
 class ARC2AfricaBinRasterize(ARC2RFE2BinRasterize):
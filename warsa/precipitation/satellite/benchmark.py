@@ -0,0 +1,447 @@
+"""Throughput benchmark of the ftp download layer against a local ftp server (requires pyftpdlib), smoke checks of the
+ftp and http download layers against local servers and benchmark of the GeoTIFF output profiles
+
+Usage:
+    python -m warsa.precipitation.satellite.benchmark [number of files ...]
+    python -m warsa.precipitation.satellite.benchmark planning [years]
+    python -m warsa.precipitation.satellite.benchmark crawl [years]
+    python -m warsa.precipitation.satellite.benchmark geotiff [nx ny rasters]
+    python -m warsa.precipitation.satellite.benchmark smoke
+    python -m warsa.precipitation.satellite.benchmark http [number of files]
+"""
+import os
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+from contextlib import contextmanager
+from warsa.precipitation.satellite.ftp_pool import FTPCommandCounter
+from warsa.precipitation.satellite.server import FTPServer
+from warsa.precipitation.satellite import ftp_fixture
+from warsa.utils.http_fixture import LocalHTTPServer
+from warsa.utils.http_pool import HTTPDownloadPool, HTTPSession, HTTPStatusError, retrieve_http_file
+from warsa.utils.partfile import part_filename
+from warsa.utils.retry import RetryPolicy
+
+
+BEGIN = datetime.datetime(2010, 1, 1)
+
+
+@contextmanager
+def _quiet(quiet=True):
+    """Suppress the per-file output of the downloaders"""
+    if not quiet:
+        yield
+        return
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def _result(layout, n_files, method, connections, mode, seconds, commands, poll_seconds, poll_commands):
+    return {'layout': layout, 'files': n_files, 'method': method, 'connections': connections, 'mode': mode,
+            'seconds': seconds, 'files_per_second': n_files / seconds if seconds > 0 else 0.0,
+            'commands': commands, 'commands_per_file': float(commands) / n_files if n_files else 0.0,
+            'poll_seconds': poll_seconds, 'poll_commands': poll_commands}
+
+
+def benchmark_download(layout, n_files, work_dir, ftp_connections=1, ftp_listing_cache=True, ftp_predict=False,
+                       file_size=1024, quiet=True):
+    """Measure SatelliteBasedPrecipitationDownloadFTP.download on a synthetic archive
+
+    The archive is downloaded into an empty directory. Afterwards an update without new files on the server (poll) is
+    measured.
+
+    :param layout: key of ftp_fixture.LAYOUTS
+    :param n_files: number of files in the archive
+    :param work_dir: directory where the archive and the downloaded files are saved (removed afterwards)
+    :param ftp_connections: see SatelliteBasedPrecipitationDownloadFTP.set_ftp_connections
+    :param ftp_listing_cache: see SatelliteBasedPrecipitationDownloadFTP.set_ftp_listing_cache
+    :param ftp_predict: see SatelliteBasedPrecipitationDownloadFTP.set_ftp_predict
+    :param file_size: size of each file in bytes
+    :param quiet: if True, the output of the download is suppressed
+    :return: dictionary with the results
+    """
+    server_root = os.path.join(work_dir, 'server')
+    local_dir = os.path.join(work_dir, 'local')
+    ftp_filenames = ftp_fixture.create_synthetic_tree(layout, server_root, n_files, file_size, BEGIN)
+    try:
+        with ftp_fixture.LocalFTPServer(server_root) as server:
+            download_obj = ftp_fixture.create_download_object(layout, local_dir)
+            end = download_obj.get_datetime_from_file_name(ftp_filenames[-1])
+            download_obj.set_ftp_host(server.host, server.port)
+            download_obj.set_ftp_connections(ftp_connections)
+            download_obj.set_ftp_listing_cache(ftp_listing_cache)
+            download_obj.set_ftp_predict(ftp_predict)
+            begin = BEGIN if ftp_predict else None
+            with _quiet(quiet):
+                time0 = time.time()
+                download_obj.download(verbose=False, begin=begin, end=end)
+                seconds = time.time() - time0
+            commands = download_obj.ftp_commands.value
+            assert len(download_obj.get_local_files()) == n_files
+            with _quiet(quiet):
+                time0 = time.time()
+                download_obj.download(update=True, verbose=False, end=end)
+                poll_seconds = time.time() - time0
+            poll_commands = download_obj.ftp_commands.value
+            download_obj.get_catalog().close()
+    finally:
+        shutil.rmtree(server_root, ignore_errors=True)
+        shutil.rmtree(local_dir, ignore_errors=True)
+    mode = ('predict' if ftp_predict else 'list') + ('+cache' if ftp_listing_cache else '')
+    return _result(layout, n_files, 'download', ftp_connections, mode, seconds, commands, poll_seconds,
+                   poll_commands)
+
+
+def benchmark_server_download(layout, n_files, work_dir, file_size=1024, quiet=True):
+    """Measure FTPServer.download on a synthetic archive (see benchmark_download)"""
+    server_root = os.path.join(work_dir, 'server')
+    local_dir = os.path.join(work_dir, 'local')
+    ftp_fixture.create_synthetic_tree(layout, server_root, n_files, file_size, BEGIN)
+    try:
+        with ftp_fixture.LocalFTPServer(server_root) as server:
+            download_obj = ftp_fixture.create_download_object(layout, local_dir)
+            counter = FTPCommandCounter()
+            ftp_server = FTPServer(download_obj, server.host, download_obj.ftp_dir, port=server.port, counter=counter)
+            with _quiet(quiet):
+                time0 = time.time()
+                ftp_server.download(update=False)
+                seconds = time.time() - time0
+            commands = counter.value
+            download_obj.rebuild_catalog()  # FTPServer does not update the catalog
+            assert len(download_obj.get_local_files()) == n_files
+            counter.reset()
+            with _quiet(quiet):
+                time0 = time.time()
+                ftp_server.download(update=True)
+                poll_seconds = time.time() - time0
+            poll_commands = counter.value
+            download_obj.get_catalog().close()
+    finally:
+        shutil.rmtree(server_root, ignore_errors=True)
+        shutil.rmtree(local_dir, ignore_errors=True)
+    return _result(layout, n_files, 'server', 1, 'list', seconds, commands, poll_seconds, poll_commands)
+
+
+def run_benchmarks(sizes=(10, 100, 1000), layouts=None, connections=(1, 4), work_dir=None, file_size=1024):
+    """Run the benchmarks for all layouts, archive sizes and numbers of connections and print the results
+
+    :return: list of dictionaries (see benchmark_download)
+    """
+    layouts = layouts or sorted(ftp_fixture.LAYOUTS.keys())
+    remove_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp()
+    results = []
+    try:
+        for layout in layouts:
+            for n_files in sizes:
+                results.append(benchmark_server_download(layout, n_files, work_dir, file_size))
+                print_result(results[-1])
+                for n in connections:
+                    results.append(benchmark_download(layout, n_files, work_dir, n, False, False, file_size))
+                    print_result(results[-1])
+                    results.append(benchmark_download(layout, n_files, work_dir, n, True, False, file_size))
+                    print_result(results[-1])
+                    results.append(benchmark_download(layout, n_files, work_dir, n, True, True, file_size))
+                    print_result(results[-1])
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_missing_datetime(years=10, n_local=1000, work_dir=None):
+    """Measure the planning of a download (GPMImerg3BHHRearlyFTP.get_missing_datetime) over a window of years
+
+    :param years: length of the window in years, beginning 2014-03-12
+    :param n_local: number of (empty) half-hourly files found locally at the beginning of the window
+    :param work_dir: directory where the local files are saved (removed afterwards)
+    :return: dictionary with the results
+    """
+    from warsa.precipitation.satellite.gpm.download_gpm_imerg_3BHHR_early import GPMImerg3BHHRearlyFTP
+    begin = datetime.datetime(2014, 3, 12)
+    end = begin.replace(year=begin.year + years)
+    remove_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp()
+    local_dir = os.path.join(work_dir, 'local')
+    try:
+        download_obj = GPMImerg3BHHRearlyFTP(local_dir, None, None)
+        for i in range(n_local):
+            dt = begin + datetime.timedelta(minutes=30 * i)
+            filename = os.path.join(local_dir, dt.strftime('%Y%m'), dt.strftime(
+                '3B-HHR-E.MS.MRG.3IMERG.%Y%m%d-S%H%M%S-E000000.0000.V05B.RT-H5'))
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'wb').close()
+        with _quiet():
+            time0 = time.time()
+            missing = download_obj.get_missing_datetime(begin, end)
+            seconds = time.time() - time0
+    finally:
+        shutil.rmtree(local_dir, ignore_errors=True)
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {'years': years, 'local': n_local, 'missing': sum([len(v) for v in missing.values()]),
+            'seconds': seconds}
+
+
+def benchmark_crawl(years=2, connections=4, work_dir=None):
+    """Count the FTP commands of ftp_crawl.FTPTreeCrawler on a synthetic CFSv2 tree Y/YM/YMD/YMDH (4 runs per month)
+
+    The tree is crawled as cfsv2_ftp.cfsv2_ftp_files does, with the listing cache: without cache (cold), again with
+    the cache (warm), without cache while the last year is still open, after it closed and again with the cache.
+
+    :param years: number of years of the tree, beginning 2010
+    :param connections: see FTPTreeCrawler
+    :param work_dir: directory where the tree and the cache are saved (removed afterwards)
+    :return: list of dictionaries with the results, one per crawl
+    """
+    from warsa.precipitation.satellite.ftp_cache import FTPListingCache
+    from warsa.precipitation.satellite.ftp_crawl import FTPTreeCrawler
+    from warsa.precipitation.seasonal_forecast.cfsr.cfsv2_ftp import is_closed_dir
+    remove_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp()
+    server_root = os.path.join(work_dir, 'server')
+    n_files = 0
+    for year in range(2010, 2010 + years):
+        for month in range(1, 13):
+            for run in ['{}{:02d}{}'.format(year, month, dh) for dh in ('0100', '0106', '0200', '0206')]:
+                d = os.path.join(server_root, 'cfs', run[:4], run[:6], run[:8], run)
+                os.makedirs(d)
+                open(os.path.join(d, 'flxf.01.{}.{}.avrg.grib.grb2'.format(run, run[:6])), 'wb').close()
+                n_files += run.endswith('0100')
+    valid_dirs = [lambda n: len(n) == 4, lambda n: len(n) == 6, lambda n: len(n) == 8 and n.endswith('01'),
+                  lambda n: len(n) == 10 and n.endswith('00')]
+    closed_now = datetime.datetime(2010 + years + 1, 1, 1)
+    open_now = datetime.datetime(2010 + years - 1, 6, 15)
+    listing_cache = FTPListingCache(os.path.join(work_dir, 'ftp_listing.json'))
+    results = []
+    try:
+        with ftp_fixture.LocalFTPServer(server_root) as server:
+            for name, now in [('cold', closed_now), ('warm', closed_now), ('cold, open', open_now),
+                              ('closed', closed_now), ('warm', closed_now)]:
+                if name.startswith('cold'):
+                    listing_cache.clear()
+                counter = FTPCommandCounter()
+                crawler = FTPTreeCrawler(server.host, connections=connections, listing_cache=listing_cache,
+                                         counter=counter, port=server.port)
+                time0 = time.time()
+                files = crawler.crawl('/cfs', valid_dirs, lambda ftp_dir, f: f.endswith('.grb2'),
+                                      lambda ftp_dir: is_closed_dir(ftp_dir, now=now))
+                seconds = time.time() - time0
+                assert len(files) == n_files
+                results.append({'years': years, 'crawl': name, 'files': len(files), 'commands': counter.value,
+                                'seconds': seconds})
+                print_crawl_result(results[-1])
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def http_smoke_check(n_files=8, workers=4, file_size=100000, work_dir=None):
+    """Download files from a LocalHTTPServer with HTTPDownloadPool and retrieve_http_file
+
+    Checks the parallel download over keep-alive connections, the resume of a partial file (Range request), the
+    answer 416 to a Range request on a complete partial file (kept) and on a stale, too long partial file (discarded
+    and downloaded again) and a missing file (404).
+
+    :param n_files: number of files downloaded in parallel
+    :param workers: number of workers of the pool
+    :param file_size: size of each file in bytes
+    :param work_dir: directory where the served and the downloaded files are saved (removed afterwards)
+    :return: dictionary with the results
+    :raise AssertionError: if a check fails
+    """
+    remove_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp()
+    server_root = os.path.join(work_dir, 'server')
+    local_dir = os.path.join(work_dir, 'local')
+    os.makedirs(server_root)
+    os.makedirs(local_dir)
+    data = dict()
+    for i in range(n_files):
+        name = 'tile_{:03d}.zip'.format(i)
+        data[name] = os.urandom(file_size)
+        with open(os.path.join(server_root, name), 'wb') as f:
+            f.write(data[name])
+    names = sorted(data.keys())
+
+    def content(filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def write_part(local_filename, part):
+        with open(part_filename(local_filename), 'wb') as f:
+            f.write(part)
+
+    try:
+        with LocalHTTPServer(server_root) as server:
+            # parallel download, workers keep their connections alive
+            pool = HTTPDownloadPool(workers, retry_policy=RetryPolicy(0), verbose=False)
+            time0 = time.time()
+            results = pool.map([(server.url + name, os.path.join(local_dir, name)) for name in names])
+            seconds = time.time() - time0
+            assert all([r[2] for r in results]), results
+            assert all([content(os.path.join(local_dir, name)) == data[name] for name in names])
+            assert server.connections <= min(workers, n_files), server.connections
+            connections = server.connections
+            session = HTTPSession()
+            try:
+                # resume: only the missing bytes are received
+                local_filename = os.path.join(local_dir, 'resumed.zip')
+                write_part(local_filename, data[names[0]][:file_size // 3])
+                received = retrieve_http_file(session, server.url + names[0], local_filename)
+                assert received == file_size - file_size // 3, received
+                assert content(local_filename) == data[names[0]]
+                # 416 on a complete partial file: kept without transfer
+                local_filename = os.path.join(local_dir, 'complete.zip')
+                write_part(local_filename, data[names[0]])
+                assert retrieve_http_file(session, server.url + names[0], local_filename) == 0
+                assert content(local_filename) == data[names[0]]
+                # 416 on a partial file longer than the remote file: downloaded again
+                local_filename = os.path.join(local_dir, 'stale.zip')
+                write_part(local_filename, os.urandom(file_size + 10))
+                assert retrieve_http_file(session, server.url + names[0], local_filename) == file_size
+                assert content(local_filename) == data[names[0]]
+                # missing file
+                local_filename = os.path.join(local_dir, 'missing.zip')
+                try:
+                    retrieve_http_file(session, server.url + 'missing.zip', local_filename)
+                    raise AssertionError('missing.zip: no error')
+                except HTTPStatusError, e:
+                    assert e.status == 404, e
+                assert not os.path.exists(local_filename) and not os.path.exists(part_filename(local_filename))
+            finally:
+                session.close()
+            results = pool.map([(server.url + 'missing.zip', local_filename)])
+            assert results[0][2] is False, results
+    finally:
+        shutil.rmtree(work_dir if remove_work_dir else server_root, ignore_errors=True)
+        if not remove_work_dir:
+            shutil.rmtree(local_dir, ignore_errors=True)
+    return {'files': n_files, 'workers': workers, 'connections': connections, 'seconds': seconds,
+            'files_per_second': n_files / seconds if seconds > 0 else 0.0}
+
+
+def _synthetic_precipitation(nx, ny, seed, nodata=-999.0):
+    """Return a float32 field of nx * ny cells mostly dry, with a few smooth rain cells and a nodata band (north)"""
+    import numpy as np
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:ny, 0:nx].astype(np.float32)
+    arr = np.zeros((ny, nx), dtype=np.float32)
+    for _ in range(8):
+        cx, cy, r, p = rng.uniform(0, nx), rng.uniform(0, ny), rng.uniform(5, nx / 40.0), rng.uniform(1, 30)
+        arr += p * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * r * r))
+    arr[arr < 0.1] = 0.0  # dry
+    arr = np.round(arr, 2)
+    arr[:ny // 10, :] = nodata
+    return arr
+
+
+def benchmark_geotiff_profiles(nx=1440, ny=480, n_rasters=48, n_points=20, work_dir=None):
+    """Compare size and read latency of GeoTIFFs written as girs does (striped, uncompressed) and with the tiled
+    profiles of geotiff.write_geotiff
+
+    For each profile, n_rasters synthetic precipitation rasters (0.25 degree global grid by default) are written. The
+    time series of n_points random stations are extracted with time_series.read_raster_points and the rasters are
+    read completely.
+
+    :return: list of dictionaries with the results, one per profile
+    """
+    import numpy as np
+    from osgeo import gdal, osr
+    from warsa.precipitation.satellite.geotiff import TILED, is_compression_supported, write_geotiff
+    from warsa.precipitation.satellite.time_series import read_raster_points
+    profiles = [('striped', None), ('deflate', {'compress': 'DEFLATE'}), ('deflate+ovr', TILED)]
+    if is_compression_supported('ZSTD'):
+        profiles.append(('zstd', {'compress': 'ZSTD'}))
+    geo_trans = [-180.0, 360.0 / nx, 0, 60.0, 0, -120.0 / ny]
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    rng = np.random.RandomState(0)
+    points = [(rng.uniform(-180, 180), rng.uniform(-60, 48)) for _ in range(n_points)]
+    remove_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp()
+    results = []
+    try:
+        for name, profile in profiles:
+            d = os.path.join(work_dir, name)
+            os.makedirs(d)
+            filenames = [os.path.join(d, 'r{:04d}.tif'.format(i)) for i in range(n_rasters)]
+            seconds = 0.0
+            for i, filename in enumerate(filenames):
+                mem = gdal.GetDriverByName('MEM').Create('', nx, ny, 1, gdal.GDT_Float32)
+                mem.SetGeoTransform(geo_trans)
+                mem.SetProjection(srs.ExportToWkt())
+                mem.GetRasterBand(1).SetNoDataValue(-999.0)
+                mem.GetRasterBand(1).WriteArray(_synthetic_precipitation(nx, ny, i))
+                time0 = time.time()
+                if profile is None:
+                    gdal.GetDriverByName('GTiff').CreateCopy(filename, mem).FlushCache()
+                else:
+                    write_geotiff(mem, filename, **profile)
+                seconds += time.time() - time0
+            size = sum([os.path.getsize(f) for f in filenames])
+            time0 = time.time()
+            for filename in filenames:
+                read_raster_points(filename, points)
+            point_seconds = time.time() - time0
+            time0 = time.time()
+            for filename in filenames:
+                gdal.Open(filename).GetRasterBand(1).ReadAsArray()
+            full_seconds = time.time() - time0
+            results.append({'profile': name, 'rasters': n_rasters, 'points': n_points, 'mb': size / 1048576.0,
+                            'write_ms': 1000 * seconds / n_rasters, 'point_ms': 1000 * point_seconds / n_rasters,
+                            'full_ms': 1000 * full_seconds / n_rasters})
+            print_geotiff_result(results[-1])
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def print_geotiff_result(r):
+    print '{profile:12s} {rasters:5d} rasters {mb:9.2f} MB | write {write_ms:7.2f} ms | {points:4d} points ' \
+          '{point_ms:7.2f} ms | full read {full_ms:7.2f} ms (per raster)'.format(**r)
+
+
+def print_crawl_result(r):
+    print 'crawl {years:3d} years {crawl:12s} {files:5d} files {commands:6d} cmds {seconds:8.3f} s'.format(**r)
+
+
+def print_http_result(r):
+    print 'http {files:5d} files {workers:2d} workers {connections:2d} connections {seconds:8.3f} s ' \
+          '{files_per_second:8.1f} files/s; resume, 416 and 404 OK'.format(**r)
+
+
+def print_planning_result(r):
+    print 'planning {years:3d} years {local:7d} local {missing:8d} missing {seconds:8.3f} s'.format(**r)
+
+
+def print_result(r):
+    print '{layout:8s} {files:6d} {method:8s} {connections:2d} {mode:13s} {seconds:8.2f} s {files_per_second:8.1f} ' \
+          'files/s {commands:7d} cmds {commands_per_file:6.2f} cmds/file | poll {poll_seconds:6.2f} s ' \
+          '{poll_commands:5d} cmds'.format(**r)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['planning']:
+        print_planning_result(benchmark_missing_datetime(*[int(s) for s in sys.argv[2:3]]))
+    elif sys.argv[1:2] == ['crawl']:
+        benchmark_crawl(*[int(s) for s in sys.argv[2:3]])
+    elif sys.argv[1:2] == ['smoke']:
+        for smoke_layout in sorted(ftp_fixture.LAYOUTS.keys()):
+            print '{:8s} {:3d} files listed'.format(smoke_layout, len(ftp_fixture.smoke_check(smoke_layout)))
+    elif sys.argv[1:2] == ['http']:
+        print_http_result(http_smoke_check(*[int(s) for s in sys.argv[2:3]]))
+    elif sys.argv[1:2] == ['geotiff']:
+        benchmark_geotiff_profiles(*[int(s) for s in sys.argv[2:5]])
+    else:
+        run_benchmarks(sizes=[int(s) for s in sys.argv[1:]] or (10, 100, 1000))
@@ -0,0 +1,236 @@
+import os
+import bz2
+import gzip
+import zlib
+import struct
+import hashlib
+import sqlite3
+import threading
+
+
+def file_checksum(filename, blocksize=1 << 20):
+    """Return the md5 hex digest of a file"""
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def verify_file(filename, size=None, blocksize=1 << 20):
+    """Return True if the file is complete and, if compressed (.gz, .bz2), can be decompressed without error
+
+    Compressed files are decompressed in a streaming pass (gzip checks the CRC and the length of each member), only
+    blocksize bytes are kept in memory. Unix compress files (.Z, LZW) cannot be decompressed with the standard library
+    and are checked against size only.
+
+    :param filename: full path of the local file
+    :param size: expected size in bytes, e.g., the size on the server, or None
+    :return: True if valid, False if corrupt, None if not verified (.Z file without size)
+    """
+    if size is not None and os.path.getsize(filename) != size:
+        return False
+    ext = os.path.splitext(filename)[1]
+    try:
+        if '.gz' in ext:
+            gf = gzip.GzipFile(filename, 'rb')
+            try:
+                while gf.read(blocksize):
+                    pass
+            finally:
+                gf.close()
+        elif '.bz2' in ext:
+            decompressor = bz2.BZ2Decompressor()
+            with open(filename, 'rb') as f:
+                try:
+                    for block in iter(lambda: f.read(blocksize), b''):
+                        decompressor.decompress(block)
+                    decompressor.decompress(b'')
+                    return False  # end of stream not reached
+                except EOFError:  # end of stream reached
+                    pass
+        elif '.Z' in ext:
+            return True if size is not None else None
+    except (IOError, EOFError, struct.error, zlib.error), _:
+        return False
+    return True
+
+
+class LocalFileCatalog(object):
+    """Persistent catalog (sqlite) of the files downloaded into a local product directory
+
+    Files are keyed by their path relative to root_dir using '/' as separator. Each file is stored with its size,
+    modification time, md5 checksum and, if given, the product date/time, the size and modification time on the server
+    and the result of the integrity check (verified: 1 valid, 0 corrupt, NULL not verified, see verify_file).
+    Membership tests and insertions are indexed lookups, each insertion is committed in its own transaction.
+
+    The catalog is created from the files found on the local disk the first time it is opened. Files removed or added
+    without using the catalog are only noticed after rebuild().
+    """
+
+    def __init__(self, root_dir, filename, exclude=None):
+        """
+
+        :param root_dir: local product directory
+        :param filename: sqlite file name
+        :param exclude: function(basename) returning True for files not to be cataloged when (re)building
+        """
+        self.root_dir = os.path.normpath(root_dir).replace('\\', '/')
+        self.filename = filename
+        self.exclude = exclude
+        self.lock = threading.Lock()
+        d = os.path.dirname(filename)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                              'checksum TEXT, datetime TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            # columns added to catalogs created by earlier versions
+            columns = [r[1] for r in self.conn.execute('PRAGMA table_info(files)')]
+            for column, column_type in [('remote_size', 'INTEGER'), ('remote_mtime', 'TEXT'), ('verified', 'INTEGER')]:
+                if column not in columns:
+                    self.conn.execute('ALTER TABLE files ADD COLUMN {} {}'.format(column, column_type))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS files_verified ON files (verified)')
+        if not self.get_meta('built'):
+            self.rebuild()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    def relpath(self, filename):
+        filename = filename.replace('\\', '/')
+        if filename.startswith(self.root_dir + '/'):
+            return filename[len(self.root_dir) + 1:]
+        return filename
+
+    def abspath(self, path):
+        return '/'.join([self.root_dir, path])
+
+    def __contains__(self, filename):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM files WHERE path = ?',
+                                     (self.relpath(filename),)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def get(self, filename):
+        """Return (size, mtime, checksum, datetime) of filename or None if not in the catalog"""
+        with self.lock:
+            return self.conn.execute('SELECT size, mtime, checksum, datetime FROM files WHERE path = ?',
+                                     (self.relpath(filename),)).fetchone()
+
+    def add(self, filename, dt=None, checksum=True, remote_size=None, remote_mtime=None, verified=None):
+        """Add (or replace) a file existing on the local disk
+
+        :param filename: full path or path relative to root_dir
+        :param dt: product date/time (datetime) or None
+        :param checksum: if True, the md5 checksum of the file is computed
+        :param remote_size: size of the file on the server or None
+        :param remote_mtime: modification time of the file on the server (as returned by the server) or None
+        :param verified: result of verify_file (True, False) or None if not verified
+        """
+        path = self.relpath(filename)
+        full_path = self.abspath(path)
+        st = os.stat(full_path)
+        md5 = file_checksum(full_path) if checksum else None
+        dt = dt.strftime('%Y-%m-%d %H:%M:%S') if dt else None
+        verified = int(verified) if verified is not None else None
+        with self.lock:
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO files (path, size, mtime, checksum, datetime, remote_size, '
+                                  'remote_mtime, verified) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  (path, st.st_size, st.st_mtime, md5, dt, remote_size, remote_mtime, verified))
+
+    def get_verified(self, filename):
+        """Return True if filename was verified as valid, False if found corrupt, None if not verified or not found"""
+        with self.lock:
+            row = self.conn.execute('SELECT verified FROM files WHERE path = ?', (self.relpath(filename),)).fetchone()
+        return bool(row[0]) if row and row[0] is not None else None
+
+    def set_verified(self, filename, verified):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('UPDATE files SET verified = ? WHERE path = ?',
+                                  (int(verified) if verified is not None else None, self.relpath(filename)))
+
+    def get_corrupt_files(self):
+        """Return the full path of the files found corrupt by verify_file"""
+        with self.lock:
+            rows = self.conn.execute('SELECT path FROM files WHERE verified = 0 ORDER BY path').fetchall()
+        return [self.abspath(r[0]) for r in rows]
+
+    def get_unverified_files(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT path FROM files WHERE verified IS NULL ORDER BY path').fetchall()
+        return [self.abspath(r[0]) for r in rows]
+
+    def verify(self, filename):
+        """Verify filename (see verify_file), store and return the result"""
+        path = self.relpath(filename)
+        with self.lock:
+            row = self.conn.execute('SELECT remote_size FROM files WHERE path = ?', (path,)).fetchone()
+        verified = verify_file(self.abspath(path), row[0] if row else None)
+        if row is not None:
+            self.set_verified(path, verified)
+        return verified
+
+    def remove(self, filename):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM files WHERE path = ?', (self.relpath(filename),))
+
+    def get_files(self):
+        """Return the full path of all cataloged files sorted by name"""
+        with self.lock:
+            rows = self.conn.execute('SELECT path FROM files ORDER BY path').fetchall()
+        return [self.abspath(r[0]) for r in rows]
+
+    def get_last_file(self):
+        """Return the full path of the last cataloged file (sorted by name) or None if the catalog is empty"""
+        with self.lock:
+            row = self.conn.execute('SELECT MAX(path) FROM files').fetchone()
+        return self.abspath(row[0]) if row and row[0] else None
+
+    def rebuild(self):
+        """Replace the catalog content by the files found on the local disk. Checksums are not computed
+
+        Server metadata and verification results are kept for files whose size and modification time did not change.
+        """
+        with self.lock:
+            known = dict([(r[0], r[1:]) for r in self.conn.execute(
+                'SELECT path, size, mtime, checksum, datetime, remote_size, remote_mtime, verified FROM files')])
+        rows = []
+        for root, dirs, files in os.walk(self.root_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in files:
+                if self.exclude and self.exclude(f):
+                    continue
+                full_path = '/'.join([root.replace('\\', '/'), f])
+                path = self.relpath(full_path)
+                st = os.stat(full_path)
+                row = known.get(path)
+                if row and row[0] == st.st_size and row[1] == st.st_mtime:
+                    rows.append((path, st.st_size, st.st_mtime) + tuple(row[2:]))
+                else:
+                    rows.append((path, st.st_size, st.st_mtime, None, None, None, None, None))
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM files')
+                self.conn.executemany('INSERT OR REPLACE INTO files (path, size, mtime, checksum, datetime, '
+                                      'remote_size, remote_mtime, verified) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('built', '1'))
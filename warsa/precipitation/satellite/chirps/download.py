@@ -9,6 +9,8 @@ class Chirps20GlobalDaily05TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     File format:
         chirps-v2.0.1981.01.01.tif.gz
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(Chirps20GlobalDaily05TifFTP, self).__init__(local_dir, 'chirps-v2.0.', '.tif.gz', [4], 'ftp.chg.ucsb.edu',
                                                           '/pub/org/chg/products/CHIRPS-2.0/global_daily/tifs/p05/')
@@ -17,6 +19,10 @@ class Chirps20GlobalDaily05TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(''.join(os.path.basename(filename).split('.')[2:5]), '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('chirps-v2.0.%Y.%m.%d.tif.gz')]
+
 
 class Chirps20GlobalDaily25TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Download data from:
@@ -24,6 +30,8 @@ class Chirps20GlobalDaily25TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     File format:
         chirps-v2.0.1981.01.01.tif.gz
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(Chirps20GlobalDaily25TifFTP, self).__init__(local_dir, 'chirps-v2.0.', '.tif.gz', [4],
                                                           'ftp.chg.ucsb.edu',
@@ -33,6 +41,10 @@ class Chirps20GlobalDaily25TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(''.join(os.path.basename(filename).split('.')[2:5]), '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('chirps-v2.0.%Y.%m.%d.tif.gz')]
+
 
 class Chirps20GlobalMonthly05TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Download data from:
@@ -40,6 +52,8 @@ class Chirps20GlobalMonthly05TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     File format:
         chirps-v2.0.1981.01.tif.gz
     """
+    file_frequency = 'MS'
+
     def __init__(self, local_dir):
         super(Chirps20GlobalMonthly05TifFTP, self).__init__(local_dir, 'chirps-v2.0.', '.tif.gz', [4], 'ftp.chg.ucsb.edu',
                                                           '/pub/org/chg/products/CHIRPS-2.0/global_monthly/tifs/')
@@ -48,4 +62,8 @@ class Chirps20GlobalMonthly05TifFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(''.join(os.path.basename(filename).split('.')[2:4]), '%Y%m')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('chirps-v2.0.%Y.%m.tif.gz')]
+
 
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import numpy as np
+from osgeo import gdal
+from girs.rast.parameter import RasterParameters
+from girs.rast.raster import RasterReader, RasterWriter
+from girs.rastfeat.clip import clip_by_vector
+
+
+def get_grid_key(raster):
+    """Return a hashable description of the grid of raster: size, geotransform and coordinate system"""
+    rp = raster.get_parameters()
+    return rp.raster_x_size, rp.raster_y_size, tuple(rp.geo_trans), rp.srs
+
+
+class ClipMask(object):
+    """Window and mask of clip_by_vector for a given grid, layers and all_touched
+
+    All product files of a product share the same grid. Instead of clipping each raster with clip_by_vector, which
+    reads and burns the layers each time, the window and the mask are computed once (see create) and applied to the
+    arrays with slicing and masking.
+    """
+
+    def __init__(self, xoff, yoff, mask, geo_trans, srs):
+        """
+
+        :param xoff: column of the input grid where the window starts
+        :param yoff: row of the input grid where the window starts
+        :param mask: boolean array of the window size, True for the cells kept by clip_by_vector
+        :param geo_trans: geotransform of the clipped raster
+        :param srs: coordinate system of the clipped raster
+        """
+        self.xoff = xoff
+        self.yoff = yoff
+        self.mask = mask
+        self.geo_trans = geo_trans
+        self.srs = srs
+
+    @classmethod
+    def create(cls, raster, layers, all_touched=False, layer_number=0):
+        """Clip a probe raster of the grid of raster, whose cells contain their index, and derive window and mask
+
+        :return: ClipMask or None if the result of clip_by_vector cannot be expressed as window and mask (e.g., the
+            clipped raster is not aligned on the input grid)
+        """
+        rp = raster.get_parameters()
+        nx, ny = rp.raster_x_size, rp.raster_y_size
+        probe_parameters = RasterParameters(nx, ny, rp.geo_trans, rp.srs, 1, 0, [gdal.GDT_Float64])
+        probe_parameters.driverShortName = 'MEM'
+        probe = RasterWriter(probe_parameters)
+        index = np.arange(1, nx * ny + 1, dtype=np.float64).reshape(ny, nx)  # 0 is nodata
+        probe.set_array(index)
+        probe.dataset.FlushCache()
+        fd, probe_filename = tempfile.mkstemp(suffix='.tif')
+        os.close(fd)
+        try:
+            clip_by_vector(probe, layers, output_raster=probe_filename, driver='GTiff', all_touched=all_touched,
+                           layer_number=layer_number)
+            clipped = RasterReader(probe_filename)
+            cp = clipped.get_parameters()
+            clipped_index = clipped.get_array()
+            clipped = None
+        finally:
+            if os.path.isfile(probe_filename):
+                os.remove(probe_filename)
+        gt, cgt = rp.geo_trans, cp.geo_trans
+        if not (np.isclose(gt[1], cgt[1]) and np.isclose(gt[5], cgt[5]) and gt[2] == cgt[2] == 0 and
+                gt[4] == cgt[4] == 0):
+            return None
+        xoff = int(round((cgt[0] - gt[0]) / gt[1]))
+        yoff = int(round((cgt[3] - gt[3]) / gt[5]))
+        ys, xs = clipped_index.shape
+        if xoff < 0 or yoff < 0 or xoff + xs > nx or yoff + ys > ny:
+            return None
+        mask = np.isfinite(clipped_index) & (clipped_index != 0)
+        if not np.array_equal(clipped_index[mask], index[yoff:yoff + ys, xoff:xoff + xs][mask]):
+            return None
+        return cls(xoff, yoff, mask, cgt, cp.srs)
+
+    def apply(self, raster, output_filename):
+        """Write the clipped raster as clip_by_vector(raster, layers, output_raster=output_filename, driver='GTiff')
+
+        :return: False if the nodata value of a band is unknown (nothing written), otherwise True
+        """
+        rp = raster.get_parameters()
+        nodata = rp.nodata if isinstance(rp.nodata, (list, tuple)) else [rp.nodata] * rp.number_of_bands
+        if any([nd is None for nd in nodata]):
+            return False
+        ys, xs = self.mask.shape
+        out_parameters = RasterParameters(xs, ys, self.geo_trans, self.srs, rp.number_of_bands, nodata,
+                                          rp.data_types)
+        out_parameters.driverShortName = 'GTiff'
+        r_out = RasterWriter(out_parameters, output_filename)
+        for i in range(rp.number_of_bands):
+            arr = np.array(raster.get_array(i + 1)[self.yoff:self.yoff + ys, self.xoff:self.xoff + xs])
+            arr[~self.mask] = nodata[i]
+            r_out.set_array(arr, i + 1)
+        r_out.dataset.FlushCache()
+        return True
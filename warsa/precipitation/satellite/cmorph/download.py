@@ -42,6 +42,8 @@ class CMorphV0x025deg3hlyFTP(CMorphFTP):
         CMORPH_V0.x_RAW_8km-30min_2011080100.gz
     """
 
+    file_frequency = '1D'
+
     def __init__(self, local_folder):
         super(CMorphV0x025deg3hlyFTP, self).__init__(local_folder, 'CMORPH_V0.x_RAW_0.25deg-3HLY_', '.gz', [4, 6],
                                                      '/precip/CMORPH_V0.x/RAW/0.25deg-3HLY/')
@@ -55,6 +57,10 @@ class CMorphV0x025deg3hlyFTP(CMorphFTP):
             # rasterized
             return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d%H')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('CMORPH_V0.x_RAW_0.25deg-3HLY_%Y%m%d.gz')]
+
 
 class CMorphV0x025degDailyFTP(CMorphFTP):
     """Source:
@@ -63,6 +69,8 @@ class CMorphV0x025degDailyFTP(CMorphFTP):
         CMORPH_V0.x_RAW_0.25deg-DLY_00Z_20140601.bz2
         CMORPH_V0.x_RAW_0.25deg-DLY_00Z_20161111.gz
     """
+    file_frequency = '1D'
+
     def __init__(self, local_folder):
         super(CMorphV0x025degDailyFTP, self).__init__(local_folder, 'CMORPH_V0.x_RAW_0.25deg-DLY_00Z_', ['.bz2','gz'],
                                                       [4, 6], '/precip/CMORPH_V0.x/RAW/0.25deg-DLY_00Z/')
@@ -71,6 +79,10 @@ class CMorphV0x025degDailyFTP(CMorphFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('CMORPH_V0.x_RAW_0.25deg-DLY_00Z_%Y%m%d') + s for s in ['.gz', '.bz2']]
+
 
 class CMorphV1x8km30minFTP(CMorphFTP):
     """Source
@@ -78,6 +90,8 @@ class CMorphV1x8km30minFTP(CMorphFTP):
     Format
         CMORPH_V1.0_8km-30min_199801.tar
     """
+    file_frequency = 'MS'
+
     def __init__(self, local_folder):
         super(CMorphV1x8km30minFTP, self).__init__(local_folder, 'CMORPH_V1.0_8km-30min_', '.tar', [4],
                                                    '/precip/CMORPH_V1.0/RAW/8km-30min')
@@ -89,6 +103,10 @@ class CMorphV1x8km30minFTP(CMorphFTP):
         except ValueError:
             return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d%H%M')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('CMORPH_V1.0_8km-30min_%Y%m.tar')]
+
 
 class CMorphV1x025deg3hlyFTP(CMorphFTP):
     """Source:
@@ -96,13 +114,24 @@ class CMorphV1x025deg3hlyFTP(CMorphFTP):
     Format
         CMORPH_V1.0_RAW_0.25deg-3HLY_19980101.gz
     """
+    file_frequency = '1D'
+
     def __init__(self, local_folder):
         super(CMorphV1x025deg3hlyFTP, self).__init__(local_folder, 'CMORPH_V1.0_RAW_0.25deg-3HLY_', ['.gz', '.bz2'],
                                                         [4, 6], '/precip/CMORPH_V1.0/RAW/0.25deg-3HLY')
 
     @staticmethod
     def get_datetime_from_file_name(filename):
-        return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d')
+        try:
+            # As downloaded
+            return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d')
+        except ValueError:
+            # rasterized
+            return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d%H')
+
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('CMORPH_V1.0_RAW_0.25deg-3HLY_%Y%m%d') + s for s in ['.gz', '.bz2']]
 
 
 class CMorphV1x025degDailyFTP(CMorphFTP):
@@ -112,6 +141,8 @@ class CMorphV1x025degDailyFTP(CMorphFTP):
         CMORPH_V1.0_RAW_0.25deg-DLY_00Z_19980101.gz
         CMORPH_V1.0_RAW_0.25deg-DLY_00Z_20160101.bz2
     """
+    file_frequency = '1D'
+
     def __init__(self, local_folder):
         super(CMorphV1x025degDailyFTP, self).__init__(local_folder, 'CMORPH_V1.0_RAW_0.25deg-DLY_00Z_', ['.gz', '.bz2'],
                                                       [4, 6], '/precip/CMORPH_V1.0/RAW/0.25deg-DLY_00Z')
@@ -120,4 +151,8 @@ class CMorphV1x025degDailyFTP(CMorphFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('_')[-1], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('CMORPH_V1.0_RAW_0.25deg-DLY_00Z_%Y%m%d') + s for s in ['.gz', '.bz2']]
+
 
@@ -4,6 +4,7 @@ import datetime
 import calendar
 from ftplib import FTP, error_perm
 from collections import OrderedDict
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file
 
 
 class CMorphV0x8km30minFTP(object):
@@ -28,6 +29,7 @@ class CMorphV0x8km30minFTP(object):
 
         self.local_dir = local_dir.strip()
         self.verbose = True
+        self.file_listeners = []
 
         def p(s, same_line=False):
             if same_line:
@@ -37,6 +39,17 @@ class CMorphV0x8km30minFTP(object):
             return time.time()
         self.print_verbose = p
 
+    def add_file_listener(self, listener):
+        """Register a function called with the full path of each downloaded file, e.g., RasterizePipeline.put"""
+        self.file_listeners.append(listener)
+
+    def remove_file_listener(self, listener):
+        self.file_listeners.remove(listener)
+
+    def get_ftp_dir_name(self, dt):
+        """Return the full path of the server directory containing the files of datetime dt"""
+        return '{}{}'.format(self.ftp_dir, dt.strftime('%Y/%Y%m'))
+
     def get_full_dir_name(self, dt):
         return '/'.join([self.local_dir, str(dt.year), str(dt.year)+str(dt.month).zfill(2)])
 
@@ -52,12 +65,14 @@ class CMorphV0x8km30minFTP(object):
         return filename.startswith('CMORPH_V0.x_RAW_8km-30min_') and filename.endswith('.gz')
 
     def get_local_files(self):
-        filenames = [['/'.join([root, f]) for f in files] for root, dirs, files in os.walk(self.local_dir) if files]
+        filenames = [['/'.join([root, f]) for f in files if self.valid_filename(f)]
+                     for root, dirs, files in os.walk(self.local_dir) if files]
         return sorted([f for filenames0 in filenames for f in filenames0])
 
     def get_missing_datetime(self, datetime_begin=None, datetime_end=None):
         # Datetime from local files
-        datetime_local = [[f.split('_')[-1][:-3] for f in files] for root, dirs, files in os.walk(self.local_dir)]
+        datetime_local = [[f.split('_')[-1][:-3] for f in files if self.valid_filename(f)]
+                          for root, dirs, files in os.walk(self.local_dir)]
         datetime_local = [f for filenames0 in datetime_local for f in filenames0]
         # 3B42RT.2000030100.7R2.bin.gz
         # Datetime from files expected to be found on the server
@@ -127,23 +142,32 @@ class CMorphV0x8km30minFTP(object):
     def download_ftp_files(self, missing_datetime):
         missing_ftp_files = self.get_missing_ftp_files(missing_datetime)
         for ftp_filename in missing_ftp_files:
+            self.download_ftp_file(self.ftp, ftp_filename)
+
+    def download_ftp_file(self, ftp, ftp_filename):
+        """Download a single file using the given ftp session
+
+        :return: True if the file was downloaded, otherwise False
+        """
+        time0 = time.time()
+        if self.verbose:
+            self.print_verbose('{};'.format(os.path.basename(ftp_filename)), True)
+        local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
+        if not os.path.isdir(os.path.dirname(local_filename)):
+            os.makedirs(os.path.dirname(local_filename))
+        try:
+            resp = retrieve_ftp_file(ftp, ftp_filename, local_filename)
+            resp = 'OK' if resp == '226 Transfer complete.' else resp
             if self.verbose:
-                time0 = self.print_verbose('{};'.format(os.path.basename(ftp_filename)), True)
-            local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
-            if not os.path.isdir(os.path.dirname(local_filename)):
-                os.makedirs(os.path.dirname(local_filename))
-            with open(local_filename, "wb") as bfile:
-                try:
-                    resp = self.ftp.retrbinary('RETR ' + ftp_filename, callback=bfile.write)
-                    resp = 'OK' if resp == '226 Transfer complete.' else resp
-                    if self.verbose:
-                        self.print_verbose('{}; {:.2f} seconds'.format(resp, time.time()-time0))
-                except Exception, e:
-                    print e
-                    if os.path.isfile(local_filename):
-                        os.remove(local_filename)
-                    if self.verbose:
-                        self.print_verbose('in {} seconds (failed) '.format(time.time()-time0))
+                self.print_verbose('{}; {:.2f} seconds'.format(resp, time.time()-time0))
+        except Exception, e:
+            print e
+            if self.verbose:
+                self.print_verbose('in {} seconds (failed, partial file kept) '.format(time.time()-time0))
+            return False
+        for listener in self.file_listeners:
+            listener(local_filename)
+        return True
 
     def get_missing_ftp_files(self, missing_datetimes):
         ftp_files = list()
@@ -2,46 +2,68 @@ import bz2
 import os
 import tarfile
 import numpy as np
-from girs.rast.parameter import RasterParameters
-from girs.rast.raster import RasterWriter
-from osgeo import gdal, osr
 from warsa.precipitation.satellite.rasterize import Rasterizer
+from warsa.precipitation.satellite.grid import ArrayRaster, get_grid
+from warsa.precipitation.satellite.subset import get_native_rows, read_native_subset
 
 
 class CMorphRasterize(Rasterizer):
 
+    transcodable = True
+
+    @staticmethod
+    def rasterize_block(arr, nx, ny, x_res, y_res, window=None):
+        """Return the raster of a block of nx * ny cells stored from south to north and from 0 to 360 degrees east
+
+        :param window: (c0, c1, r0, r1), see get_block_window. If given, only these cells are decoded
+        """
+        # EPSG:4035 Authalic WGS84
+        grid = get_grid(nx, ny, [-180.0, x_res, 0, 60.0, 0, -y_res], 4035, -999.0)
+        if window:
+            arr = read_native_subset(arr, nx, ny, window, south_up=True, shift=nx/2)
+            grid = grid.subset(window)
+        else:
+            arr = np.flipud(arr.reshape((ny, nx)))  # bottom up
+            arr = np.append(arr[:, nx/2:], arr[:, :nx/2], axis=1)
+        arr[arr < 0] = grid.nodata
+        arr[arr > 998] = grid.nodata
+        return ArrayRaster(grid, arr)
+
+    def get_block_window(self, nx, ny, x_res, y_res):
+        """Return the window of the output grid intersecting bbox or None (see Rasterizer.get_window)"""
+        return self.get_window([-180.0, x_res, 0, 60.0, 0, -y_res], nx, ny)
+
     @staticmethod
-    def rasterize_block(arr, nx, ny, x_res, y_res):
-        nodata = -999.0
-        arr = np.flipud(arr.reshape((ny, nx)))  # bottom up
-        arr = np.append(arr[:, nx/2:], arr[:, :nx/2], axis=1)
-        arr[arr < 0] = nodata
-        arr[arr > 998] = nodata
-        tran = [-180.0, x_res, 0, 60.0, 0, -y_res]
-        srs = osr.SpatialReference()
-        # srs.ImportFromEPSG(4326)  # EPSG:4326
-        srs.ImportFromEPSG(4035)  # Authalic WGS84
-        raster_parameters = RasterParameters(nx, ny, tran, srs.ExportToWkt(), 1, [nodata], gdal.GDT_Float32,
-                                             driver_short_name='MEM')
-        raster_out = RasterWriter(raster_parameters)
-        raster_out.set_array(arr, 1)
-        return raster_out
+    def get_read_size(window, nx, ny, block):
+        """Return the number of bytes of the content needed to decode window in the block number block or None"""
+        if window is None:
+            return None
+        return 4 * (block * nx * ny + get_native_rows(window, ny, south_up=True)[1] * nx)
+
+    def get_raster_file_names_3hly(self, product_filename):
+        """Return the file names of the 8 rasters of a 3-hourly product file, the hour appended to the date"""
+        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0]
+        raster_filename = os.path.join(self.output_raster_dir, raster_filename)
+        return [os.path.normpath(raster_filename + str(hour).zfill(2) + '.tif') for hour in range(0, 24, 3)]
+
+    def get_raster_file_names_daily(self, product_filename):
+        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0] + '.tif'
+        return [os.path.join(self.output_raster_dir, raster_filename)]
 
     def get_raster_datasets_3hly(self, product_filename):
         nx, ny = 1440, 480
         x_res, y_res = 0.25, 0.25  # = 360/1440, 120/480
-        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0]
-        raster_filename = os.path.join(self.output_raster_dir, raster_filename)
-        raster_file_names = [None]*8
-        for i, hour in enumerate(range(0, 24, 3)):
-            rfn = raster_filename + str(hour).zfill(2) + '.tif'
-            if self.overwrite or not os.path.isfile(rfn):
-                raster_file_names[i] = os.path.normpath(rfn)
+        raster_file_names = [rfn if self.overwrite or not os.path.isfile(rfn) else None
+                             for rfn in self.get_raster_file_names_3hly(product_filename)]
         results = []
         if raster_file_names.count(None) < 8:
+            window = self.get_block_window(nx, ny, x_res, y_res)
+            last = max([i for i, rfn in enumerate(raster_file_names) if rfn])
             # rain depth. For rain intensity arr = arr / 3.0
-            arr = np.frombuffer(self.read_compressed_file(product_filename), dtype='<f4')
-            results = [[raster_file_names[i], self.rasterize_block(arr[i*691200:(i+1)*691200], nx, ny, x_res, y_res)]
+            arr = np.frombuffer(self.read_compressed_file(product_filename, self.get_read_size(window, nx, ny, last)),
+                                dtype='<f4')
+            results = [[raster_file_names[i], self.rasterize_block(arr[i*691200:(i+1)*691200], nx, ny, x_res, y_res,
+                                                                   window)]
                        for i, rfn in enumerate(raster_file_names) if rfn]
         for r in results:
             yield r
@@ -50,12 +72,13 @@ class CMorphRasterize(Rasterizer):
         nx, ny = 1440, 480
         x_res, y_res = 0.25, 0.25  # = 360/1440, 120/480
         results = []
-        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0] + '.tif'
-        raster_filename = os.path.join(self.output_raster_dir, raster_filename)
+        raster_filename = self.get_raster_file_names_daily(product_filename)[0]
         if self.overwrite or not os.path.isfile(raster_filename):
-            arr = np.frombuffer(self.read_compressed_file(product_filename), dtype='<f4')
+            window = self.get_block_window(nx, ny, x_res, y_res)
+            arr = np.frombuffer(self.read_compressed_file(product_filename, self.get_read_size(window, nx, ny, 0)),
+                                dtype='<f4')
             # rain depth. For rain intensity arr = arr / 24.0
-            results.append([raster_filename, self.rasterize_block(arr, nx, ny, x_res, y_res)])
+            results.append([raster_filename, self.rasterize_block(arr, nx, ny, x_res, y_res, window)])
         for r in results:
             yield r
 
@@ -71,10 +94,7 @@ class CMorphV0x8km30minRasterize(CMorphRasterize):
         x_res = 0.07275666936135812449474535165724  # = 360/4948 8km
         y_res = 0.07277137659187386294724075197089  # = 120/1649 (ca. 8km)
 
-        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0]
-        raster_filename = os.path.join(self.output_raster_dir, raster_filename)
-        raster_filename0 = raster_filename + '00.tif'
-        raster_filename1 = raster_filename + '30.tif'
+        raster_filename0, raster_filename1 = self.get_raster_file_names(product_filename)
         if not self.overwrite and os.path.isfile(raster_filename0):
             raster_filename0 = None
         if not self.overwrite and os.path.isfile(raster_filename1):
@@ -82,15 +102,23 @@ class CMorphV0x8km30minRasterize(CMorphRasterize):
 
         result = []
         if raster_filename0 or raster_filename1:
+            window = self.get_block_window(nx, ny, x_res, y_res)
+            size = self.get_read_size(window, nx, ny, 1 if raster_filename1 else 0)
             # rain intensity in mm/h. For rain depth arr = arr * 0.5
-            arr = np.frombuffer(self.read_compressed_file(product_filename), dtype='<f4')
+            arr = np.frombuffer(self.read_compressed_file(product_filename, size), dtype='<f4')
             if raster_filename0:
-                result.append((raster_filename0, self.rasterize_block(arr[0:8159252], nx, ny, x_res, y_res)))
+                result.append((raster_filename0, self.rasterize_block(arr[0:8159252], nx, ny, x_res, y_res, window)))
             if raster_filename1:
-                result.append((raster_filename1, self.rasterize_block(arr[8159252:16318504], nx, ny, x_res, y_res)))
+                result.append((raster_filename1, self.rasterize_block(arr[8159252:16318504], nx, ny, x_res, y_res,
+                                                                      window)))
         for r in result:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        raster_filename = os.path.splitext(os.path.relpath(product_filename, self.product_dir))[0]
+        raster_filename = os.path.join(self.output_raster_dir, raster_filename)
+        return [raster_filename + '00.tif', raster_filename + '30.tif']
+
 
 class CMorphV0x025deg3hlyRasterize(CMorphRasterize):
 
@@ -100,6 +128,9 @@ class CMorphV0x025deg3hlyRasterize(CMorphRasterize):
     def get_rasters(self, product_filename):
         return self.get_raster_datasets_3hly(product_filename)
 
+    def get_raster_file_names(self, product_filename):
+        return self.get_raster_file_names_3hly(product_filename)
+
 
 class CMorphV0x025degDailyRasterize(CMorphRasterize):
 
@@ -109,6 +140,9 @@ class CMorphV0x025degDailyRasterize(CMorphRasterize):
     def get_rasters(self, product_filename):
         return self.get_raster_datasets_daily(product_filename)
 
+    def get_raster_file_names(self, product_filename):
+        return self.get_raster_file_names_daily(product_filename)
+
 
 class CMorphV1x8km30minRasterize(CMorphRasterize):
 
@@ -121,13 +155,11 @@ class CMorphV1x8km30minRasterize(CMorphRasterize):
         x_res = 0.07275666936135812449474535165724  # = 360/4948 8km
         y_res = 0.07277137659187386294724075197089  # = 120/1649 (ca. 8km)
 
+        window = self.get_block_window(nx, ny, x_res, y_res)
         with tarfile.open(product_filename) as tar:
             tar_members = [member.name for member in tar.getmembers() if member.isfile()]
             for tar_member in tar_members:
-                suffix = os.path.splitext(tar_member)[1]
-                tm = os.path.join(self.output_raster_dir, tar_member)
-                raster_filename0 = tm.replace(suffix, '00.tif')
-                raster_filename1 = tm.replace(suffix, '30.tif')
+                raster_filename0, raster_filename1 = self.get_member_raster_file_names(tar_member)
                 if not self.overwrite and os.path.isfile(raster_filename0):
                     raster_filename0 = None
                 if not self.overwrite and os.path.isfile(raster_filename1):
@@ -138,12 +170,26 @@ class CMorphV1x8km30minRasterize(CMorphRasterize):
                 arr = np.frombuffer(bz2.decompress(tar.extractfile(tar_member).read()), dtype='<f4')
                 result = []
                 if raster_filename0:
-                    result.append((raster_filename0, self.rasterize_block(arr[0:8159252], nx, ny, x_res, y_res)))
+                    result.append((raster_filename0, self.rasterize_block(arr[0:8159252], nx, ny, x_res, y_res,
+                                                                          window)))
                 if raster_filename1:
-                    result.append((raster_filename1, self.rasterize_block(arr[8159252:16318504], nx, ny, x_res, y_res)))
+                    result.append((raster_filename1, self.rasterize_block(arr[8159252:16318504], nx, ny, x_res, y_res,
+                                                                          window)))
                 for r in result:
                     yield r
 
+    def get_member_raster_file_names(self, tar_member):
+        """Return the file names of the two half-hourly rasters of a member of the monthly tar file"""
+        suffix = os.path.splitext(tar_member)[1]
+        tm = os.path.join(self.output_raster_dir, tar_member)
+        return [tm.replace(suffix, '00.tif'), tm.replace(suffix, '30.tif')]
+
+    def get_raster_file_names(self, product_filename):
+        """Return the file names of the rasters of the members of product_filename, which is read"""
+        with tarfile.open(product_filename) as tar:
+            tar_members = [member.name for member in tar.getmembers() if member.isfile()]
+        return [rfn for tar_member in tar_members for rfn in self.get_member_raster_file_names(tar_member)]
+
 
 class CMorphV1x025deg3hlyRasterize(CMorphRasterize):
 
@@ -153,6 +199,9 @@ class CMorphV1x025deg3hlyRasterize(CMorphRasterize):
     def get_rasters(self, product_filename):
         return self.get_raster_datasets_3hly(product_filename)
 
+    def get_raster_file_names(self, product_filename):
+        return self.get_raster_file_names_3hly(product_filename)
+
 
 class CMorphV1x025degDailyRasterize(CMorphRasterize):
 
@@ -162,6 +211,9 @@ class CMorphV1x025degDailyRasterize(CMorphRasterize):
     def get_rasters(self, product_filename):
         return self.get_raster_datasets_daily(product_filename)
 
+    def get_raster_file_names(self, product_filename):
+        return self.get_raster_file_names_daily(product_filename)
+
 
 # def read_compressed_file(source):
 #     s = os.path.splitext(source)
@@ -0,0 +1,268 @@
+import os
+import datetime
+import numpy as np
+from netCDF4 import Dataset
+from warsa.precipitation.satellite.geotiff import SCALED_NODATA, scale_array
+
+CUBE_SUFFIX = '.nc'
+SOURCES_FILENAME = 'cube_sources.txt'
+EPOCH = datetime.datetime(1970, 1, 1)
+TIME_UNITS = 'minutes since 1970-01-01 00:00:00'
+
+
+def datetime_to_minutes(dt):
+    return int((dt - EPOCH).total_seconds()) // 60
+
+
+def minutes_to_datetime(minutes):
+    return EPOCH + datetime.timedelta(minutes=int(minutes))
+
+
+def get_chunk_sizes(nx, ny, itemsize=4, max_chunk_time=512, chunk_xy=32, buffer_size=1 << 28):
+    """Return the chunk sizes (time, y, x) of a cube of nx * ny cells
+
+    The chunks are long in time and small in space, so that the time series of a cell is read from a few chunks. The
+    number of timesteps per chunk is limited so that a chunk-high slab of the whole grid (buffered by RasterCubeWriter
+    before writing) does not exceed buffer_size bytes
+    """
+    chunk_time = max(1, min(max_chunk_time, buffer_size // (nx * ny * itemsize)))
+    return chunk_time, min(chunk_xy, ny), min(chunk_xy, nx)
+
+
+def get_cube_files(cube_dir):
+    """Return the cube files (yearly NetCDF4) found in cube_dir, sorted"""
+    if not os.path.isdir(cube_dir):
+        return []
+    return sorted([os.path.join(cube_dir, f) for f in os.listdir(cube_dir) if f.endswith(CUBE_SUFFIX)])
+
+
+class RasterCubeWriter(object):
+    """Writes the rasters of a product into yearly space-time cubes (time, y, x), one NetCDF4 file per year
+
+    The variable precipitation is compressed (zlib) and chunked for time series reads (see get_chunk_sizes). Since
+    appending a single timestep would rewrite each spatial chunk, the timesteps are buffered and written a chunk at a
+    time. Existing timesteps are overwritten in place. If scale_factor is given, precipitation is stored as scaled
+    integers (see geotiff.scale_array) with the attributes scale_factor and add_offset, unscaled by NetCDF readers.
+
+    The names of the product files whose rasters were written are kept in .warsa/cube_sources.txt (see add_source,
+    is_source), so that a product file is rasterized once.
+
+    Usage:
+        writer = RasterCubeWriter(cube_dir, 'CMORPH_V1.0_8km-30min')
+        writer.append(dt, arr, geo_trans, srs, nodata)
+        writer.add_source(product_filename)
+        writer.close()
+    """
+
+    def __init__(self, cube_dir, prefix, complevel=4, chunk_sizes=None, scale_factor=None):
+        """
+
+        :param cube_dir: directory of the cube files <prefix>_<year>.nc, created if needed
+        :param prefix: prefix of the cube file names
+        :param complevel: zlib compression level
+        :param chunk_sizes: (time, y, x) or None for get_chunk_sizes
+        :param scale_factor: None for float cubes or the scale factor of the scaled integers of new cubes, e.g., 0.01.
+            Existing cubes keep their storage
+        """
+        self.cube_dir = cube_dir
+        self.prefix = prefix
+        self.complevel = complevel
+        self.chunk_sizes = chunk_sizes
+        self.scale_factor = scale_factor
+        self.dataset = None
+        self.year = None
+        self.times = dict()  # minutes -> index in the time dimension of the open cube
+        self.buffer = []  # list of (minutes, arr) not written yet
+        self.pending_sources = []
+        self.sources_filename = os.path.join(cube_dir, '.warsa', SOURCES_FILENAME)
+        self.sources = set()
+        if os.path.isfile(self.sources_filename):
+            with open(self.sources_filename) as f:
+                self.sources = set([line.strip() for line in f if line.strip()])
+
+    def get_filename(self, year):
+        return os.path.join(self.cube_dir, '{}_{}{}'.format(self.prefix, year, CUBE_SUFFIX))
+
+    def is_source(self, product_filename):
+        """Return True if the rasters of product_filename were written"""
+        return os.path.basename(product_filename) in self.sources
+
+    def add_source(self, product_filename):
+        """Record product_filename as written, after all its rasters were appended. Saved at the next flush"""
+        self.pending_sources.append(os.path.basename(product_filename))
+
+    def _create(self, filename, arr, geo_trans, srs, nodata):
+        ny, nx = arr.shape
+        dtype, fill_value = (np.uint16, SCALED_NODATA) if self.scale_factor else (arr.dtype, nodata)
+        chunk_sizes = self.chunk_sizes or get_chunk_sizes(nx, ny, np.dtype(dtype).itemsize)
+        ds = Dataset(filename, 'w', format='NETCDF4')
+        ds.Conventions = 'CF-1.6'
+        ds.createDimension('time', None)
+        ds.createDimension('y', ny)
+        ds.createDimension('x', nx)
+        v = ds.createVariable('time', 'i8', ('time',))
+        v.units = TIME_UNITS
+        v.calendar = 'standard'
+        v = ds.createVariable('y', 'f8', ('y',))
+        v[:] = geo_trans[3] + (np.arange(ny) + 0.5) * geo_trans[5]
+        v = ds.createVariable('x', 'f8', ('x',))
+        v[:] = geo_trans[0] + (np.arange(nx) + 0.5) * geo_trans[1]
+        v = ds.createVariable('crs', 'i4')
+        v.spatial_ref = srs or ''
+        v.GeoTransform = ' '.join([repr(float(g)) for g in geo_trans])  # as written by the GDAL netCDF driver
+        v = ds.createVariable('precipitation', dtype, ('time', 'y', 'x'), zlib=True, complevel=self.complevel,
+                              shuffle=True, chunksizes=chunk_sizes, fill_value=fill_value)
+        v.grid_mapping = 'crs'
+        if self.scale_factor:
+            v.scale_factor = self.scale_factor
+            v.add_offset = 0.0
+        return ds
+
+    def _open(self, year, arr, geo_trans, srs, nodata):
+        self.flush()
+        if self.dataset is not None:
+            self.dataset.close()
+        filename = self.get_filename(year)
+        if os.path.isfile(filename):
+            self.dataset = Dataset(filename, 'a')
+        else:
+            if not os.path.isdir(self.cube_dir):
+                os.makedirs(self.cube_dir)
+            self.dataset = self._create(filename, arr, geo_trans, srs, nodata)
+        self.year = year
+        self.times = dict([(int(t), i) for i, t in enumerate(self.dataset.variables['time'][:])])
+        self.dataset.variables['precipitation'].set_auto_maskandscale(False)  # packed in append
+
+    def append(self, dt, arr, geo_trans, srs, nodata):
+        """Add the raster of datetime dt to the cube of its year
+
+        :param dt: datetime, e.g., from the get_datetime_from_file_name of the download class
+        :param arr: 2-D array
+        :param geo_trans: geotransform of arr, must be the one of the cube
+        :param srs: coordinate system (wkt)
+        :param nodata: nodata value of arr
+        """
+        if self.year != dt.year:
+            self._open(dt.year, arr, geo_trans, srs, nodata)
+        v = self.dataset.variables['precipitation']
+        if arr.shape != v.shape[1:]:
+            raise ValueError('{}: raster of {} has shape {}, the cube {}'.format(self.dataset.filepath(), dt,
+                                                                                 arr.shape, v.shape[1:]))
+        if 'scale_factor' in v.ncattrs():
+            arr = scale_array(arr, nodata, v.scale_factor, v.add_offset)
+        elif nodata != v._FillValue:
+            arr = np.where(arr == nodata, v._FillValue, arr).astype(v.dtype)
+        minutes = datetime_to_minutes(dt)
+        if minutes in self.times:
+            v[self.times[minutes]] = arr
+            return
+        self.buffer = [(m, a) for m, a in self.buffer if m != minutes]
+        self.buffer.append((minutes, arr))
+        if len(self.buffer) >= v.chunking()[0]:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered timesteps and record the pending sources"""
+        if self.buffer:
+            i0 = len(self.dataset.dimensions['time'])
+            minutes = [m for m, _ in self.buffer]
+            self.dataset.variables['precipitation'][i0:i0 + len(self.buffer)] = np.array([a for _, a in self.buffer])
+            self.dataset.variables['time'][i0:i0 + len(self.buffer)] = minutes
+            self.dataset.sync()
+            self.times.update([(m, i0 + i) for i, m in enumerate(minutes)])
+            self.buffer = []
+        if self.pending_sources:
+            d = os.path.dirname(self.sources_filename)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            with open(self.sources_filename, 'a') as f:
+                f.write(''.join([s + '\n' for s in self.pending_sources]))
+            self.sources.update(self.pending_sources)
+            self.pending_sources = []
+
+    def close(self):
+        self.flush()
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+            self.year = None
+
+
+def _sort_by_time(minutes, values):
+    """Return the datetimes and values read from the cubes sorted by time, see RasterCubeReader.read_cells"""
+    minutes = np.concatenate(minutes)
+    values = np.concatenate(values)
+    order = np.argsort(minutes, kind='mergesort')
+    return [minutes_to_datetime(m) for m in minutes[order]], values[order]
+
+
+class RasterCubeReader(object):
+    """Reads time series of cells and zonal means from the cubes written by RasterCubeWriter"""
+
+    def __init__(self, cube_filenames):
+        """
+
+        :param cube_filenames: list of cube files of the same product (same grid), see get_cube_files
+        """
+        self.cube_filenames = sorted(cube_filenames)
+        with Dataset(self.cube_filenames[0]) as ds:
+            crs = ds.variables['crs']
+            self.srs = crs.spatial_ref
+            self.geo_trans = [float(g) for g in crs.GeoTransform.split()]
+            self.nx = len(ds.dimensions['x'])
+            self.ny = len(ds.dimensions['y'])
+
+    def world_to_pixel(self, x, y):
+        """Return the column and row of the cell containing (x, y) or None if outside the grid"""
+        i = int(np.floor((x - self.geo_trans[0]) / self.geo_trans[1]))
+        j = int(np.floor((y - self.geo_trans[3]) / self.geo_trans[5]))
+        return (i, j) if 0 <= i < self.nx and 0 <= j < self.ny else None
+
+    def read_cells(self, cells):
+        """Return the time series of cells
+
+        :param cells: list of (column, row)
+        :return: tuple (list of datetimes sorted, 2-D array (datetimes, cells) with nodata as NaN)
+        """
+        minutes = []
+        values = []
+        for filename in self.cube_filenames:
+            with Dataset(filename) as ds:
+                v = ds.variables['precipitation']  # masked and unscaled by netCDF4
+                minutes.append(ds.variables['time'][:])
+                arr = np.empty((len(minutes[-1]), len(cells)), dtype=np.float32)
+                for k, (i, j) in enumerate(cells):
+                    arr[:, k] = np.ma.filled(np.ma.asarray(v[:, j, i], dtype=np.float32), np.nan)
+                values.append(arr)
+        return _sort_by_time(minutes, values)
+
+    def read_zonal_means(self, window, masks):
+        """Return the time series of the mean of the cells of each mask, nodata cells ignored
+
+        The cubes are read a time chunk at a time for the cells of window only, so that each chunk is read once for
+        all masks.
+
+        :param window: (c0, c1, r0, r1), columns c0 to c1 - 1 and rows r0 to r1 - 1, see subset.get_subset_window
+        :param masks: list of 2-D boolean arrays of shape (r1 - r0, c1 - c0), one per zone
+        :return: tuple (list of datetimes sorted, 2-D array (datetimes, masks), NaN if no cell of a mask has data)
+        """
+        c0, c1, r0, r1 = window
+        minutes = []
+        values = []
+        for filename in self.cube_filenames:
+            with Dataset(filename) as ds:
+                v = ds.variables['precipitation']  # masked and unscaled by netCDF4
+                minutes.append(ds.variables['time'][:])
+                chunking = v.chunking()
+                step = chunking[0] if chunking != 'contiguous' else 512
+                arr = np.full((len(minutes[-1]), len(masks)), np.nan, dtype=np.float32)
+                for t0 in range(0, len(minutes[-1]), step):
+                    slab = np.ma.filled(np.ma.asarray(v[t0:t0 + step, r0:r1, c0:c1], dtype=np.float32), np.nan)
+                    for k, mask in enumerate(masks):
+                        cells = slab[:, mask]
+                        n = np.sum(~np.isnan(cells), axis=1)
+                        arr[t0:t0 + len(slab), k] = np.where(n > 0, np.nansum(cells, axis=1) / np.maximum(n, 1),
+                                                             np.nan)
+                values.append(arr)
+        return _sort_by_time(minutes, values)
+
@@ -1,13 +1,25 @@
 import os
 import time
-import collections
 import datetime
+import threading
 from datetime import timedelta
-from ftplib import FTP, error_perm
+import pandas as pd
+from ftplib import error_perm, error_temp
+from warsa.precipitation.satellite.catalog import LocalFileCatalog, verify_file
+from warsa.precipitation.satellite.ftp_cache import FTPListingCache, parse_ftp_list_line
+from warsa.precipitation.satellite.ftp_pool import FTPConnectionPool, FTPCommandCounter, FTPSession
+from warsa.precipitation.satellite.ftp_pool import get_host_semaphore, is_transient_ftp_error, list_ftp_dir_lines
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file_with_size, get_ftp_file_size
+from warsa.utils.partfile import is_part_file, part_filename, replace_file
+from warsa.utils.retry import RetryPolicy
 
 
 class SatelliteBasedPrecipitationDownload(object):
 
+    # Cadence of the files on the server as pandas frequency (e.g., '1D', '3H', 'MS') or None if unknown. Together
+    # with get_file_names_from_datetime, it is used to predict the remote file names without listing directories
+    file_frequency = None
+
     def __init__(self, local_dir, prefix, suffix, dir_lens, product_subfolder):
         if not prefix:
             prefix = ['']
@@ -32,6 +44,8 @@ class SatelliteBasedPrecipitationDownload(object):
         self.begin = datetime.datetime(1, 1, 1, 0, 0)
         self.end = datetime.datetime(9999, 12, 31, 23, 59)
         self.get_full_dir_name = None
+        self.catalog = None
+        self.file_listeners = []
 
         try:
             n = len(dir_lens)
@@ -66,8 +80,67 @@ class SatelliteBasedPrecipitationDownload(object):
         return path.strip()
 
     def get_local_files(self):
-        filenames = [['/'.join([root, f]) for f in files] for root, dirs, files in os.walk(self.local_dir) if files]
-        return sorted([f for filenames0 in filenames for f in filenames0])
+        return self.get_catalog().get_files()
+
+    def get_catalog(self):
+        """Return the catalog of the downloaded files. It is created from the local files if not found"""
+        if self.catalog is None:
+            self.catalog = LocalFileCatalog(self.local_dir, '/'.join([self.get_meta_dir(), 'catalog.sqlite']),
+                                            exclude=is_part_file)
+        return self.catalog
+
+    def rebuild_catalog(self):
+        """Synchronize the catalog with the local disk, e.g., after files were removed or copied manually"""
+        self.get_catalog().rebuild()
+
+    def add_to_catalog(self, local_filename, remote_size=None, remote_mtime=None, verified=None):
+        try:
+            dt = self.__class__.get_datetime_from_file_name(os.path.basename(local_filename))
+        except (ValueError, IndexError, NotImplementedError):
+            dt = None
+        self.get_catalog().add(local_filename, dt, remote_size=remote_size, remote_mtime=remote_mtime,
+                               verified=verified)
+
+    def verify_local_files(self, verbose=False):
+        """Verify the integrity of the cataloged files not verified yet, e.g., downloaded by earlier versions (see
+        catalog.verify_file). Corrupt files are removed at the beginning of the next download and downloaded again
+
+        :return: list of corrupt files
+        """
+        catalog = self.get_catalog()
+        for filename in catalog.get_unverified_files():
+            verified = catalog.verify(filename)
+            if verbose:
+                print_verbose('{}; {}'.format(filename, {True: 'OK', False: 'corrupt'}.get(verified, 'not verified')))
+        return catalog.get_corrupt_files()
+
+    def remove_corrupt_files(self):
+        """Remove the files found corrupt from the local disk and from the catalog"""
+        catalog = self.get_catalog()
+        for filename in catalog.get_corrupt_files():
+            if self.verbose:
+                print_verbose('{}; corrupt, removed'.format(filename))
+            if os.path.isfile(filename):
+                os.remove(filename)
+            catalog.remove(filename)
+
+    def add_file_listener(self, listener):
+        """Register a function called with the full path of each downloaded file, e.g., RasterizePipeline.put
+
+        Listeners are called from the downloading thread(s) right after the file is complete.
+        """
+        self.file_listeners.append(listener)
+
+    def remove_file_listener(self, listener):
+        self.file_listeners.remove(listener)
+
+    def notify_file_downloaded(self, local_filename):
+        for listener in self.file_listeners:
+            listener(local_filename)
+
+    def get_meta_dir(self):
+        """Return the hidden directory inside local_dir where caches and catalogs of this product are saved"""
+        return make_dir('/'.join([self.local_dir, '.warsa']))
 
     def startswith_prefix(self, s):
         for pf in self.prefix:
@@ -89,6 +162,31 @@ class SatelliteBasedPrecipitationDownload(object):
         # Subclass must implement it
         raise NotImplementedError
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        """Return the alternative names of the file expected on the server for dt, the most probable first
+
+        Subclasses with predictable file names implement it and set file_frequency.
+        """
+        raise NotImplementedError
+
+    def is_predictable(self):
+        if not self.file_frequency:
+            return False
+        try:
+            self.get_file_names_from_datetime(datetime.datetime(2000, 1, 1))
+            return True
+        except NotImplementedError:
+            return False
+
+    def get_expected_datetimes(self, begin, end):
+        """Return the datetimes of the files expected between begin and end according to file_frequency"""
+        if self.file_frequency == 'MS':
+            begin = datetime.datetime(begin.year, begin.month, 1)
+        else:
+            begin = pd.Timestamp(begin).floor(self.file_frequency).to_pydatetime()
+        return [ts.to_pydatetime() for ts in pd.date_range(begin, end, freq=self.file_frequency)]
+
     def download(self, update=False, verbose=False, begin=None, end=None):
         # Subclass must implement it
         raise NotImplementedError
@@ -121,7 +219,7 @@ class SatelliteBasedPrecipitationDownload(object):
 class SatelliteBasedPrecipitationDownloadFTP(SatelliteBasedPrecipitationDownload):
 
     def __init__(self, local_dir, prefix, suffix, dir_lens, ftp_host, ftp_dir, ftp_user=None, ftp_password=None,
-                 ftp_timeout=600, product_subfolder=''):
+                 ftp_timeout=600, product_subfolder='', ftp_connections=1, ftp_listing_cache=True, ftp_predict=False):
         super(SatelliteBasedPrecipitationDownloadFTP, self).__init__(local_dir, prefix, suffix, dir_lens,
                                                                      product_subfolder)
 
@@ -130,12 +228,106 @@ class SatelliteBasedPrecipitationDownloadFTP(SatelliteBasedPrecipitationDownload
         if not ftp_dir.startswith('/'):
             ftp_dir = '/' + ftp_dir
 
-        self.ftp = None
+        self.session = None
         self.ftp_host = ftp_host
+        self.ftp_port = 0  # default port
         self.ftp_dir = ftp_dir
         self.ftp_user = ftp_user
         self.ftp_password = ftp_password
         self.ftp_timeout = ftp_timeout
+        self.ftp_connections = ftp_connections
+        self.ftp_listing_cache = ftp_listing_cache
+        self.listing_cache = None
+        self.ftp_predict = ftp_predict
+        self.ftp_commands = FTPCommandCounter()
+        self.ftp_retry_policy = RetryPolicy()
+        self.ftp_adaptive = True
+        self.ftp_verify = True
+        self.ftp_verify_size = False
+        self.remote_entries = dict()  # ftp file name -> (size, modification time) found when listing
+
+    def set_ftp_connections(self, n):
+        """Set the number of parallel FTP sessions used to download files. The number of sessions per host is
+        further limited by ftp_pool.set_max_host_connections
+
+        :param n: number of sessions. If 1 (default), files are downloaded sequentially using the listing session.
+            Otherwise, the listing session is closed while the files are downloaded
+        """
+        self.ftp_connections = max(1, int(n))
+
+    def set_ftp_listing_cache(self, use_cache):
+        """Enable or disable the on-disk cache of ftp directory listings
+
+        If enabled (default), listings of closed directories, i.e. directories having a newer sibling on the server,
+        are read from the cache and never listed again. Only the newest directory of each level is re-listed.
+        """
+        self.ftp_listing_cache = use_cache
+
+    def set_ftp_predict(self, predict):
+        """Enable or disable the predictive mode
+
+        In predictive mode, the names of the remote files are derived from file_frequency and
+        get_file_names_from_datetime, and only files missing locally are requested, without listing directories.
+        Directories are listed only if a predicted file is not found on the server. The predictive mode is ignored
+        if the product does not support it (see is_predictable) or if neither begin nor a local file is given.
+        """
+        self.ftp_predict = predict
+
+    def set_ftp_retries(self, retries, delay=2.0, max_delay=60.0):
+        """Set the number of retries after transient errors (timeouts, dropped connections, 4xx replies). Before
+        each retry the session is reconnected after waiting delay seconds, doubled at each retry up to max_delay
+        """
+        self.ftp_retry_policy = RetryPolicy(retries, delay, max_delay)
+
+    def set_ftp_host(self, host, port=0):
+        """Set the ftp host, e.g., a mirror or a local test server (see ftp_fixture.LocalFTPServer)
+
+        :param host: host name or address
+        :param port: ftp port, 0 for the default port (21)
+        """
+        self.ftp_host = host
+        self.ftp_port = port
+
+    def set_ftp_timeout(self, timeout):
+        self.ftp_timeout = timeout
+
+    def set_ftp_adaptive(self, adaptive):
+        """Enable or disable the adaptive number of parallel transfers (see ftp_pool.AdaptiveConcurrency). If
+        disabled, ftp_connections sessions transfer files all the time
+        """
+        self.ftp_adaptive = adaptive
+
+    def set_ftp_verify(self, verify, query_size=False):
+        """Enable or disable the integrity check of the downloaded files
+
+        If enabled (default), the size and modification time of each file on the server are recorded in the catalog
+        and each downloaded file is checked against the size and, if compressed, decompressed in a streaming pass (see
+        catalog.verify_file). Incomplete transfers are resumed. Corrupt files are flagged in the catalog, not passed
+        to the file listeners, and downloaded again at the next download.
+
+        The size is taken from the directory listing or, if not listed (e.g., predicted files, see set_ftp_predict),
+        from the reply of the server to the transfer, so that no ftp command is added per file.
+
+        :param verify: True to enable the integrity check
+        :param query_size: if True, the size of a file neither listed nor announced by the server is queried with the
+            SIZE command (one more command per file)
+        """
+        self.ftp_verify = verify
+        self.ftp_verify_size = query_size
+
+    def get_listing_cache_filename(self):
+        return '/'.join([self.get_meta_dir(), 'ftp_listing.json'])
+
+    def clear_listing_cache(self):
+        if os.path.isfile(self.get_listing_cache_filename()):
+            os.remove(self.get_listing_cache_filename())
+
+    def create_ftp_session(self):
+        """Return a new ftp session, reconnected after transient errors. Commands are counted in ftp_commands. While
+        connected, the session counts against the host's connection limit (see ftp_pool.set_max_host_connections)
+        """
+        return FTPSession(self.ftp_host, self.ftp_user, self.ftp_password, self.ftp_timeout, self.ftp_commands,
+                          self.ftp_retry_policy, port=self.ftp_port, semaphore=get_host_semaphore(self.ftp_host))
 
     def describe(self):
         print 'Local dir: {}'.format(self.local_dir)
@@ -144,6 +336,12 @@ class SatelliteBasedPrecipitationDownloadFTP(SatelliteBasedPrecipitationDownload
         print 'FTP password: {}'.format(self.ftp_password)
         print 'FTP dir: {}'.format(self.ftp_dir)
         print 'FTP timeout: {}'.format(self.ftp_timeout)
+        print 'FTP connections: {}'.format(self.ftp_connections)
+        print 'FTP listing cache: {}'.format(self.ftp_listing_cache)
+        print 'FTP predictive mode: {}'.format(self.ftp_predict)
+        print 'FTP retries: {}'.format(self.ftp_retry_policy.retries)
+        print 'FTP adaptive concurrency: {}'.format(self.ftp_adaptive)
+        print 'FTP verify: {}'.format(self.ftp_verify)
         print 'Directory length: {}'.format(self.dir_lens)
         print 'Prefix: {}'.format(self.prefix)
         print 'Suffix{}'.format(self.suffix)
@@ -165,107 +363,274 @@ class SatelliteBasedPrecipitationDownloadFTP(SatelliteBasedPrecipitationDownload
             dt = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
             time0 = print_verbose('Downloading from ftp://{} to {} ({})'.format(self.ftp_host, self.local_dir, dt))
 
-        local_files = self.get_local_files()
+        local_files = self.get_catalog()
+        self.remove_corrupt_files()
+        last_file = local_files.get_last_file()
 
         self.begin = begin
         if not self.begin:
-            if local_files and update:
-                self.begin = self.__class__.get_datetime_from_file_name(os.path.basename(local_files[-1]))
+            if last_file and update:
+                self.begin = self.__class__.get_datetime_from_file_name(os.path.basename(last_file))
             else:
                 self.begin = datetime.datetime(1, 1, 1, 0, 0)
         if end:
             self.end = end
+        self.ftp_commands.reset()
+        self.listing_cache = FTPListingCache(self.get_listing_cache_filename()) if self.ftp_listing_cache else None
+        self.session = self.create_ftp_session()
         try:
-            self.ftp = None
-            self.ftp = FTP(self.ftp_host, timeout=self.ftp_timeout)
-            self.ftp.login(self.ftp_user, self.ftp_password)
             self.download_ftp_files(local_files)
         finally:
-            if self.ftp:
-                self.ftp.close()
+            self.session.close()
+            if self.listing_cache:
+                self.listing_cache.save()
 
         if self.verbose:
             dt = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-            print_verbose('Downloading from ftp://{} to {} finished in {:.1f} minutes ({}).'.format(
-                self.ftp_host, self.local_dir, (time.time()-time0)/60.0, dt))
+            print_verbose('Downloading from ftp://{} to {} finished in {:.1f} minutes ({}). {} FTP commands.'.format(
+                self.ftp_host, self.local_dir, (time.time()-time0)/60.0, dt, self.ftp_commands.value))
 
     def download_ftp_files(self, local_files):
-        local_files = collections.deque(sorted(set([f.replace(self.local_dir, self.ftp_dir).replace(os.sep, '/')
-                                                    for f in local_files])))
-        local_file = local_files.pop() if local_files else None
-        ftp_dir_len = len(self.ftp_dir)
-        for ftp_filename in self.ftp_files():
-            # Reduce the local files size to improve further searches
-            while local_file and local_file < ftp_filename:
-                local_file = local_files.pop() if local_files else None
-            if ftp_filename not in local_files:
+        if self.ftp_predict and self.is_predictable() and self.begin > datetime.datetime(1, 1, 1, 0, 0):
+            self.download_predicted_ftp_files(local_files)
+            return
+        self.map_ftp_files(self.download_ftp_file, self.get_missing_ftp_files(local_files))
+
+    def map_ftp_files(self, func, items):
+        """Call func(ftp, item) for each item, using parallel sessions if ftp_connections > 1
+
+        Before the parallel sessions are opened, the listing session is closed (reconnected at the next listing), so
+        that its share of the host's connection limit is available to the pool.
+
+        :return: list of tuples (item, result)
+        """
+        if self.ftp_connections > 1:
+            items = list(items)  # lists the directories first, see ftp_files
+            self.session.reset()
+            pool = FTPConnectionPool(self.ftp_host, self.ftp_user, self.ftp_password, self.ftp_timeout,
+                                     self.ftp_connections, self.ftp_commands, self.ftp_retry_policy,
+                                     self.ftp_adaptive, self.ftp_port)
+            return pool.map(func, items)
+        results = []
+        for item in items:
+            try:
+                results.append((item, self.session.call(func, item)))
+            except Exception, e:
+                print_verbose('{}: {}'.format(item, e))
+                results.append((item, None))
+        return results
+
+    def get_ftp_dir_name(self, dt):
+        """Return the full path of the server directory (leaf) containing the files of datetime dt"""
+        ftp_dir = '/'.join([self.get_full_dir_name(dt).replace(self.local_dir, self.ftp_dir, 1), self.product_subfolder])
+        return '/' + '/'.join([f for f in ftp_dir.split('/') if f])
+
+    def valid_filename(self, filename):
+        return self.contains_prefix_and_suffix(filename)
+
+    def get_predicted_ftp_files(self, local_files):
+        """Yield tuples (ftp_dir, ftp_filenames) for the files expected on the server but not found locally.
+        ftp_filenames are the alternative names of the same file (see get_file_names_from_datetime)
+        """
+        end = min(self.end, datetime.datetime.now())
+        for dt in self.get_expected_datetimes(self.begin, end):
+            ftp_dir = self.get_ftp_dir_name(dt)
+            ftp_filenames = ['/'.join([ftp_dir, f]) for f in self.get_file_names_from_datetime(dt)]
+            if not [f for f in ftp_filenames if f.replace(self.ftp_dir, self.local_dir, 1) in local_files]:
+                yield ftp_dir, ftp_filenames
+
+    def download_predicted_ftp_file(self, ftp, item):
+        """Download the first existing file of item = (ftp_dir, ftp_filenames)
+
+        :return: True if downloaded, False if the transfer failed, None if none of the files was found
+        """
+        for ftp_filename in item[1]:
+            try:
+                return self.download_ftp_file(ftp, ftp_filename, raise_not_found=True)
+            except error_perm:
+                pass
+        return None
+
+    def download_predicted_ftp_files(self, local_files):
+        if not isinstance(local_files, LocalFileCatalog):
+            local_files = set(local_files)
+        results = self.map_ftp_files(self.download_predicted_ftp_file, self.get_predicted_ftp_files(local_files))
+        # Fallback: list the directories of the files not found
+        not_found_dirs = sorted(set([item[0] for item, result in results if result is None]))
+        for ftp_dir in not_found_dirs:
+            if self.verbose:
+                print_verbose('Predicted file(s) not found in {}: listing directory'.format(ftp_dir))
+            try:
+                entries = self.list_ftp_dir(ftp_dir)
+            except error_perm, _:
                 if self.verbose:
-                    time0 = print_verbose('{};'.format(ftp_filename[ftp_dir_len+1:]), True)
-                local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
-                if not os.path.isdir(os.path.dirname(local_filename)):
-                    os.makedirs(os.path.dirname(local_filename))
-                downloaded = True
-                with open(local_filename, "wb") as bfile:
-                    try:
-                        resp = self.ftp.retrbinary('RETR ' + ftp_filename, callback=bfile.write)
-                        resp = 'OK' if resp == '226 Transfer complete.' else resp
-                        if self.verbose:
-                            print_verbose('{}; {:.2f} seconds'.format(resp, time.time()-time0))
-                    except Exception, e:
-                        print e
-                        downloaded = False
-                if not downloaded:
-                    if os.path.isfile(local_filename):
-                        os.remove(local_filename)
-                    if self.verbose:
-                        print_verbose('in {} seconds (failed) '.format(time.time()-time0))
-            else:
+                    print_verbose('Folder {} not found'.format(ftp_dir))
+                continue
+            ftp_files = ['/'.join([ftp_dir, name]) for name, is_dir, _, _ in entries
+                         if not is_dir and self.contains_prefix_and_suffix(name)]
+            ftp_files = [f for f in ftp_files if self.begin <= self.__class__.get_datetime_from_file_name(f) <= self.end
+                         and f.replace(self.ftp_dir, self.local_dir, 1) not in local_files]
+            self.set_remote_entries(ftp_dir, entries)
+            self.map_ftp_files(self.download_ftp_file, ftp_files)
+
+    def get_missing_ftp_files(self, local_files):
+        """Yield the files found on the server but not locally
+
+        :param local_files: LocalFileCatalog or list of local file names
+        """
+        if not isinstance(local_files, LocalFileCatalog):
+            local_files = set(local_files)
+        for ftp_filename in self.ftp_files():
+            if ftp_filename.replace(self.ftp_dir, self.local_dir, 1) not in local_files:
+                yield ftp_filename
+            elif self.verbose:
                 print_verbose('{} already downloaded'.format(ftp_filename))
 
+    def download_ftp_file(self, ftp, ftp_filename, raise_not_found=False):
+        """Download a single file using the given ftp session
+
+        :param ftp: logged-in ftplib.FTP instance
+        :param ftp_filename: full path of the file on the server
+        :param raise_not_found: if True, error_perm is raised if the file is not found on the server
+        :return: True if the file was downloaded, otherwise False
+        :raise: transient errors (see ftp_pool.TRANSIENT_FTP_ERRORS), so that the transfer is resumed after reconnecting
+        """
+        time0 = time.time()
+        local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
+        local_dir = os.path.dirname(local_filename)
+        if not os.path.isdir(local_dir):
+            try:
+                os.makedirs(local_dir)
+            except OSError:  # created meanwhile by another session
+                if not os.path.isdir(local_dir):
+                    raise
+        downloaded = True
+        try:
+            # modification time from the listing, if any: no MDTM command per file (see transfer.retrieve_ftp_file)
+            remote_mtime = self.remote_entries.get(ftp_filename, (None, None))[1] or False
+            resp, size = retrieve_ftp_file_with_size(ftp, ftp_filename, local_filename, remote_mtime=remote_mtime)
+            resp = 'OK' if resp == '226 Transfer complete.' else resp
+            if self.verify_ftp_file(ftp, ftp_filename, local_filename, size) is False:
+                resp = 'corrupt, downloaded again at the next download'
+                downloaded = False
+            if self.verbose:
+                print_verbose('{}; {}; {:.2f} seconds'.format(
+                    ftp_filename[len(self.ftp_dir)+1:], resp, time.time()-time0))
+        except error_perm, e:
+            if raise_not_found and str(e).startswith('550'):
+                raise
+            print_verbose(e)
+            downloaded = False
+        except Exception, e:
+            print_verbose(e)
+            downloaded = False
+            if self.verbose:
+                print_verbose('{}; in {} seconds (failed, partial file kept) '.format(
+                    ftp_filename[len(self.ftp_dir)+1:], time.time()-time0))
+            if is_transient_ftp_error(e):
+                raise
+        if downloaded:
+            self.notify_file_downloaded(local_filename)
+        return downloaded
+
+    def verify_ftp_file(self, ftp, ftp_filename, local_filename, announced_size=None):
+        """Add the downloaded file to the catalog with its server size and modification time and the result of its
+        integrity check (see set_ftp_verify)
+
+        :param announced_size: size announced by the server for the transfer, used if the file was not listed
+        :return: True if valid, False if corrupt, None if not verified
+        :raise error_temp: if the file is incomplete. The file is renamed to its partial file, resumed when retried
+        """
+        remote_size, remote_mtime = self.remote_entries.get(ftp_filename, (None, None))
+        verified = None
+        if self.ftp_verify:
+            if remote_size is None:
+                remote_size = announced_size
+            if remote_size is None and self.ftp_verify_size:
+                remote_size = get_ftp_file_size(ftp, ftp_filename)
+            size = os.path.getsize(local_filename)
+            if remote_size is not None and size < remote_size:
+                replace_file(local_filename, part_filename(local_filename))
+                raise error_temp('426 {}: incomplete transfer ({} of {} bytes)'.format(ftp_filename, size,
+                                                                                      remote_size))
+            verified = verify_file(local_filename, remote_size)
+        self.add_to_catalog(local_filename, remote_size, remote_mtime, verified)
+        return verified
+
+    def list_ftp_dir(self, ftp_dir, closed=False):
+        """Return the entries [name, is_dir, size, timestamp] of ftp_dir
+
+        :param ftp_dir: full path of the directory on the server
+        :param closed: if True, the directory content is not expected to change and a cached listing is used if it
+            was taken after the directory closed. A directory listed while open is listed once more after it closed
+        :return: list of entries (see ftp_cache.parse_ftp_list_line)
+        :raise error_perm: if the directory does not exist and is not cached
+        """
+        if closed and self.listing_cache is not None:
+            entries = self.listing_cache.get(ftp_dir)
+            if entries is not None:
+                return entries
+        lines = self.session.call(list_ftp_dir_lines, ftp_dir)
+        entries = [parse_ftp_list_line(line) for line in lines if line.strip()]
+        if self.listing_cache is not None:
+            self.listing_cache.set(ftp_dir, entries, closed)
+        return entries
+
     def ftp_files(self):
         """Guarantees that the full path has no double slashes '//'
         :param begin:
         :return: file name with full path lead by '/'
         """
         full_dir_name = self.get_full_dir_name(self.begin).replace(self.local_dir, self.ftp_dir) if self.begin else ''
-        for ftp_dir in self.ftp_folders(self.ftp_dir, self.dir_lens, full_dir_name):
+        for ftp_dir, closed in self.ftp_folders(self.ftp_dir, self.dir_lens, full_dir_name):
 
             ftp_dir = '/'.join([ftp_dir, self.product_subfolder])
-            lines = []
+            entries = []
             try:
-                self.ftp.cwd(ftp_dir)
-                self.ftp.dir(lines.append)
+                entries = self.list_ftp_dir(ftp_dir, closed)
             except error_perm, _:
                 if self.verbose:
                     print_verbose('Folder {} not found'.format(ftp_dir))
-            ftp_files = ['/'.join([ftp_dir, f]) for f in self.get_ftp_file_names(lines)]
+            ftp_files = ['/'.join([ftp_dir, name]) for name, is_dir, _, _ in entries
+                         if not is_dir and self.contains_prefix_and_suffix(name)]
             ftp_files = [f for f in ftp_files if self.__class__.get_datetime_from_file_name(f) >= self.begin]
             ftp_files = [f for f in ftp_files if self.__class__.get_datetime_from_file_name(f) <= self.end]
+            self.set_remote_entries(ftp_dir, entries)
             # if not ftp_files:
             #     raise StopIteration
             for ftp_file in ftp_files:
                 yield '/' + '/'.join([f for f in ftp_file.split('/') if f])
 
-    def ftp_folders(self, ftp_dir, folder_lengths, dir_beg=None):
+    def set_remote_entries(self, ftp_dir, entries):
+        """Keep the size and modification time of the listed files (see set_ftp_verify)"""
+        for name, is_dir, size, timestamp in entries:
+            if not is_dir:
+                ftp_file = '/' + '/'.join([f for f in '/'.join([ftp_dir, name]).split('/') if f])
+                self.remote_entries[ftp_file] = (size, timestamp or None)
+
+    def ftp_folders(self, ftp_dir, folder_lengths, dir_beg=None, closed=False):
+        """Yield the leaf directories as tuples (directory, closed)
+
+        A directory is closed if its parent is closed or if a newer sibling exists on the server
+        """
         if not folder_lengths:
-            yield ftp_dir
+            yield ftp_dir, closed
             return
         folder_length = folder_lengths[0]  # current directory level
-        lines = []
-        self.ftp.cwd(ftp_dir)
-        self.ftp.dir(lines.append)
-        ftp_dirs = ['/'.join([ftp_dir, d]) for d in parse_ftp_dirs(folder_length, lines)]
+        entries = self.list_ftp_dir(ftp_dir, closed)
+        ftp_dirs = sorted(['/'.join([ftp_dir, d]) for d in parse_ftp_dir_entries(folder_length, entries)])
+        newest_dir = ftp_dirs[-1] if ftp_dirs else None
         if ftp_dirs:
             dir_beg0 = dir_beg[:len(ftp_dirs[0])]
             ftp_dirs = [ftp_dir for ftp_dir in ftp_dirs if ftp_dir >= dir_beg0]
         folder_lengths = folder_lengths[1:] if len(folder_lengths) > 1 else None  # next levels
         if folder_lengths:
             for dir0 in ftp_dirs:
-                for d in self.ftp_folders(dir0, folder_lengths, dir_beg):
+                for d in self.ftp_folders(dir0, folder_lengths, dir_beg, closed or dir0 != newest_dir):
                     yield d
         else:
             for d in ftp_dirs:
-                yield d
+                yield d, closed or d != newest_dir
 
     def get_ftp_file_names(self, lines):
         file_names = []
@@ -280,11 +645,15 @@ class SatelliteBasedPrecipitationDownloadFTP(SatelliteBasedPrecipitationDownload
 # =============================================================================
 # Auxiliary functions
 # =============================================================================
+_print_lock = threading.Lock()
+
+
 def print_verbose(msg, same_line=False):
-    if same_line:
-        print msg,
-    else:
-        print msg
+    with _print_lock:  # avoid interleaved lines from parallel ftp sessions
+        if same_line:
+            print msg,
+        else:
+            print msg
     return time.time()
 
 
@@ -294,6 +663,19 @@ def make_dir(d):
     return d
 
 
+def parse_ftp_dir_entries(folder_length, entries):
+    """Same as parse_ftp_dirs for entries [name, is_dir, size, timestamp] (see ftp_cache.parse_ftp_list_line)"""
+    dirs = []
+    for name, is_dir, _, _ in entries:
+        if is_dir and len(name) == folder_length:
+            try:
+                int(name)
+                dirs.append(name)
+            except ValueError:
+                pass
+    return dirs
+
+
 def parse_ftp_dirs(folder_length, lines):
     dirs = []
     for line in lines:
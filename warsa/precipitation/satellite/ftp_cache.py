@@ -0,0 +1,93 @@
+import os
+import json
+import datetime
+import threading
+
+
+def parse_ftp_list_line(line):
+    """Parse a line returned by the ftp LIST command (unix format)
+
+    :param line: e.g., '-rw-r--r--   1 ftp  ftp  1186761 Mar 12  2014 3B-HHR-E.MS.MRG.3IMERG.20140312-S000000-E002959...'
+    :return: list [name, is_dir, size, timestamp]. size is None and timestamp '' if not found in line
+    """
+    tokens = line.split()
+    name = os.path.basename(tokens[-1])  # basename for link (l)
+    size = None
+    timestamp = ''
+    if len(tokens) >= 9:
+        try:
+            size = int(tokens[4])
+        except ValueError:
+            pass
+        timestamp = ' '.join(tokens[5:8])
+    return [name, line.startswith('d'), size, timestamp]
+
+
+class FTPListingCache(object):
+    """On-disk cache of ftp directory listings keyed by the remote directory
+
+    Each directory entry is stored as [name, is_dir, size, timestamp] (see parse_ftp_list_line). A listing records
+    whether the directory was already closed (not expected to change) when it was listed: only such listings can be
+    used instead of listing the directory again (see get), a listing taken while the directory was still open may miss
+    files added afterwards.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.listings = dict()
+        self.modified = False
+        self.lock = threading.Lock()
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    self.listings = json.load(f)
+            except ValueError:
+                print 'Ignoring corrupt listing cache {}'.format(filename)
+                self.listings = dict()
+
+    def __contains__(self, ftp_dir):
+        return ftp_dir in self.listings
+
+    def get(self, ftp_dir, closed_only=True):
+        """Return the cached entries of ftp_dir or None if not cached
+
+        :param ftp_dir: full path of the directory on the server
+        :param closed_only: if True, None is returned for a listing taken while the directory was open
+        """
+        listing = self.listings.get(ftp_dir)
+        if listing is None or (closed_only and not listing.get('closed', False)):
+            return None
+        return listing['entries']
+
+    def set(self, ftp_dir, entries, closed=False):
+        """Cache the entries of ftp_dir
+
+        :param ftp_dir: full path of the directory on the server
+        :param entries: list of [name, is_dir, size, timestamp]
+        :param closed: True if the directory was closed when listed
+        """
+        with self.lock:
+            self.listings[ftp_dir] = {'listed': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                      'closed': bool(closed), 'entries': entries}
+            self.modified = True
+
+    def clear(self):
+        with self.lock:
+            self.listings = dict()
+            self.modified = True
+
+    def save(self):
+        """Write the cache if modified. The file is replaced atomically"""
+        with self.lock:
+            if not self.modified:
+                return
+            d = os.path.dirname(self.filename)
+            if d and not os.path.isdir(d):
+                os.makedirs(d)
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'w') as f:
+                json.dump(self.listings, f)
+            if os.path.isfile(self.filename):
+                os.remove(self.filename)  # os.rename does not overwrite on Windows
+            os.rename(tmp_filename, self.filename)
+            self.modified = False
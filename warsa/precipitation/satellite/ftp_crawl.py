@@ -0,0 +1,99 @@
+import os
+from warsa.precipitation.satellite.ftp_cache import parse_ftp_list_line
+from warsa.precipitation.satellite.ftp_pool import FTPConnectionPool, list_ftp_dir_lines
+
+
+def _list_entries(ftp, ftp_dir):
+    return [parse_ftp_list_line(line) for line in list_ftp_dir_lines(ftp, ftp_dir) if line.strip()]
+
+
+class FTPTreeCrawler(object):
+    """Parallel listing of a directory tree organized in levels, e.g., Y/YM/YMD/YMDH
+
+    The tree is crawled level by level: all directories of a level are listed at once using up to connections
+    parallel sessions (see ftp_pool.FTPConnectionPool), so that the number of sequential round trips depends on the
+    depth of the tree, not on the number of directories. Listings of directories not expected to change anymore
+    (closed) are taken from the listing cache if they were listed after closing (see ftp_cache.FTPListingCache.get).
+
+    Usage:
+        crawler = FTPTreeCrawler(host, 'anonymous', email, connections=4, listing_cache=FTPListingCache(filename))
+        files = crawler.crawl(ftp_root, [valid_y, valid_ym], lambda ftp_dir, name: name.endswith('.grb2'))
+    """
+
+    def __init__(self, host, user=None, password=None, timeout=600, connections=4, listing_cache=None, counter=None,
+                 retry_policy=None, port=0):
+        """
+
+        :param host: ftp host name
+        :param user: ftp user name
+        :param password: ftp password
+        :param timeout: ftp timeout in seconds
+        :param connections: maximum number of parallel sessions
+        :param listing_cache: ftp_cache.FTPListingCache or None
+        :param counter: ftp_pool.FTPCommandCounter or None
+        :param retry_policy: utils.retry.RetryPolicy or None
+        :param port: ftp port, 0 for the default port
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.connections = max(1, int(connections))
+        self.listing_cache = listing_cache
+        self.counter = counter
+        self.retry_policy = retry_policy
+        self.port = port
+
+    def list_dirs(self, ftp_dirs, closed=None):
+        """List the directories ftp_dirs in parallel
+
+        :param ftp_dirs: list of full paths of directories on the server
+        :param closed: function closed(ftp_dir) returning True if ftp_dir is not expected to change, default all open
+        :return: dictionary ftp_dir -> list of entries [name, is_dir, size, timestamp]. Directories that could not be
+            listed (e.g., not found) are missing
+        """
+        listings = dict()
+        to_list = []
+        closed_dirs = set([ftp_dir for ftp_dir in ftp_dirs if closed is not None and closed(ftp_dir)])
+        for ftp_dir in ftp_dirs:
+            entries = None
+            if self.listing_cache is not None and ftp_dir in closed_dirs:
+                entries = self.listing_cache.get(ftp_dir)
+            if entries is not None:
+                listings[ftp_dir] = entries
+            else:
+                to_list.append(ftp_dir)
+        pool = FTPConnectionPool(self.host, self.user, self.password, self.timeout, self.connections, self.counter,
+                                 self.retry_policy, adaptive=False, port=self.port)
+        results = pool.map(_list_entries, to_list)
+        for ftp_dir, entries in results:
+            if entries is None:
+                continue
+            listings[ftp_dir] = entries
+            if self.listing_cache is not None:
+                self.listing_cache.set(ftp_dir, entries, ftp_dir in closed_dirs)
+        return listings
+
+    def crawl(self, root_dir, valid_dirs, valid_file, closed=None):
+        """Return the files found below root_dir
+
+        :param root_dir: full path of the root directory on the server
+        :param valid_dirs: list of functions valid_dir(name), one per directory level below root_dir. Only the
+            directories for which valid_dir returns True are listed
+        :param valid_file: function valid_file(ftp_dir, name) selecting the files in the directories of the last level
+        :param closed: see list_dirs
+        :return: sorted list of tuples (ftp_filename, size, timestamp), ftp_filename is the full path lead by '/'
+        """
+        ftp_dirs = ['/' + '/'.join([f for f in root_dir.split('/') if f])]
+        for valid_dir in valid_dirs:
+            listings = self.list_dirs(ftp_dirs, closed)
+            ftp_dirs = sorted(['/'.join([ftp_dir, name]).replace('//', '/')
+                               for ftp_dir, entries in listings.items()
+                               for name, is_dir, _, _ in entries if is_dir and valid_dir(name)])
+        files = []
+        for ftp_dir, entries in self.list_dirs(ftp_dirs, closed).items():
+            for name, is_dir, size, timestamp in entries:
+                name = os.path.basename(name)
+                if not is_dir and valid_file(ftp_dir, name):
+                    files.append(('/'.join([ftp_dir, name]).replace('//', '/'), size, timestamp))
+        return sorted(files)
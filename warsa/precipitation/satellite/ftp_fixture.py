@@ -0,0 +1,206 @@
+import os
+import bz2
+import gzip
+import shutil
+import logging
+import tempfile
+import datetime
+import ftplib
+import threading
+import pandas as pd
+from StringIO import StringIO
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import FTPServer
+except ImportError:
+    DummyAuthorizer = FTPHandler = FTPServer = None
+
+
+def _chirps_daily(local_dir):
+    from warsa.precipitation.satellite.chirps.download import Chirps20GlobalDaily05TifFTP
+    return Chirps20GlobalDaily05TifFTP(local_dir)
+
+
+def _cmorph_3hly(local_dir):
+    from warsa.precipitation.satellite.cmorph.download import CMorphV0x025deg3hlyFTP
+    return CMorphV0x025deg3hlyFTP(local_dir)
+
+
+def _trmm_3b42rt(local_dir):
+    from warsa.precipitation.satellite.trmm.download import TRMMopen3B42RTv7x3hFTP
+    return TRMMopen3B42RTv7x3hFTP(local_dir)
+
+
+def _gpm_late(local_dir):
+    from warsa.precipitation.satellite.gpm.download import GPMImerg3BHHRlateFTP
+    return GPMImerg3BHHRlateFTP(local_dir, None, None)
+
+
+def _gpm_late_file_names(dt):
+    # 3B-HHR-L.MS.MRG.3IMERG.20150307-S000000-E002959.0000.V03E.RT-H5
+    e = dt + datetime.timedelta(minutes=29, seconds=59)
+    return [dt.strftime('3B-HHR-L.MS.MRG.3IMERG.%Y%m%d-S%H%M%S-E') + e.strftime('%H%M%S') +
+            '.{:04d}.V05B.RT-H5'.format(dt.hour * 60 + dt.minute)]
+
+
+# layout -> (function(local_dir) returning the download object, file frequency, function(datetime) returning the file
+# names or None to use the download class' get_file_names_from_datetime)
+LAYOUTS = {
+    'chirps': (_chirps_daily, '1D', None),
+    'cmorph': (_cmorph_3hly, '1D', None),
+    'trmm': (_trmm_3b42rt, '3H', None),
+    'gpm': (_gpm_late, '30min', _gpm_late_file_names),
+}
+
+
+def create_download_object(layout, local_dir):
+    """Return the download object of the product used for layout (see LAYOUTS)"""
+    return LAYOUTS[layout][0](local_dir)
+
+
+def create_synthetic_tree(layout, server_root, n_files, file_size=1024, begin=datetime.datetime(2010, 1, 1)):
+    """Create on the local disk the directory tree of a product as found on its ftp server
+
+    File names and directories are derived from the product's download class. Files contain file_size random bytes,
+    gzip or bz2 compressed if the file name ends with .gz or .bz2, so that they pass catalog.verify_file.
+
+    :param layout: key of LAYOUTS, e.g., 'cmorph'
+    :param server_root: local directory served as the ftp root
+    :param n_files: number of files
+    :param file_size: size of each file in bytes
+    :param begin: datetime of the first file
+    :return: list of the created file names relative to server_root, starting with '/'
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        download_obj = create_download_object(layout, tmp_dir)
+        get_file_names = LAYOUTS[layout][2] or download_obj.get_file_names_from_datetime
+        data = os.urandom(file_size)
+        compressed = dict()
+        ftp_filenames = []
+        for dt in pd.date_range(begin, periods=n_files, freq=LAYOUTS[layout][1]):
+            dt = dt.to_pydatetime()
+            ftp_dir = '/'.join([download_obj.get_full_dir_name(dt).replace(download_obj.local_dir,
+                                                                           download_obj.ftp_dir, 1),
+                                download_obj.product_subfolder])
+            ftp_filename = '/' + '/'.join([f for f in ftp_dir.split('/') + [get_file_names(dt)[0]] if f])
+            filename = server_root + ftp_filename
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            ext = os.path.splitext(filename)[1]
+            if ext not in compressed:
+                compressed[ext] = compress(data, ext)
+            with open(filename, 'wb') as f:
+                f.write(compressed[ext])
+            ftp_filenames.append(ftp_filename)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return ftp_filenames
+
+
+def compress(data, ext):
+    """Return data compressed according to the file extension ext (.gz, .bz2), otherwise data"""
+    if ext == '.gz':
+        s = StringIO()
+        gf = gzip.GzipFile(fileobj=s, mode='wb')
+        gf.write(data)
+        gf.close()
+        return s.getvalue()
+    if ext == '.bz2':
+        return bz2.compress(data)
+    return data
+
+
+class LocalFTPServer(object):
+    """In-process ftp server (pyftpdlib) serving a local directory read-only
+
+    Usage:
+        with LocalFTPServer(server_root) as server:
+            download_obj.set_ftp_host(server.host, server.port)
+            download_obj.download()
+    """
+
+    def __init__(self, root_dir, user=None, password=None, host='127.0.0.1', port=0):
+        """
+
+        :param root_dir: local directory served as the ftp root
+        :param user: user name or None for anonymous login
+        :param password: password of user
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        """
+        if FTPServer is None:
+            raise ImportError('LocalFTPServer requires pyftpdlib (pip install pyftpdlib)')
+        self.root_dir = root_dir
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        logger = logging.getLogger('pyftpdlib')
+        if not logger.handlers:
+            logger.addHandler(logging.NullHandler())  # otherwise serve_forever configures logging at level INFO
+        logger.setLevel(logging.WARNING)
+        authorizer = DummyAuthorizer()
+        if self.user:
+            authorizer.add_user(self.user, self.password, self.root_dir, perm='elr')
+        else:
+            authorizer.add_anonymous(self.root_dir)
+        class LocalFTPHandler(FTPHandler):  # FTPHandler is a classic class under Python 2
+            pass
+        LocalFTPHandler.authorizer = authorizer
+        self.server = FTPServer((self.host, self.port), LocalFTPHandler)
+        self.host, self.port = self.server.address[:2]
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while not self.stop_event.is_set():
+            self.server.serve_forever(timeout=0.01, blocking=False, handle_exit=False)
+        self.server.close_all()
+
+    def stop(self):
+        if self.thread:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+
+def smoke_check(layout, n_files=5):
+    """Start a LocalFTPServer on a synthetic tree of layout and list each of its directories with ftplib
+
+    :return: list of the file names found, relative to the ftp root, starting with '/'
+    :raise AssertionError: if the files listed differ from the files created
+    """
+    server_root = tempfile.mkdtemp()
+    try:
+        ftp_filenames = create_synthetic_tree(layout, server_root, n_files)
+        found = []
+        with LocalFTPServer(server_root) as server:
+            ftp = ftplib.FTP()
+            ftp.connect(server.host, server.port, timeout=10)
+            ftp.login()
+            try:
+                for ftp_dir in sorted(set([os.path.dirname(f) for f in ftp_filenames])):
+                    found += ['/'.join([ftp_dir, os.path.basename(n)]) for n in ftp.nlst(ftp_dir)]
+            finally:
+                ftp.quit()
+        assert sorted(found) == sorted(ftp_filenames), (layout, sorted(found), sorted(ftp_filenames))
+        return found
+    finally:
+        shutil.rmtree(server_root, ignore_errors=True)
@@ -0,0 +1,329 @@
+import time
+import socket
+import threading
+import _strptime  # datetime.strptime imports it lazily, which is not thread-safe
+from Queue import Queue, Empty
+from ftplib import FTP, error_temp, error_reply, error_proto
+from warsa.utils.retry import RetryPolicy
+
+
+DEFAULT_MAX_HOST_CONNECTIONS = 4
+
+# Errors after which the session is reconnected and the command retried: timeouts, dropped connections, 4xx replies
+# (e.g., '421 Too many connections'). error_perm (5xx, e.g., '550 file not found') is not transient
+TRANSIENT_FTP_ERRORS = (error_temp, error_reply, error_proto, EOFError, socket.error)
+
+_host_lock = threading.Lock()
+_host_limits = dict()
+_host_semaphores = dict()
+
+
+def set_max_host_connections(host, n):
+    """Set the maximum number of simultaneous connections to host, shared by all pools in this process
+
+    Pools already created keep the limit valid at the time of their creation.
+
+    :param host: ftp host name, e.g., 'ftp.cpc.ncep.noaa.gov'
+    :param n: maximum number of connections (at least 1)
+    """
+    with _host_lock:
+        _host_limits[host] = max(1, int(n))
+        _host_semaphores.pop(host, None)
+
+
+def get_max_host_connections(host):
+    return _host_limits.get(host, DEFAULT_MAX_HOST_CONNECTIONS)
+
+
+class FTPCommandCounter(object):
+    """Thread-safe counter of ftp commands sent by one or more sessions"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def increment(self):
+        with self.lock:
+            self.value += 1
+
+    def reset(self):
+        with self.lock:
+            self.value = 0
+
+
+class CountingFTP(FTP):
+    """ftplib.FTP counting each command sent to the server (all commands pass through putcmd)"""
+
+    def __init__(self, host='', user='', passwd='', acct='', timeout=600, counter=None, port=0):
+        self.counter = counter
+        FTP.__init__(self, timeout=timeout)
+        if host:
+            self.connect(host, port)
+            if user:
+                self.login(user, passwd, acct)
+
+    def putcmd(self, line):
+        if self.counter is not None:
+            self.counter.increment()
+        FTP.putcmd(self, line)
+
+
+def is_transient_ftp_error(e):
+    return isinstance(e, TRANSIENT_FTP_ERRORS)
+
+
+def list_ftp_dir_lines(ftp, ftp_dir):
+    """Return the lines of the LIST command in ftp_dir"""
+    lines = []
+    ftp.cwd(ftp_dir)
+    ftp.dir(lines.append)
+    return lines
+
+
+class FTPSession(object):
+    """A logged-in ftp session which is (re)connected on demand
+
+    Commands are sent through call(). After a transient error (see TRANSIENT_FTP_ERRORS), the session is closed,
+    reconnected, logged in again and the command is retried following the retry policy. If a semaphore is given, e.g.,
+    get_host_semaphore(host), it is acquired while the session is connected, so that the session counts against the
+    per-host limit shared with the pools.
+    """
+
+    def __init__(self, host, user=None, password=None, timeout=600, counter=None, retry_policy=None, on_error=None,
+                 port=0, semaphore=None):
+        """
+
+        :param host: ftp host name
+        :param user: user name or None for anonymous
+        :param password: password
+        :param timeout: socket timeout in seconds
+        :param counter: FTPCommandCounter or None
+        :param retry_policy: RetryPolicy, default RetryPolicy()
+        :param on_error: function(exception) called after each transient error, e.g., AdaptiveConcurrency.failure
+        :param port: ftp port, 0 for the default port (21)
+        :param semaphore: semaphore acquired when connecting and released when the connection is closed, or None
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.counter = counter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.on_error = on_error
+        self.port = port
+        self.semaphore = semaphore
+        self.ftp = None
+        self.errors = 0
+
+    def get(self):
+        """Return the logged-in ftplib.FTP instance, connecting if needed"""
+        if self.ftp is None:
+            if self.semaphore is not None:
+                self.semaphore.acquire()
+            try:
+                ftp = CountingFTP(self.host, timeout=self.timeout, counter=self.counter, port=self.port)
+                try:
+                    ftp.login(self.user, self.password)
+                except Exception:
+                    ftp.close()
+                    raise
+            except Exception:
+                if self.semaphore is not None:
+                    self.semaphore.release()
+                raise
+            self.ftp = ftp
+        return self.ftp
+
+    def connect(self):
+        """Connect and log in, retrying after transient errors"""
+        return self.call(lambda ftp: ftp)
+
+    def reset(self):
+        """Close the connection. The next call reconnects"""
+        ftp, self.ftp = self.ftp, None
+        FTPConnectionPool.disconnect(ftp)
+        if ftp is not None and self.semaphore is not None:
+            self.semaphore.release()
+
+    def close(self):
+        self.reset()
+
+    def call(self, func, *args):
+        """Return func(ftp, *args), retrying after transient errors
+
+        :raise: the last exception if all retries failed, or immediately any non-transient exception
+        """
+        delays = self.retry_policy.delays()
+        while True:
+            try:
+                return func(self.get(), *args)
+            except TRANSIENT_FTP_ERRORS, e:
+                self.errors += 1
+                self.reset()
+                if self.on_error:
+                    self.on_error(e)
+                delay = next(delays, None)
+                if delay is None:
+                    raise
+                print '{}: {} (reconnecting in {:.0f} seconds)'.format(self.host, e, delay)
+                time.sleep(delay)
+
+
+class AdaptiveConcurrency(object):
+    """AIMD limit of the number of simultaneous transfers
+
+    The limit is increased by one after each window of limit successful transfers whose throughput (transfers per
+    second) did not drop compared to the previous window, decreased by one if it dropped, and halved after each
+    transient error.
+    """
+
+    def __init__(self, maximum, initial=None, tolerance=0.05):
+        """
+
+        :param maximum: maximum number of simultaneous transfers
+        :param initial: initial limit, default half of maximum
+        :param tolerance: relative throughput drop still considered as no drop
+        """
+        self.maximum = max(1, int(maximum))
+        self.limit = min(self.maximum, max(1, int(initial) if initial else self.maximum // 2))
+        self.tolerance = tolerance
+        self.active = 0
+        self.condition = threading.Condition()
+        self.rate = None
+        self.window_begin = time.time()
+        self.window_count = 0
+
+    def try_acquire(self):
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def success(self):
+        with self.condition:
+            self.window_count += 1
+            if self.window_count < self.limit:
+                return
+            rate = self.window_count / max(time.time() - self.window_begin, 1e-6)
+            if self.rate is None or rate >= self.rate * (1.0 - self.tolerance):
+                self.limit = min(self.maximum, self.limit + 1)
+            else:
+                self.limit = max(1, self.limit - 1)
+            self.rate = rate
+            self.window_begin = time.time()
+            self.window_count = 0
+            self.condition.notify_all()
+
+    def failure(self, _=None):
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.rate = None
+            self.window_begin = time.time()
+            self.window_count = 0
+
+
+def get_host_semaphore(host):
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(_host_limits.get(host, DEFAULT_MAX_HOST_CONNECTIONS))
+        return _host_semaphores[host]
+
+
+class FTPConnectionPool(object):
+    """A pool of logged-in FTP sessions to the same host
+
+    Each worker thread owns one session (see FTPSession) for its lifetime. The number of workers is bounded by the
+    pool size. The number of open connections is bounded by the per-host limit (see set_max_host_connections), which is
+    shared by all pools and sessions connecting to the same host: a session holds a share of the limit only while
+    connected. If adaptive, the number of simultaneous transfers is further adjusted to the observed throughput and
+    errors (see AdaptiveConcurrency); idle sessions are closed, which frees their share of the host's limit.
+    """
+
+    def __init__(self, host, user=None, password=None, timeout=600, size=1, counter=None, retry_policy=None,
+                 adaptive=True, port=0):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.size = max(1, int(size))
+        self.counter = counter
+        self.retry_policy = retry_policy
+        self.adaptive = adaptive
+        self.port = port
+        self.concurrency = None
+
+    @staticmethod
+    def disconnect(ftp):
+        if ftp:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+    def map(self, func, items):
+        """Call func(ftp, item) for each item using up to size parallel sessions
+
+        func is retried after transient errors on a reconnected session (see FTPSession.call).
+
+        :param func: function with arguments (ftp, item)
+        :param items: iterable of items
+        :return: list of tuples (item, result) in order of completion. result is None if func raised an exception
+        """
+        items_queue = Queue()
+        n_items = 0
+        for item in items:
+            items_queue.put(item)
+            n_items += 1
+        if n_items == 0:
+            return []
+        semaphore = get_host_semaphore(self.host)
+        results = Queue()
+        n_workers = min(self.size, n_items)
+        concurrency = AdaptiveConcurrency(n_workers) if self.adaptive and n_workers > 1 else None
+        self.concurrency = concurrency
+
+        def worker():
+            session = FTPSession(self.host, self.user, self.password, self.timeout, self.counter, self.retry_policy,
+                                 concurrency.failure if concurrency else None, self.port, semaphore)
+            try:
+                while True:
+                    try:
+                        item = items_queue.get_nowait()
+                    except Empty:
+                        return
+                    if concurrency and not concurrency.try_acquire():
+                        session.reset()  # do not keep idle connections
+                        concurrency.acquire()
+                    try:
+                        results.put((item, session.call(func, item)))
+                        if concurrency:
+                            concurrency.success()
+                    except Exception, e:
+                        print '{}: {}'.format(item, e)
+                        session.reset()
+                        results.put((item, None))
+                    finally:
+                        if concurrency:
+                            concurrency.release()
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(n_workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return [results.get() for _ in range(results.qsize())]
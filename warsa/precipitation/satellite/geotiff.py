@@ -0,0 +1,141 @@
+import numpy as np
+from osgeo import gdal
+
+# Internally tiled, compressed GeoTIFF with overviews (see write_geotiff), e.g. Rasterizer(..., geotiff_profile=TILED)
+TILED = {'compress': 'DEFLATE', 'blocksize': 256, 'overviews': [2, 4, 8]}
+
+# nodata of the scaled integer (UInt16) rasters, see scale_array
+SCALED_NODATA = 65535
+
+
+def is_compression_supported(compress):
+    """Return True if the GTiff driver of this GDAL build supports the compression, e.g., 'ZSTD' (GDAL >= 2.3)"""
+    options = gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST') or ''
+    return compress.upper() in options.upper()
+
+
+def get_creation_options(data_type, compress='DEFLATE', blocksize=256, predictor=True, overviews=False):
+    """Return the GTiff creation options of a tiled, compressed GeoTIFF
+
+    :param data_type: gdal data type of the bands, selects the predictor (floating point or horizontal differencing)
+    :param compress: 'DEFLATE', 'ZSTD' or 'LZW'. ZSTD falls back to DEFLATE if not supported by GDAL
+    :param blocksize: width and height of the tiles
+    :param predictor: if True, a predictor is used, which improves the compression of smooth fields
+    :param overviews: if True, the overviews of the source are copied after the tiles of the full resolution
+    """
+    if not is_compression_supported(compress):
+        compress = 'DEFLATE'
+    options = ['TILED=YES', 'BLOCKXSIZE={}'.format(blocksize), 'BLOCKYSIZE={}'.format(blocksize),
+               'COMPRESS={}'.format(compress.upper())]
+    if predictor:
+        is_float = data_type in (gdal.GDT_Float32, gdal.GDT_Float64)
+        options.append('PREDICTOR={}'.format(3 if is_float else 2))
+    if compress.upper() == 'DEFLATE':
+        options.append('ZLEVEL=6')
+    if overviews:
+        options.append('COPY_SRC_OVERVIEWS=YES')
+    return options
+
+
+def write_geotiff(dataset, output_filename, compress='DEFLATE', blocksize=256, predictor=True, overviews=None,
+                  resampling='AVERAGE'):
+    """Write dataset as internally tiled, compressed GeoTIFF, optionally with overviews
+
+    The overviews are built on an in-memory copy of dataset and copied with the tiles, so that the overviews precede
+    the full resolution data in the file as in a cloud optimized GeoTIFF. dataset is not modified.
+
+    :param dataset: gdal dataset
+    :param output_filename: full path of the GeoTIFF
+    :param compress: see get_creation_options
+    :param blocksize: see get_creation_options
+    :param predictor: see get_creation_options
+    :param overviews: list of decimation factors, e.g., [2, 4, 8], or None
+    :param resampling: resampling of the overviews, default 'AVERAGE' (nodata cells are ignored)
+    """
+    nx, ny = dataset.RasterXSize, dataset.RasterYSize
+    overviews = [f for f in overviews or [] if nx // f > 0 and ny // f > 0]
+    if overviews:
+        dataset = gdal.GetDriverByName('MEM').CreateCopy('', dataset)
+        dataset.BuildOverviews(resampling, overviews)
+    options = get_creation_options(dataset.GetRasterBand(1).DataType, compress, blocksize, predictor,
+                                   bool(overviews))
+    out = gdal.GetDriverByName('GTiff').CreateCopy(output_filename, dataset, options=options)
+    if out is None:
+        raise IOError('Unable to write {}'.format(output_filename))
+    out.FlushCache()
+    out = None
+
+
+def scale_array(arr, nodata, scale_factor, offset=0.0):
+    """Return arr as uint16 scaled integers round((arr - offset) / scale_factor)
+
+    Precipitation is not negative: values below offset are set to 0 and values above the range (e.g., 655.34 mm for a
+    scale factor of 0.01) to the largest valid value.
+
+    :param arr: array of floating point values
+    :param nodata: nodata of arr or None. nodata and NaN become SCALED_NODATA
+    :param scale_factor: e.g., 0.01 for 0.01 mm precision
+    :param offset: value of the integer 0
+    :return: array of uint16
+    """
+    arr = np.asarray(arr)
+    invalid = np.isnan(arr)
+    if nodata is not None:
+        invalid |= arr == np.asarray(nodata).astype(arr.dtype)  # nodata as stored, e.g., rounded to float32
+    arr = arr.astype(np.float64)
+    scaled = np.clip(np.round((np.where(invalid, offset, arr) - offset) / scale_factor), 0, SCALED_NODATA - 1)
+    scaled = scaled.astype(np.uint16)
+    scaled[invalid] = SCALED_NODATA
+    return scaled
+
+
+def unscale_array(arr, nodata, scale_factor=None, offset=None):
+    """Return arr as float32 with nodata as NaN, unscaled (arr * scale_factor + offset) if scale_factor or offset is
+    given, e.g., from band.GetScale() and band.GetOffset()
+    """
+    arr = np.asarray(arr)
+    invalid = arr == np.asarray(nodata).astype(arr.dtype) if nodata is not None else np.isnan(arr)
+    arr = arr.astype(np.float32)
+    if scale_factor not in (None, 1.0) or offset not in (None, 0.0):
+        arr = arr * np.float32(scale_factor if scale_factor is not None else 1.0) + np.float32(offset or 0.0)
+    arr[invalid] = np.nan
+    return arr
+
+
+def create_scaled_dataset(dataset, scale_factor, offset=0.0):
+    """Return a MEM dataset of dataset stored as UInt16 scaled integers (see scale_array), with scale, offset and
+    nodata set on each band, so that GDAL based readers can unscale the values
+    """
+    nx, ny, n = dataset.RasterXSize, dataset.RasterYSize, dataset.RasterCount
+    mem = gdal.GetDriverByName('MEM').Create('', nx, ny, n, gdal.GDT_UInt16)
+    mem.SetGeoTransform(dataset.GetGeoTransform())
+    mem.SetProjection(dataset.GetProjection())
+    for i in range(1, n + 1):
+        band = dataset.GetRasterBand(i)
+        out_band = mem.GetRasterBand(i)
+        out_band.WriteArray(scale_array(band.ReadAsArray(), band.GetNoDataValue(), scale_factor, offset))
+        out_band.SetNoDataValue(SCALED_NODATA)
+        out_band.SetScale(scale_factor)
+        out_band.SetOffset(offset)
+    return mem
+
+
+def write_output_geotiff(dataset, output_filename, profile=None, scale_factor=None, offset=0.0):
+    """Write dataset as GeoTIFF, optionally as scaled integers (see create_scaled_dataset)
+
+    :param dataset: gdal dataset
+    :param output_filename: full path of the GeoTIFF
+    :param profile: None for a GeoTIFF with the default creation options or a dictionary of keys for write_geotiff
+    :param scale_factor: None to keep the data type or the scale factor of the scaled integers, e.g., 0.01
+    :param offset: offset of the scaled integers
+    """
+    if scale_factor:
+        dataset = create_scaled_dataset(dataset, scale_factor, offset)
+    if profile is None:
+        out = gdal.GetDriverByName('GTiff').CreateCopy(output_filename, dataset)
+        if out is None:
+            raise IOError('Unable to write {}'.format(output_filename))
+        out.FlushCache()
+        out = None
+    else:
+        write_geotiff(dataset, output_filename, **profile)
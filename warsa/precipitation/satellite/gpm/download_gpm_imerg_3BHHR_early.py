@@ -1,9 +1,11 @@
 import os
 import time
 import datetime
-import calendar
+import numpy as np
 from ftplib import FTP, error_perm
 from collections import OrderedDict
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file
+from warsa.utils.partfile import is_part_file
 
 
 class GPMImerg3BHHRearlyFTP(object):
@@ -28,6 +30,7 @@ class GPMImerg3BHHRearlyFTP(object):
 
         self.local_dir = local_dir.strip()
         self.verbose = True
+        self.file_listeners = []
 
         def p(s, same_line=False):
             if same_line:
@@ -37,6 +40,17 @@ class GPMImerg3BHHRearlyFTP(object):
             return time.time()
         self.print_verbose = p
 
+    def add_file_listener(self, listener):
+        """Register a function called with the full path of each downloaded file, e.g., RasterizePipeline.put"""
+        self.file_listeners.append(listener)
+
+    def remove_file_listener(self, listener):
+        self.file_listeners.remove(listener)
+
+    def get_ftp_dir_name(self, dt):
+        """Return the full path of the server directory containing the files of datetime dt"""
+        return '{}{}'.format(self.ftp_dir, dt.strftime('%Y%m'))
+
     def get_full_dir_name(self, dt):
         return '/'.join([self.local_dir, str(dt.year), str(dt.year)+str(dt.month).zfill(2)])
 
@@ -55,45 +69,34 @@ class GPMImerg3BHHRearlyFTP(object):
         return f0 + f1[1:5]
 
     def get_local_files(self):
-        filenames = [['/'.join([root, f]) for f in files] for root, dirs, files in os.walk(self.local_dir) if files]
+        filenames = [['/'.join([root, f]) for f in files if not is_part_file(f)]
+                     for root, dirs, files in os.walk(self.local_dir) if files]
         return sorted([f for filenames0 in filenames for f in filenames0])
 
     def get_missing_datetime(self, datetime_begin=None, datetime_end=None):
+        """Return the timestamps of the files between datetime_begin and datetime_end not found locally
+
+        :return: OrderedDict year and month 'YYYYmm' -> set of timestamps 'YYYYmmddHHMM' (see filename_to_timestamp)
+        """
         # Datetime from local files
         print self.local_dir
-        datetime_local = [self.filename_to_timestamp(f) for _, _, fs in os.walk(self.local_dir) if fs for f in fs]
+        datetime_local = np.array([int(self.filename_to_timestamp(f)) for _, _, fs in os.walk(self.local_dir) if fs
+                                   for f in fs if not is_part_file(f) and self.valid_filename(f)], dtype=np.int64)
 
-        # 3B42RT.2000030100.7R2.bin.gz
         # Datetime from files expected to be found on the server
         if not datetime_begin:
             datetime_begin = datetime.datetime(2014, 3, 12, 0, 0)
         if not datetime_end:
             datetime_end = datetime.datetime.now()
-        y0, y1 = str(datetime_begin.year), str(datetime_end.year)
-        m0, m1 = str(datetime_begin.month).zfill(2), str(datetime_end.month).zfill(2)
-        d0, d1 = str(datetime_begin.day).zfill(2), str(datetime_end.day).zfill(2)
-        h0, h1 = str(datetime_begin.hour).zfill(2), str(datetime_end.hour).zfill(2)
-        datetime_server = list()
-        for y in range(2000, datetime_end.year + 1):
-            ys = str(y)
-            for m in range(1, 13):
-                ms = str(m).zfill(2)
-                for d in range(1, calendar.monthrange(y, m)[1] + 1):
-                    ds = str(d).zfill(2)
-                    for h in range(0, 24):
-                        datetime_server.append('{}{}{}{}00'.format(ys, ms, ds, str(h).zfill(2)))
-                        datetime_server.append('{}{}{}{}30'.format(ys, ms, ds, str(h).zfill(2)))
-        idx0 = datetime_server.index('{}{}{}{}00'.format(y0, m0, d0, h0))
-        idx1 = datetime_server.index('{}{}{}{}00'.format(y1, m1, d1, h1))
-        datetime_server = datetime_server[:idx1 + 1]
-        datetime_server = datetime_server[idx0:]
-        fs = sorted(list(set(datetime_server).difference(set(datetime_local))))
+        datetime_server = half_hourly_timestamps(datetime_begin, datetime_end)
+        # local timestamps are not unique, e.g., V05B and V06B files of the same half hour
+        missing = np.setdiff1d(datetime_server, np.unique(datetime_local), assume_unique=True)  # sorted
         datetime_missing = OrderedDict()
-        for f in fs:
-            yearmonth = f[:6]
-            if yearmonth not in datetime_missing:
-                datetime_missing[yearmonth] = list()
-            datetime_missing[yearmonth].append(f)
+        if not len(missing):
+            return datetime_missing
+        yearmonth, idx = np.unique(missing // 1000000, return_index=True)
+        for ym, records in zip(yearmonth, np.split(missing.astype('S12'), idx[1:])):
+            datetime_missing[str(ym)] = set(records.tolist())
         return datetime_missing
 
     def download(self, update=False, verbose=True, begin=None, end=None):
@@ -131,23 +134,32 @@ class GPMImerg3BHHRearlyFTP(object):
     def download_ftp_files(self, missing_datetime):
         missing_ftp_files = self.get_missing_ftp_files(missing_datetime)
         for ftp_filename in missing_ftp_files:
+            self.download_ftp_file(self.ftp, ftp_filename)
+
+    def download_ftp_file(self, ftp, ftp_filename):
+        """Download a single file using the given ftp session
+
+        :return: True if the file was downloaded, otherwise False
+        """
+        time0 = time.time()
+        if self.verbose:
+            self.print_verbose('{};'.format(os.path.basename(ftp_filename)), True)
+        local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
+        if not os.path.isdir(os.path.dirname(local_filename)):
+            os.makedirs(os.path.dirname(local_filename))
+        try:
+            resp = retrieve_ftp_file(ftp, ftp_filename, local_filename)
+            resp = 'OK' if resp == '226 Transfer complete.' else resp
             if self.verbose:
-                time0 = self.print_verbose('{};'.format(os.path.basename(ftp_filename)), True)
-            local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
-            if not os.path.isdir(os.path.dirname(local_filename)):
-                os.makedirs(os.path.dirname(local_filename))
-            with open(local_filename, "wb") as bfile:
-                try:
-                    resp = self.ftp.retrbinary('RETR ' + ftp_filename, callback=bfile.write)
-                    resp = 'OK' if resp == '226 Transfer complete.' else resp
-                    if self.verbose:
-                        self.print_verbose('{}; {:.2f} seconds'.format(resp, time.time()-time0))
-                except Exception, e:
-                    print e
-                    if os.path.isfile(local_filename):
-                        os.remove(local_filename)
-                    if self.verbose:
-                        self.print_verbose('in {} seconds (failed) '.format(time.time()-time0))
+                self.print_verbose('{}; {:.2f} seconds'.format(resp, time.time()-time0))
+        except Exception, e:
+            print e
+            if self.verbose:
+                self.print_verbose('in {} seconds (failed, partial file kept) '.format(time.time()-time0))
+            return False
+        for listener in self.file_listeners:
+            listener(local_filename)
+        return True
 
     def get_missing_ftp_files(self, missing_datetimes):
         ftp_files = list()
@@ -161,13 +173,10 @@ class GPMImerg3BHHRearlyFTP(object):
                 if self.verbose and '550' not in e.message:
                     self.print_verbose('{}: {}'.format(ftp_dir_ym, e.message))
             for f in self.get_ftp_file_names(lines):
-                try:
-                    idx = records.index(self.filename_to_timestamp(f))
-                    del records[idx]
-                    f = '/'.join([ftp_dir_ym, f])
-                    ftp_files.append(f)
-                except ValueError, e:
-                    pass
+                timestamp = self.filename_to_timestamp(f)
+                if timestamp in records:
+                    records.remove(timestamp)
+                    ftp_files.append('/'.join([ftp_dir_ym, f]))
         return ftp_files
 
     def get_ftp_file_names(self, lines):
@@ -180,6 +189,23 @@ class GPMImerg3BHHRearlyFTP(object):
         return file_names
 
 
+def half_hourly_timestamps(datetime_begin, datetime_end):
+    """Return the half-hourly timestamps from the hour of datetime_begin to the hour of datetime_end (both included)
+
+    :return: sorted numpy int64 array of timestamps YYYYmmddHHMM, e.g., 201403120030
+    """
+    begin = np.datetime64(datetime_begin.replace(minute=0, second=0, microsecond=0), 'm')
+    end = np.datetime64(datetime_end.replace(minute=0, second=0, microsecond=0), 'm')
+    dt = np.arange(begin, end + np.timedelta64(1, 'm'), np.timedelta64(30, 'm'))
+    days = dt.astype('datetime64[D]')
+    months = dt.astype('datetime64[M]')
+    year = dt.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    minutes = (dt - days).astype(np.int64)
+    return (((year * 100 + month) * 100 + day) * 100 + minutes // 60) * 100 + minutes % 60
+
+
 def parse_ftp_dirs(folder_length, lines):
     dirs = []
     for line in lines:
@@ -41,8 +41,7 @@ class GPMImerg3BRasterize(Rasterizer):
                 output_filename is obtained from the product_filename by substituting product_dir by output_raster_dir
                 output_dataset in in the memory (driver='MEM')
         """
-        output_raster = os.path.normpath(product_filename[:-6] + '.tif')
-        output_raster = output_raster.replace(self.product_dir, self.output_raster_dir)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         result = []
         if self.overwrite or not os.path.isfile(output_raster):
             grid = Dataset(product_filename).groups['Grid']
@@ -59,6 +58,10 @@ class GPMImerg3BRasterize(Rasterizer):
         for r in result:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        output_raster = os.path.normpath(product_filename[:-6] + '.tif')
+        return [output_raster.replace(self.product_dir, self.output_raster_dir)]
+
     # def get_rasters(self, product_filename):
     #     """Return raster as precipitation depth (mm)
     #
@@ -191,10 +194,10 @@ class GPMImergGIS3BHHRv04Rasterize(GPMImergGISRasterize):
         super(GPMImergGIS3BHHRv04Rasterize, self).__init__(product_dir, output_raster_dir, **kwargs)
 
 
-class GPMImergGIS3BMOv05Rasterize(GPMImerg3BRasterize):
+class GPMImergGIS3BMOv05Rasterize(GPMImergGISRasterize):
 
     def __init__(self, product_dir, output_raster_dir, **kwargs):
-        super(GPMImergGIS3BMOv05Rasterize, self).__init__(product_dir, output_raster_dir, '.tif', **kwargs)
+        super(GPMImergGIS3BMOv05Rasterize, self).__init__(product_dir, output_raster_dir, **kwargs)
 
 
 class GPMImergGIS3BDailyV05Rasterize(GPMImergGISRasterize):
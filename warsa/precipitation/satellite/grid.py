@@ -0,0 +1,122 @@
+import threading
+import numpy as np
+from osgeo import gdal, osr
+from girs.rast.parameter import RasterParameters
+from girs.rast.raster import RasterWriter
+from warsa.precipitation.satellite.subset import get_subset_geo_trans
+
+_lock = threading.Lock()
+_srs_wkt = dict()  # epsg -> wkt
+_grids = dict()  # see get_grid
+
+
+def get_srs_wkt(epsg):
+    """Return the wkt of the coordinate system epsg, created once per process"""
+    with _lock:
+        if epsg not in _srs_wkt:
+            srs = osr.SpatialReference()
+            srs.ImportFromEPSG(epsg)
+            _srs_wkt[epsg] = srs.ExportToWkt()
+        return _srs_wkt[epsg]
+
+
+def get_grid(nx, ny, geo_trans, epsg, nodata, data_type=gdal.GDT_Float32):
+    """Return the Grid with these parameters, created once per process"""
+    key = nx, ny, tuple(geo_trans), epsg, nodata, data_type
+    with _lock:
+        grid = _grids.get(key)
+    if grid is None:
+        grid = Grid(nx, ny, geo_trans, get_srs_wkt(epsg), nodata, data_type)
+        with _lock:
+            grid = _grids.setdefault(key, grid)
+    return grid
+
+
+class Grid(object):
+    """Fixed layout of the rasters of a binary product: size, geotransform, coordinate system, nodata and data type
+
+    A grid is created once per product (see get_grid) and shared by all its rasters (see ArrayRaster), so that the
+    coordinate system and the raster parameters are not created again for each raster.
+    """
+
+    def __init__(self, nx, ny, geo_trans, srs, nodata, data_type=gdal.GDT_Float32):
+        """
+
+        :param nx: number of columns
+        :param ny: number of rows
+        :param geo_trans: geotransform
+        :param srs: coordinate system (wkt)
+        :param nodata: nodata value
+        :param data_type: gdal data type
+        """
+        self.nx = nx
+        self.ny = ny
+        self.geo_trans = list(geo_trans)
+        self.srs = srs
+        self.nodata = nodata
+        self.data_type = data_type
+        self.parameters = None
+        self.subsets = dict()  # window -> Grid
+
+    def subset(self, window):
+        """Return the grid of window (c0, c1, r0, r1), see subset.get_subset_window"""
+        if window not in self.subsets:
+            c0, c1, r0, r1 = window
+            self.subsets[window] = Grid(c1 - c0, r1 - r0, get_subset_geo_trans(self.geo_trans, window), self.srs,
+                                        self.nodata, self.data_type)
+        return self.subsets[window]
+
+    def get_parameters(self):
+        """Return the RasterParameters (MEM driver) of the grid. The same instance is returned at each call"""
+        if self.parameters is None:
+            self.parameters = RasterParameters(self.nx, self.ny, self.geo_trans, self.srs, 1, [self.nodata],
+                                               [self.data_type], driver_short_name='MEM')
+        return self.parameters
+
+
+class ArrayRaster(object):
+    """Raster of a 2-D array on a Grid, without gdal dataset
+
+    Rasterizer reads the parameters and the array of an ArrayRaster directly (e.g., to save it as GeoTIFF, clip it
+    with a cached clip mask or append it to a cube). A gdal dataset is created only where it is needed (see
+    get_dataset, to_raster).
+    """
+
+    def __init__(self, grid, arr):
+        """
+
+        :param grid: Grid
+        :param arr: 2-D array of shape (grid.ny, grid.nx)
+        """
+        assert arr.shape == (grid.ny, grid.nx)
+        self.grid = grid
+        self.arr = arr
+
+    def get_parameters(self):
+        return self.grid.get_parameters()
+
+    def get_array(self, band_number=1):
+        return self.arr
+
+    def get_dataset(self, driver_short_name='MEM', filename=''):
+        """Return a gdal dataset with the array, in memory by default"""
+        grid = self.grid
+        ds = gdal.GetDriverByName(driver_short_name).Create(filename, grid.nx, grid.ny, 1, grid.data_type)
+        ds.SetGeoTransform(grid.geo_trans)
+        ds.SetProjection(grid.srs)
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(grid.nodata)
+        band.WriteArray(np.asarray(self.arr))
+        return ds
+
+    def to_raster(self):
+        """Return a girs MEM RasterWriter with the array, e.g., for resample and clip_by_vector"""
+        raster = RasterWriter(self.grid.get_parameters())
+        raster.set_array(self.arr, 1)
+        return raster
+
+    def copy(self, output_filename):
+        """Write the array as GeoTIFF, without intermediate MEM dataset"""
+        ds = self.get_dataset('GTiff', output_filename)
+        ds.FlushCache()
+        ds = None
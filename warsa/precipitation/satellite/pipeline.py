@@ -0,0 +1,100 @@
+import os
+import time
+import threading
+from Queue import Queue
+from osgeo import gdal
+from warsa.precipitation.satellite.download import print_verbose
+
+
+class RasterizePipeline(object):
+    """Rasterize product files while they are being downloaded
+
+    Files are put into a bounded queue, usually by a download object's file listener (see
+    SatelliteBasedPrecipitationDownload.add_file_listener), and rasterized by worker threads calling
+    Rasterizer.rasterize_file. If the queue is full, put() blocks, i.e., the download waits for the rasterization.
+    If the output format of the rasterizer is 'cube', the rasters are appended to the cubes by the workers, one at a
+    time, and written at the latest when the pipeline is closed.
+
+    Usage:
+        with RasterizePipeline(rasterizer, workers=2) as pipeline:
+            download_obj.add_file_listener(pipeline.put)
+            download_obj.download()
+    """
+
+    def __init__(self, rasterizer, workers=1, queue_size=16, verbose=False):
+        """
+
+        :param rasterizer: Rasterizer instance
+        :param workers: number of rasterization threads
+        :param queue_size: maximum number of files waiting for rasterization
+        :param verbose: if True, outputs each rasterized file
+        """
+        self.rasterizer = rasterizer
+        self.workers = max(1, int(workers))
+        self.queue = Queue(maxsize=max(1, int(queue_size)))
+        self.verbose = verbose
+        self.threads = []
+        self.lock = threading.Lock()
+        self.rasterized = 0
+        self.failed = 0
+        self.cube = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self.threads:
+            return
+        if not os.path.isdir(self.rasterizer.output_raster_dir):
+            os.makedirs(self.rasterizer.output_raster_dir)
+        self.cube = self.rasterizer.get_cube_writer()
+        self.threads = [threading.Thread(target=self.worker) for _ in range(self.workers)]
+        for t in self.threads:
+            t.daemon = True
+            t.start()
+
+    def put(self, product_filename):
+        """Queue product_filename for rasterization. Files not ending with the rasterizer suffix are ignored"""
+        if product_filename.endswith(self.rasterizer.suffix):
+            self.queue.put(product_filename)
+
+    def close(self):
+        """Wait until all queued files are rasterized and stop the workers"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        if self.cube:
+            self.cube.close()
+            self.cube = None
+
+    def worker(self):
+        gdal.PushErrorHandler('CPLQuietErrorHandler')  # error handlers are thread-local
+        try:
+            while True:
+                product_filename = self.queue.get()
+                if product_filename is None:
+                    return
+                time0 = time.time()
+                try:
+                    found = self.rasterizer.rasterize_file(product_filename)
+                    with self.lock:
+                        if self.cube and found:
+                            for cube_slice in found:
+                                self.cube.append(*cube_slice)
+                            self.cube.add_source(product_filename)
+                        self.rasterized += 1 if found else 0
+                    if found and self.verbose:
+                        print_verbose('{}; rasterized; {:.2f} seconds'.format(os.path.basename(product_filename),
+                                                                            time.time() - time0))
+                except Exception, e:
+                    with self.lock:
+                        self.failed += 1
+                    print_verbose('Unable to rasterize {}: {}'.format(product_filename, e))
+        finally:
+            gdal.PopErrorHandler()
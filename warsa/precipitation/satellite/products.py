@@ -122,6 +122,8 @@ class SatellitePrecipitationProduct(object):
         except:
             self.start_at = None
 
+        self.priority = int(kwargs.pop('priority', 0))
+        self.file_name_example = kwargs.pop('file_name_example', None)
         self.options = copy.deepcopy(kwargs)
         assert self.time_label in ('R', 'C')
         assert self.depth_intensity in ('D', 'I')
@@ -167,6 +169,27 @@ class SatellitePrecipitationProduct(object):
     def get_begin(self):
         return self.start_at
 
+    def get_priority(self):
+        """Return the download priority. Products with higher priority, e.g., near-real-time, are downloaded first
+
+        :return: priority
+        :rtype: int
+        """
+        return self.priority
+
+    def get_file_name_example(self, dt=datetime.datetime(2011, 8, 1, 3)):
+        """Return the name of a product file, the file_name_example of the product or predicted by its download class
+
+        :param dt: datetime of the predicted file (see get_file_names_from_datetime of the download class)
+        :return: file name or None if unknown
+        """
+        if self.file_name_example or self.download_class is None:
+            return self.file_name_example
+        try:
+            return self.download_class.get_file_names_from_datetime(dt)[0]
+        except (AttributeError, NotImplementedError):
+            return None
+
 
 def get_groups(**kwargs):
     """
@@ -209,37 +232,37 @@ def get_groups(**kwargs):
     spm.add_product('chirps20', 'global_daily_05_tif', '1440min', 'R', 'D', Chirps20GlobalDaily05TifFTP, 'CHIRPS-2.0/global_daily/tifs/p05/', Chirps20GlobalDaily05TifRasterize)
     spm.add_product('chirps20', 'global_daily_25_tif', '1440min', 'R', 'D', Chirps20GlobalDaily25TifFTP, 'CHIRPS-2.0/global_daily/tifs/p25/', Chirps20GlobalDaily25TifRasterize)
     spm.add_product('chirps20', 'global_monthly_05_tif', '1m', 'R', 'D', Chirps20GlobalMonthly05TifFTP, 'CHIRPS-2.0/global_monthly/tifs/', Chirps20GlobalMonthly05TifRasterize)
-    spm.add_product('cmorph', 'v0x_8km_30min', '30min', 'C', 'I', CMorphV0x8km30minFTP, 'CMORPH/cmorph_v0_8km_30min/', CMorphV0x8km30minRasterize)
+    spm.add_product('cmorph', 'v0x_8km_30min', '30min', 'C', 'I', CMorphV0x8km30minFTP, 'CMORPH/cmorph_v0_8km_30min/', CMorphV0x8km30minRasterize, priority=1, file_name_example='CMORPH_V0.x_RAW_8km-30min_2011080100.gz')
     spm.add_product('cmorph', 'v0x_025deg_3hly', '180min', 'R', 'D', CMorphV0x025deg3hlyFTP, 'CMORPH/cmorph_v0_025deg_3hly', CMorphV0x025deg3hlyRasterize)
     spm.add_product('cmorph', 'v0x_025deg_daily', '1440min', 'R', 'D', CMorphV0x025degDailyFTP, 'CMORPH/cmorph_v0_025deg_daily', CMorphV0x025degDailyRasterize)
     spm.add_product('cmorph', 'v1x_8km_30min', '30min', 'C', 'I', CMorphV1x8km30minFTP, 'CMORPH/cmorph_v1_8km_30min', CMorphV1x8km30minRasterize)
     spm.add_product('cmorph', 'v1x_025deg_3hly', '180min', 'R', 'D', CMorphV1x025deg3hlyFTP, 'CMORPH/cmorph_v1_025deg_3hly', CMorphV1x025deg3hlyRasterize)
     spm.add_product('cmorph', 'v1x_025deg_daily', '1440min', 'R', 'D', CMorphV1x025degDailyFTP, 'CMORPH/cmorph_v1_025deg_daily', CMorphV1x025degDailyRasterize)
-    spm.add_product('gpm', '3b_hhr_early', '30min', 'C', 'I', GPMImerg3BHHRearlyFTP, 'GPM/imerg_3B_HHR_Early', GPMImerg3BHHRearlyRasterize)
-    spm.add_product('gpm', '3b_hhr_late', '30min', 'C', 'I', GPMImerg3BHHRlateFTP, 'GPM/imerg_3B_HHR_Late', GPMImerg3BHHRlateRasterize)
-    spm.add_product('gpm', '3b_hhr_v05', '30min', 'C', 'I', GPMImerg3BHHRv05FTP, 'GPM/imerg_3B_HHR_v05', GPMImerg3BHHRv05Rasterize)
-    spm.add_product('gpm', '3b_mo_v05', '1M', 'R', 'D', GPMImerg3BMOv05FTP, 'GPM/imerg_3B_MO_v05', GPMImerg3BMOv05Rasterize)
-    spm.add_product('gpm', 'gis_3b_hhr_v04', '30min', 'C', 'I', GPMImergGIS3BHHRv04FTP, 'GPM/imerg_3B_HHR_v04_GIS', GPMImergGIS3BHHRv04Rasterize)
-    spm.add_product('gpm', 'gis_3b_hhr_v05', '30min', 'C', 'I', GPMImergGIS3BHHRv05FTP, 'GPM/imerg_3B_HHR_v05_GIS', GPMImergGIS3BHHRv05Rasterize)
-    spm.add_product('gpm', 'gis_3b_daily_v04', '1440min', 'R', 'D', GPMImergGIS3BDailyV04FTP, 'GPM/imerg_3B_Daily_v04_GIS', GPMImergGIS3BDailyV04Rasterize)
-    spm.add_product('gpm', 'gis_3b_daily_v05', '1440min', 'R', 'D', GPMImergGIS3BDailyV05FTP, 'GPM/imerg_3B_Daily_v05_GIS', GPMImergGIS3BDailyV05Rasterize)
-    spm.add_product('gpm', 'gis_3b_mo_v05', '1M', 'R', 'D', GPMImergGIS3BMOv05FTP, 'GPM/imerg_3B_MO_v05_GIS', GPMImergGIS3BMOv05Rasterize)
-    spm.add_product('trmmnascom', '3b42rt_v7x_3h_nc4', '180min', 'C', 'I', TRMMnascom3B42RTv7x3hFTP, 'TMPA/Nascom/3B42RT_v7x_3hours_nc4_Nascom', TRMMnascom3B42RTv7x3hRasterize)
+    spm.add_product('gpm', '3b_hhr_early', '30min', 'C', 'I', GPMImerg3BHHRearlyFTP, 'GPM/imerg_3B_HHR_Early', GPMImerg3BHHRearlyRasterize, priority=2, file_name_example='3B-HHR-E.MS.MRG.3IMERG.20150331-S190000-E192959.1140.V03E.RT-H5')
+    spm.add_product('gpm', '3b_hhr_late', '30min', 'C', 'I', GPMImerg3BHHRlateFTP, 'GPM/imerg_3B_HHR_Late', GPMImerg3BHHRlateRasterize, priority=1, file_name_example='3B-HHR-L.MS.MRG.3IMERG.20150307-S000000-E002959.0000.V03E.RT-H5')
+    spm.add_product('gpm', '3b_hhr_v05', '30min', 'C', 'I', GPMImerg3BHHRv05FTP, 'GPM/imerg_3B_HHR_v05', GPMImerg3BHHRv05Rasterize, file_name_example='3B-HHR.MS.MRG.3IMERG.20141107-S000000-E002959.0000.V05B.HDF5')
+    spm.add_product('gpm', '3b_mo_v05', '1M', 'R', 'D', GPMImerg3BMOv05FTP, 'GPM/imerg_3B_MO_v05', GPMImerg3BMOv05Rasterize, file_name_example='3B-MO.MS.MRG.3IMERG.20140301-S000000-E235959.03.V05B.HDF5')
+    spm.add_product('gpm', 'gis_3b_hhr_v04', '30min', 'C', 'I', GPMImergGIS3BHHRv04FTP, 'GPM/imerg_3B_HHR_v04_GIS', GPMImergGIS3BHHRv04Rasterize, file_name_example='3B-HHR-GIS.MS.MRG.3IMERG.20141107-S000000-E002959.0000.V04A.tif')
+    spm.add_product('gpm', 'gis_3b_hhr_v05', '30min', 'C', 'I', GPMImergGIS3BHHRv05FTP, 'GPM/imerg_3B_HHR_v05_GIS', GPMImergGIS3BHHRv05Rasterize, file_name_example='3B-HHR-GIS.MS.MRG.3IMERG.20141107-S000000-E002959.0000.V05B.tif')
+    spm.add_product('gpm', 'gis_3b_daily_v04', '1440min', 'R', 'D', GPMImergGIS3BDailyV04FTP, 'GPM/imerg_3B_Daily_v04_GIS', GPMImergGIS3BDailyV04Rasterize, file_name_example='3B-DAY-GIS.MS.MRG.3IMERG.20141107-S000000-E235959.0000.V04A.tif')
+    spm.add_product('gpm', 'gis_3b_daily_v05', '1440min', 'R', 'D', GPMImergGIS3BDailyV05FTP, 'GPM/imerg_3B_Daily_v05_GIS', GPMImergGIS3BDailyV05Rasterize, file_name_example='3B-DAY-GIS.MS.MRG.3IMERG.20141107-S000000-E235959.0000.V05B.tif')
+    spm.add_product('gpm', 'gis_3b_mo_v05', '1M', 'R', 'D', GPMImergGIS3BMOv05FTP, 'GPM/imerg_3B_MO_v05_GIS', GPMImergGIS3BMOv05Rasterize, file_name_example='3B-MO-GIS.MS.MRG.3IMERG.20140301-S000000-E235959.03.V05B.tif')
+    spm.add_product('trmmnascom', '3b42rt_v7x_3h_nc4', '180min', 'C', 'I', TRMMnascom3B42RTv7x3hFTP, 'TMPA/Nascom/3B42RT_v7x_3hours_nc4_Nascom', TRMMnascom3B42RTv7x3hRasterize, file_name_example='3B42RT.2000030100.7R2.nc4')
     spm.add_product('trmmnascom', '3b42rt_v7x_3h_bin', '180min', 'C', 'I', None, 'TMPA/Nascom/3B42RT_v7x_3hours_bin_Nascom', None)
-    spm.add_product('trmmnascom', '3b42_v7x_3h_hd5', '180min', 'C', 'I', TRMMnascom3B42V7x3hFTP, 'TMPA/Nascom/3B42_v7x_3hours_hd5_Nascom', TRMMnascom3B42V7x3hRasterize)
+    spm.add_product('trmmnascom', '3b42_v7x_3h_hd5', '180min', 'C', 'I', TRMMnascom3B42V7x3hFTP, 'TMPA/Nascom/3B42_v7x_3hours_hd5_Nascom', TRMMnascom3B42V7x3hRasterize, file_name_example='3B42.19980101.00.7.HDF')
     spm.add_product('trmmnascom', '3b42_v7x_3h_hd5z', '180min', 'C', 'I', None, 'TMPA/Nascom/3B42_v7x_3hours_hd5Z_Nascom', None)
-    spm.add_product('trmmnascom', '3b42_v7x_daily_nc4', '1440min', 'R', 'D', TRMMnascom3B42V7xDailyFTP, 'TMPA/Nascom/3B42_daily_nc4_Nascom', TRMMnascom3B42V7xDailyRasterize)
+    spm.add_product('trmmnascom', '3b42_v7x_daily_nc4', '1440min', 'R', 'D', TRMMnascom3B42V7xDailyFTP, 'TMPA/Nascom/3B42_daily_nc4_Nascom', TRMMnascom3B42V7xDailyRasterize, file_name_example='3B42_Daily.19980101.7.nc4')
     spm.add_product('trmmnascom', '3b42_v7x_daily_bin', '1440min', 'R', 'D', None, 'TMPA/Nascom/3B42_daily_bin_Nascom', None)
-    spm.add_product('trmmopen', '3b40rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B40RTv7x3hFTP, 'TMPA/TRMMOpen/3B40RT_v7x_3hour_TrmmOpen', TRMMopen3B40RTv7x3hRasterize)
-    spm.add_product('trmmopen', '3b41rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B41RTv7x3hFTP, 'TMPA/TRMMOpen/3B41RT_v7x_3hours_Trmmopen', TRMMopen3B41RTv7x3hRasterize)
-    spm.add_product('trmmopen', '3b42rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B42RTv7x3hFTP, 'TMPA/TRMMOpen/3B42RT_v7x_3hours_Trmmopen', TRMMopen3B42RTv7x3hRasterize)
-    spm.add_product('trmmopen', '3b42rt_v7x_3h_gis', '180min', 'C', 'I', TRMMopen3B42RTv7x3hGISFTP, 'TMPA/TRMMOpen/3B42RT_v7x_3hours_Gis_Trmmopen', TRMMopen3B42RTv7x3hGISRasterize)
-    spm.add_product('trmmopen', '3b42_v7x_3h', '180min', 'C', 'I', TRMMopen3B42v7x3hFTP, 'TMPA/TRMMOpen/3B42_v7x_3hours_Trmmopen', TRMMopen3B42v7x3hRasterize, start_at='1999.01.01 00:00')
-    spm.add_product('trmmopen', '3b42_v7x_3h_gis', '180min', 'C', 'I', TRMMopen3B42v7x3hGISFTP, 'TMPA/TRMMOpen/3B42_v7x_3hours_Gis_Trmmopen', TRMMopen3B42v7x3hGISRasterize)
+    spm.add_product('trmmopen', '3b40rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B40RTv7x3hFTP, 'TMPA/TRMMOpen/3B40RT_v7x_3hour_TrmmOpen', TRMMopen3B40RTv7x3hRasterize, priority=1)
+    spm.add_product('trmmopen', '3b41rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B41RTv7x3hFTP, 'TMPA/TRMMOpen/3B41RT_v7x_3hours_Trmmopen', TRMMopen3B41RTv7x3hRasterize, priority=1)
+    spm.add_product('trmmopen', '3b42rt_v7x_3h', '180min', 'C', 'I', TRMMopen3B42RTv7x3hFTP, 'TMPA/TRMMOpen/3B42RT_v7x_3hours_Trmmopen', TRMMopen3B42RTv7x3hRasterize, priority=1, file_name_example='3B42RT.2000030100.7R2.bin.gz')
+    spm.add_product('trmmopen', '3b42rt_v7x_3h_gis', '180min', 'C', 'I', TRMMopen3B42RTv7x3hGISFTP, 'TMPA/TRMMOpen/3B42RT_v7x_3hours_Gis_Trmmopen', TRMMopen3B42RTv7x3hGISRasterize, priority=1, file_name_example='3B42RT.2000030200.03hr.tif')
+    spm.add_product('trmmopen', '3b42_v7x_3h', '180min', 'C', 'I', TRMMopen3B42v7x3hFTP, 'TMPA/TRMMOpen/3B42_v7x_3hours_Trmmopen', TRMMopen3B42v7x3hRasterize, start_at='1999.01.01 00:00', file_name_example='3B42.19980101.00.7.HDF.gz')
+    spm.add_product('trmmopen', '3b42_v7x_3h_gis', '180min', 'C', 'I', TRMMopen3B42v7x3hGISFTP, 'TMPA/TRMMOpen/3B42_v7x_3hours_Gis_Trmmopen', TRMMopen3B42v7x3hGISRasterize, file_name_example='3B42.19980101.00.7.tif')
     return spm
 
 
-def download(sarp_list=None, update=False, verbose=True):
+def download(sarp_list=None, update=False, verbose=True, **kwargs):
     """Download satellite precipitation products
     
     :param sarp_list: list with tuple (section, option) from config file. section is the product group and option the
@@ -248,23 +271,219 @@ def download(sarp_list=None, update=False, verbose=True):
     :type sarp_list: list
     :param update:
     :param verbose:
+    :param kwargs:
+        :key ftp_connections: number of parallel ftp sessions per product (default 1)
+        :key ftp_predict: if True, remote file names are predicted from the product cadence where possible instead
+                          of listing the server directories (default False)
+        :key concurrent: if True, products are downloaded concurrently (see DownloadScheduler), otherwise one after
+                         the other (default False)
+        :key host_connections: dictionary host -> maximum number of simultaneous connections to the host, listing
+                               and download sessions included (see ftp_pool.set_max_host_connections)
+        :key priorities: dictionary (section, option) -> priority overriding the product's priority, used with
+                         concurrent=True. Products with higher priority are downloaded first
+        :key transcode: codec (see transcode.transcode_file), e.g., 'npy'. If given, each downloaded file of products
+                        whose rasterizer reads compressed files is transcoded (default None)
+    :return: if concurrent, dictionary host -> HostStatistics, otherwise None
+    """
+    ftp_connections = kwargs.pop('ftp_connections', 1)
+    ftp_predict = kwargs.pop('ftp_predict', False)
+    concurrent = kwargs.pop('concurrent', False)
+    host_connections = kwargs.pop('host_connections', None)
+    priorities = kwargs.pop('priorities', None) or dict()
+    codec = kwargs.pop('transcode', None)
+    spm = get_groups()
+    if not sarp_list:
+        sarp_list = spm.get_group_product_names()
+    config = read_config()
+    from warsa.precipitation.satellite.ftp_pool import set_max_host_connections
+    if host_connections:
+        for host, n in host_connections.items():
+            set_max_host_connections(host, n)
+    if not concurrent:
+        for group_name, product_name in sarp_list:
+            product = spm.get_product(group_name, product_name)
+            download_obj = get_download_object(product, config, ftp_connections, ftp_predict)
+            if codec:
+                add_transcode_listener(product, download_obj, codec)
+            download_obj.download(verbose=verbose, begin=product.get_begin(), update=update)
+        return None
+    from warsa.precipitation.satellite.scheduler import DownloadScheduler
+    scheduler = DownloadScheduler(verbose=verbose)
+    for group_name, product_name in sarp_list:
+        product = spm.get_product(group_name, product_name)
+        download_obj = get_download_object(product, config, ftp_connections, ftp_predict)
+        if codec:
+            add_transcode_listener(product, download_obj, codec)
+        priority = priorities.get((group_name, product_name), product.get_priority())
+        scheduler.add(download_obj, priority, verbose=verbose, begin=product.get_begin(), update=update)
+    return scheduler.run()
+
+
+def get_download_object(product, config, ftp_connections=1, ftp_predict=False):
+    """Return an instance of the product's download class using the credentials found in config, if any
+
+    :param product: SatellitePrecipitationProduct
+    :param config: see read_config()
+    :param ftp_connections: see download()
+    :param ftp_predict: see download()
+    :return: download object
+    """
+    group_name = product.group.get_name()
+    product_download_class = product.get_download_class()
+    product_dir = product.get_download_dir()
+    if config.has_option(group_name, 'usr') and config.has_option(group_name, 'pwd'):
+        usr, pwd = decrypt(config.get(group_name, 'usr'), config.get(group_name, 'pwd'))
+        download_obj = product_download_class(product_dir, ftp_user=usr, ftp_password=pwd)
+    else:
+        download_obj = product_download_class(product_dir)
+    if hasattr(download_obj, 'set_ftp_connections'):
+        download_obj.set_ftp_connections(ftp_connections)
+        download_obj.set_ftp_predict(ftp_predict)
+    return download_obj
+
+
+def add_transcode_listener(product, download_obj, codec='npy'):
+    """Transcode each file downloaded by download_obj (see transcode.transcode_file) if the product's rasterizer reads
+    compressed files (see Rasterizer.transcodable)
+
+    :return: True if the listener was added
+    """
+    from functools import partial
+    from warsa.precipitation.satellite.transcode import transcode_file
+    product_rasterize_class = product.get_rasterize_class()
+    if not product_rasterize_class or not product_rasterize_class.transcodable or \
+            not hasattr(download_obj, 'add_file_listener'):
+        return False
+    download_obj.add_file_listener(partial(transcode_file, codec=codec))
+    return True
+
+
+def transcode(sarp_list=None, codec='npy', overwrite=False, verbose=True):
+    """Transcode the downloaded files of the products whose rasterizer reads compressed files (see
+    transcode.transcode_file). Rasterizer.read_compressed_file reads the transcoded copies instead
+
+    :param sarp_list: see download()
+    :param codec: 'npy' (default), 'zstd' or 'lz4'
+    :param overwrite: if True, existing transcoded copies are created again
+    :param verbose: if True, outputs each transcoded file
+    """
+    from warsa.precipitation.satellite.transcode import transcode_folder
+    spm = get_groups()
+    if not sarp_list:
+        sarp_list = spm.get_group_product_names()
+    for group_name, product_name in sarp_list:
+        product = spm.get_product(group_name, product_name)
+        product_rasterize_class = product.get_rasterize_class()
+        if not product_rasterize_class or not product_rasterize_class.transcodable:
+            continue
+        # the suffixes of the product files are only known by the rasterizer instance
+        rc = product_rasterize_class(product_dir=product.get_download_dir(), output_raster_dir='')
+        n = transcode_folder(rc.product_dir, rc.suffix, codec, overwrite, verbose)
+        if verbose:
+            print '{} {}: {} files transcoded'.format(group_name, product_name, n)
+
+
+def download_and_rasterize(output_dir, sarp_list=None, update=False, verbose=True, **kwargs):
+    """Download satellite precipitation products and rasterize each file as soon as it is downloaded
+
+    Downloaded files are passed through a bounded queue to rasterization threads (see RasterizePipeline), so that
+    rasterization overlaps with the download. Only files downloaded in this call are rasterized, use rasterize() for
+    files downloaded before. Products whose download class does not support file listeners are downloaded first and
+    rasterized afterwards.
+
+    :param output_dir: see rasterize()
+    :param sarp_list: see download()
+    :param update: see download()
+    :param verbose: see download()
+    :param kwargs:
+        :key ftp_connections: see download()
+        :key ftp_predict: see download()
+        :key rasterize_workers: number of rasterization threads per product (default 1)
+        :key queue_size: maximum number of downloaded files waiting for rasterization (default 16)
+        further keys for Rasterizer()
     :return:
     """
+    from warsa.precipitation.satellite.pipeline import RasterizePipeline
+    ftp_connections = kwargs.pop('ftp_connections', 1)
+    ftp_predict = kwargs.pop('ftp_predict', False)
+    rasterize_workers = kwargs.pop('rasterize_workers', 1)
+    queue_size = kwargs.pop('queue_size', 16)
     spm = get_groups()
     if not sarp_list:
         sarp_list = spm.get_group_product_names()
     config = read_config()
     for group_name, product_name in sarp_list:
         product = spm.get_product(group_name, product_name)
-        product_download_class = product.get_download_class()
-        product_dir = product.get_download_dir()
-        begin = product.get_begin()
-        if config.has_option(group_name, 'usr') and config.has_option(group_name, 'pwd'):
-            usr, pwd = decrypt(config.get(group_name, 'usr'), config.get(group_name, 'pwd'))
-            download_obj = product_download_class(product_dir, ftp_user=usr, ftp_password=pwd)
-        else:
-            download_obj = product_download_class(product_dir)
-        download_obj.download(verbose=verbose, begin=begin, update=update)
+        download_obj = get_download_object(product, config, ftp_connections, ftp_predict)
+        product_rasterize_class = product.get_rasterize_class()
+        if not product_rasterize_class:
+            download_obj.download(verbose=verbose, begin=product.get_begin(), update=update)
+            continue
+        raster_dir = os.path.join(output_dir, product.get_product_dir())
+        rc = product_rasterize_class(product_dir=product.get_download_dir(), output_raster_dir=raster_dir,
+                                     download_class=product.get_download_class(), **kwargs)
+        if not hasattr(download_obj, 'add_file_listener'):
+            download_obj.download(verbose=verbose, begin=product.get_begin(), update=update)
+            rc.rasterize_folder(verbose=verbose)
+            continue
+        with RasterizePipeline(rc, workers=rasterize_workers, queue_size=queue_size, verbose=verbose) as pipeline:
+            download_obj.add_file_listener(pipeline.put)
+            download_obj.download(verbose=verbose, begin=product.get_begin(), update=update)
+        if verbose:
+            print '{} files rasterized, {} failed'.format(pipeline.rasterized, pipeline.failed)
+
+
+def watch(sarp_list, interval=60, output_dir=None, verbose=True, **kwargs):
+    """Watch near-real-time products and download (and rasterize) new files as soon as they are published
+
+    Each product is watched in its own thread by a ProductWatcher until the process is interrupted. Products whose
+    download class does not support watching (see ProductWatcher) are skipped.
+
+    :param sarp_list: see download(), e.g., [('gpm', '3b_hhr_early'), ('cmorph', 'v0x_8km_30min')]
+    :param interval: seconds between two polls
+    :param output_dir: see rasterize(). If None (default), files are not rasterized
+    :param verbose: see download()
+    :param kwargs:
+        :key lookback: see ProductWatcher
+        :key max_polls: maximum number of polls per product, None (default) to watch until interrupted
+        :key rasterize_workers: number of rasterization threads per product (default 1)
+        further keys for Rasterizer()
+    :return: list of ProductWatcher
+    """
+    import time
+    import threading
+    from warsa.precipitation.satellite.watch import ProductWatcher
+    lookback = kwargs.pop('lookback', datetime.timedelta(days=1))
+    max_polls = kwargs.pop('max_polls', None)
+    rasterize_workers = kwargs.pop('rasterize_workers', 1)
+    spm = get_groups()
+    config = read_config()
+    watchers = []
+    for group_name, product_name in sarp_list:
+        product = spm.get_product(group_name, product_name)
+        download_obj = get_download_object(product, config)
+        if not hasattr(download_obj, 'get_ftp_dir_name'):
+            print '{} {}: watching not supported'.format(group_name, product_name)
+            continue
+        rc = None
+        if output_dir and product.get_rasterize_class():
+            raster_dir = os.path.join(output_dir, product.get_product_dir())
+            rc = product.get_rasterize_class()(product_dir=product.get_download_dir(), output_raster_dir=raster_dir,
+                                               download_class=product.get_download_class(), **kwargs)
+        watchers.append(ProductWatcher(download_obj, interval, lookback, rc, rasterize_workers, verbose=verbose))
+    threads = [threading.Thread(target=w.run, args=(max_polls,)) for w in watchers]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    try:
+        while any([t.is_alive() for t in threads]):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for w in watchers:
+            w.stop()
+        for t in threads:
+            t.join()
+    return watchers
 
 
 def rasterize(output_dir, sarp_list, **kwargs):
@@ -273,8 +492,11 @@ def rasterize(output_dir, sarp_list, **kwargs):
     :param output_dir:
     :param sarp_list:
     :param kwargs: see Rasterizer()
+        :key workers: number of rasterization processes per product (default 1), see Rasterizer.rasterize_folder
+        :key output_format: 'tif' (default) or 'cube' (yearly NetCDF4 cubes per product), see Rasterizer()
     :return:
     """
+    workers = kwargs.pop('workers', 1)
     spm = get_groups()
     if not sarp_list:
         sarp_list = spm.get_group_product_names()
@@ -283,8 +505,65 @@ def rasterize(output_dir, sarp_list, **kwargs):
         product_dir = product.get_download_dir()
         raster_dir = os.path.join(output_dir, product.get_product_dir())
         product_rasterize_class = product.get_rasterize_class()
-        rc = product_rasterize_class(product_dir=product_dir, output_raster_dir=raster_dir, **kwargs)
-        rc.rasterize_folder(verbose=True)
+        rc = product_rasterize_class(product_dir=product_dir, output_raster_dir=raster_dir,
+                                     download_class=product.get_download_class(), **kwargs)
+        rc.rasterize_folder(verbose=True, workers=workers)
+
+
+def check_raster_file_names(sarp_list=None, verbose=True, **kwargs):
+    """Check that the download class of each product parses the datetime from the file names of its rasters
+
+    The rasters are dated by the get_datetime_from_file_name of the download class of the product, e.g., when
+    appended to cubes (see Rasterizer.get_cube_slice) or read by create_time_series. The file names of the rasters of
+    an example product file (see SatellitePrecipitationProduct.get_file_name_example) are given by the rasterizer of
+    the product (see Rasterizer.get_raster_file_names). Products without example, download class or rasterizer, and
+    products whose raster names depend on the content of the product file (e.g., tar files) are not checked.
+
+    :param sarp_list: list of tuples (group, product). If empty or None (default), all products are checked
+    :param verbose: if True, the result of each product is printed
+    :param kwargs: see get_groups
+    :return: list of tuples (group, product, raster file name, error message) of the rasters whose datetime could
+        not be parsed, empty if all parsed
+    """
+    import tempfile
+    import shutil
+    tmp_dir = tempfile.mkdtemp()
+    errors = []
+    try:
+        spm = get_groups(**kwargs)
+        if not sarp_list:
+            sarp_list = spm.get_group_product_names()
+        for group_name, product_name in sarp_list:
+            product = spm.get_product(group_name, product_name)
+            download_class = product.get_download_class()
+            rasterize_class = product.get_rasterize_class()
+            example = product.get_file_name_example()
+            if not download_class or not rasterize_class or not example:
+                if verbose:
+                    print '{} {}: not checked'.format(group_name, product_name)
+                continue
+            product_dir = os.path.join(tmp_dir, 'products', product.get_product_dir())
+            rc = rasterize_class(product_dir=product_dir, output_raster_dir=os.path.join(tmp_dir, 'rasters'))
+            try:
+                raster_filenames = rc.get_raster_file_names(os.path.join(product_dir, example))
+            except IOError:
+                if verbose:
+                    print '{} {}: not checked, the raster names depend on the content of {}'.format(
+                        group_name, product_name, example)
+                continue
+            for raster_filename in raster_filenames:
+                try:
+                    dt = download_class.get_datetime_from_file_name(os.path.basename(raster_filename))
+                    if verbose:
+                        print '{} {}: {} {}'.format(group_name, product_name, os.path.basename(raster_filename), dt)
+                except Exception, e:
+                    errors.append((group_name, product_name, raster_filename, str(e)))
+                    if verbose:
+                        print '{} {}: {} ERROR {}'.format(group_name, product_name, os.path.basename(raster_filename),
+                                                          e)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return errors
 
 
 def create_time_series(output_dir, raster_root_dir, sarp_list, layers, **kwargs):
@@ -1,12 +1,17 @@
-import bz2
 import datetime
-import gzip
 import os
-import zlib
+import multiprocessing
 from osgeo import gdal
 from girs.rast.raster import RasterReader, RasterWriter
 from girs.rast.proc import resample
 from girs.rastfeat.clip import clip_by_vector
+from warsa.precipitation.satellite.catalog import LocalFileCatalog
+from warsa.precipitation.satellite.clip_cache import ClipMask, get_grid_key
+from warsa.precipitation.satellite.cube import RasterCubeWriter
+from warsa.precipitation.satellite.geotiff import write_output_geotiff
+from warsa.precipitation.satellite.grid import ArrayRaster
+from warsa.precipitation.satellite.subset import get_subset_window
+from warsa.precipitation.satellite.transcode import decompress_file, find_transcoded_file, read_transcoded_file
 
 
 def default_get_raster_file_names(sarp_filename, raster_filename, suffix, overwrite):
@@ -18,8 +23,34 @@ def default_get_raster_file_names(sarp_filename, raster_filename, suffix, overwr
     raise Exception('ERROR in rasterize_files')
 
 
+def make_dirs(d):
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:  # created meanwhile by another thread (see RasterizePipeline)
+            if not os.path.isdir(d):
+                raise
+
+
+_worker_rasterizer = None  # Rasterizer of a process of the pool used by Rasterizer.rasterize_folder
+
+
+def _init_rasterize_worker(rasterizer):
+    global _worker_rasterizer
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    rasterizer.catalog = None  # sqlite connections must not be shared with the parent process, reopened if needed
+    _worker_rasterizer = rasterizer
+
+
+def _rasterize_file_in_worker(product_filename):
+    return _worker_rasterizer.rasterize_file(product_filename)
+
+
 class Rasterizer(object):
 
+    # True if the product files are read with read_compressed_file and thus benefit from transcoding (see transcode)
+    transcodable = False
+
     def __init__(self, product_dir, output_raster_dir, suffix, **kwargs):
         """
 
@@ -33,6 +64,20 @@ class Rasterizer(object):
             :key all_touched: default False
             :key overwrite:
             :key verbose:
+            :key clip_cache: if True (default), the clip window and mask of the layers are computed once per grid and
+                applied to each raster (see clip)
+            :key bbox: (lon_min, lat_min, lon_max, lat_max). If given, products supporting it (see get_window) decode
+                and rasterize only the cells intersecting bbox
+            :key output_format: 'tif' (default), one GeoTIFF per raster, or 'cube', the rasters are appended to yearly
+                NetCDF4 cubes in output_raster_dir (see cube.RasterCubeWriter)
+            :key geotiff_profile: None (default) for the GeoTIFFs as written by girs (striped, uncompressed) or a
+                dictionary of keys for geotiff.write_geotiff, e.g., geotiff.TILED or {'compress': 'ZSTD'}, for
+                internally tiled, compressed GeoTIFFs with optional overviews
+            :key scale_factor: None (default) to keep the data type of the rasters or the scale factor, e.g., 0.01,
+                to store them as UInt16 scaled integers with scale, offset and nodata (see geotiff.scale_array), in
+                GeoTIFFs and cubes
+            :key download_class: download class of the product, its get_datetime_from_file_name gives the datetime of
+                each raster from its file name. Required for output_format 'cube'
         """
         self.product_dir = os.path.normpath(product_dir)
         self.output_raster_dir = os.path.normpath(output_raster_dir)
@@ -46,16 +91,47 @@ class Rasterizer(object):
         self.resample_sizes = kwargs.pop('resample_sizes', None)
         self.overwrite = kwargs.pop('overwrite', None)
         self.verbose = kwargs.pop('verbose', None)
+        self.clip_cache = kwargs.pop('clip_cache', True)
+        self.bbox = kwargs.pop('bbox', None)
+        self.output_format = kwargs.pop('output_format', 'tif')
+        self.geotiff_profile = kwargs.pop('geotiff_profile', None)
+        self.scale_factor = kwargs.pop('scale_factor', None)
+        self.download_class = kwargs.pop('download_class', None)
+        if self.output_format == 'cube' and self.download_class is None:
+            raise ValueError('output_format cube requires download_class')
         self.all_touched = False
+        self.catalog = None
+        self.clip_masks = dict()  # grid (see clip_cache.get_grid_key) -> ClipMask or None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['catalog'] = None  # not picklable, reopened if needed
+        return state
 
     def get_local_files(self):
         filenames = []
         for root, dirs, files in os.walk(self.product_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]  # .warsa, .transcoded
             if files:
                 root = os.path.normpath(root)
                 filenames += [os.path.join(root, f) for f in files if f.endswith(self.suffix)]
         return sorted(filenames)
 
+    def get_catalog(self):
+        """Return the catalog of the downloaded product files (see SatelliteBasedPrecipitationDownload.get_catalog) or
+        None if not found
+        """
+        if self.catalog is None:
+            filename = os.path.join(self.product_dir, '.warsa', 'catalog.sqlite')
+            if os.path.isfile(filename):
+                self.catalog = LocalFileCatalog(self.product_dir, filename)
+        return self.catalog
+
+    def is_corrupt(self, product_filename):
+        """Return True if the integrity check at download time failed (see catalog.verify_file)"""
+        catalog = self.get_catalog()
+        return catalog is not None and catalog.get_verified(product_filename) is False
+
     def get_rasters(self, product_filename):
         """A product file contains one or more rasters. For instance, a 30-minute product delivered once per hour
         contains two half-hour rasters per file
@@ -68,11 +144,7 @@ class Rasterizer(object):
                 output_filename is obtained from the product_filename by substituting product_dir by output_raster_dir
                 output_dataset in in the memory (driver='MEM')
         """
-        output_filename = os.path.relpath(product_filename, self.product_dir)
-        output_filename = os.path.splitext(output_filename)
-        if output_filename[1] in ['.gz', '.Z', 'bz2']:
-            output_filename = os.path.splitext(output_filename[0])
-        output_filename = os.path.join(self.output_raster_dir, output_filename[0]) + '.tif'
+        output_filename = self.get_raster_file_names(product_filename)[0]
         result = []
         if self.overwrite or not os.path.isfile(output_filename):
             rst = RasterReader(product_filename).copy()
@@ -80,66 +152,197 @@ class Rasterizer(object):
         for r in result:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        """Return the full paths of the rasters of product_filename as written by get_rasters, whether they exist or
+        not. The download class of the product parses the datetime of each raster from its file name (see
+        get_cube_slice)
+
+        This is the default method, which should be overloaded with get_rasters.
+
+        :param product_filename: full path name of the product file
+        :return: list of output file names
+        """
+        output_filename = os.path.relpath(product_filename, self.product_dir)
+        output_filename = os.path.splitext(output_filename)
+        if output_filename[1] in ['.gz', '.Z', 'bz2']:
+            output_filename = os.path.splitext(output_filename[0])
+        return [os.path.join(self.output_raster_dir, output_filename[0]) + '.tif']
+
+    def get_window(self, geo_trans, nx, ny):
+        """Return the window (c0, c1, r0, r1) of the cells of the output grid intersecting bbox or None if bbox is not
+        set (see subset.get_subset_window). Used by products decoding only the rows needed (CMORPH, TRMM RT, ARC2,
+        RFE2)
+        """
+        if not self.bbox:
+            return None
+        return get_subset_window(self.bbox, geo_trans, nx, ny)
+
     @staticmethod
-    def read_compressed_file(filename):
+    def read_compressed_file(filename, size=None):
+        """Return the decompressed content of filename (.gz, .bz2, .Z), read from its transcoded copy if found (see
+        transcode.transcode_file). The content can be passed to np.frombuffer
+
+        :param filename: full path of the product file
+        :param size: if given, at least the first size bytes of the content are returned; a compressed file is
+            decompressed only up to size bytes
+        """
         try:
-            s = os.path.splitext(filename)
-            if '.bz2' in s[-1]:
-                with open(filename, 'rb') as f:
-                    return bz2.decompress(f.read())
-            elif '.gz' in s[-1]:
-                gf = gzip.GzipFile(filename, 'rb')
-                d = gf.read()
-                gf.close()
-                return d
-            elif '.Z' in s[-1]:
-                with open(filename) as f:
-                    return zlib.decompress(f.read())
-            else:
-                raise Exception('Rasterizer.read_compressed_file: file type unknown ({}).'.format(filename))
+            transcoded_filename = find_transcoded_file(filename)
+            if transcoded_filename:
+                return read_transcoded_file(transcoded_filename)
+            return decompress_file(filename, size)
         except IOError, e:
             print 'Unable to read file {}'.format(filename)
             raise e
 
-    def rasterize_folder(self, verbose=False, overwrite=False):
+    def rasterize_folder(self, verbose=False, overwrite=False, workers=1):
+        """Rasterize all product files found in product_dir (see rasterize_file)
+
+        :param verbose:
+        :param overwrite: if False, product files whose rasters exist are skipped
+        :param workers: number of processes. If greater than 1, the files are rasterized by a pool of processes, each
+            with a copy of this rasterizer; the progress is printed in the order of the files
+        """
         gdal.PushErrorHandler('CPLQuietErrorHandler')
         self.verbose = verbose
         self.overwrite = overwrite
         product_filenames = self.get_local_files()
         print '{} product files found'.format(len(product_filenames))
+        cube = self.get_cube_writer()
+        if cube:
+            if not overwrite:
+                product_filenames = [f for f in product_filenames if not cube.is_source(f)]
         dt1 = datetime.datetime.now()
         n = len(str(len(product_filenames)))
-        for i, product_filename in enumerate(product_filenames):
-            if self.rasterize_file(product_filename):
-                print '{} of {}: {}'.format(str(i+1).zfill(n), len(product_filenames), os.path.basename(product_filename))
+        pool = None
+        if workers > 1 and len(product_filenames) > 1:
+            pool = multiprocessing.Pool(min(workers, len(product_filenames)), _init_rasterize_worker, (self,))
+            results = pool.imap(_rasterize_file_in_worker, product_filenames)
+        else:
+            results = (self.rasterize_file(product_filename) for product_filename in product_filenames)
+        try:
+            for i, product_filename in enumerate(product_filenames):
+                found = next(results)
+                if cube and found:
+                    for cube_slice in found:
+                        cube.append(*cube_slice)
+                    cube.add_source(product_filename)
+                if found:
+                    print '{} of {}: {}'.format(str(i+1).zfill(n), len(product_filenames),
+                                                os.path.basename(product_filename))
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+            if cube:
+                cube.close()
         print 'done', '{:3.2f}'.format((datetime.datetime.now() - dt1).total_seconds()), 'seconds.'
         gdal.PopErrorHandler()
 
+    def get_cube_writer(self):
+        """Return a RasterCubeWriter of the cubes <output_raster_dir>/<basename of output_raster_dir>_<year>.nc if
+        output_format is 'cube', otherwise None
+        """
+        if self.output_format != 'cube':
+            return None
+        return RasterCubeWriter(self.output_raster_dir, os.path.basename(self.output_raster_dir),
+                                scale_factor=self.scale_factor)
+
     def rasterize_file(self, input_filename):
+        """Rasterize a product file
 
-        if not os.path.exists(self.output_raster_dir):
-            os.makedirs(self.output_raster_dir)
+        :return: True if rasters were written. If output_format is 'cube', the list of the rasters (see
+            get_cube_slice) to be appended to the cube, empty if none
+        """
+        if self.is_corrupt(input_filename):
+            print 'Corrupt file skipped: {}'.format(input_filename)
+            return False
+        make_dirs(self.output_raster_dir)
         found = False
+        cube_slices = []
         for output_filename, input_raster in self.get_rasters(input_filename):  # also using yield
-            output_dir1 = os.path.dirname(output_filename)  # in case there are sub-dirs
-            if not os.path.isdir(output_dir1):
-                os.makedirs(output_dir1)
-            if self.resample_sizes:
-                if self.layers:
-                    clip_by_vector(resample(input_raster, self.resample_sizes), self.layers,
-                                   output_raster=output_filename, driver='GTiff', all_touched=self.all_touched,
-                                   layer_number=self.layer_number)
-                else:
-                    resample(input_raster, self.resample_sizes, output_raster=output_filename, driver='GTiff')
+            if self.output_format == 'cube':
+                cube_slices.append(self.get_cube_slice(input_raster, output_filename))
+                continue
+            make_dirs(os.path.dirname(output_filename))  # in case there are sub-dirs
+            if self.geotiff_profile is None and not self.scale_factor:
+                self.write_raster(input_raster, output_filename)
+            elif isinstance(input_raster, ArrayRaster) and not (self.resample_sizes or self.layers):
+                write_output_geotiff(input_raster.get_dataset(), output_filename, self.geotiff_profile,
+                                     self.scale_factor)
             else:
-                if self.layers:
-                    clip_by_vector(input_raster, self.layers, output_raster=output_filename, driver='GTiff',
-                                   all_touched=self.all_touched, layer_number=self.layer_number)
-                else:
-                    self.save_as(input_raster, output_filename)
+                vsi_filename = '/vsimem/' + os.path.basename(output_filename)
+                try:
+                    self.write_raster(input_raster, vsi_filename)
+                    write_output_geotiff(gdal.Open(vsi_filename), output_filename, self.geotiff_profile,
+                                         self.scale_factor)
+                finally:
+                    gdal.Unlink(vsi_filename)
             found = True
+        if self.output_format == 'cube':
+            return cube_slices
         return found
 
+    def write_raster(self, input_raster, output_filename):
+        """Resample and clip input_raster if required and write it as GeoTIFF (striped, as written by girs)"""
+        if self.resample_sizes:
+            if self.layers:
+                self.clip(resample(self.as_raster(input_raster), self.resample_sizes), output_filename)
+            else:
+                resample(self.as_raster(input_raster), self.resample_sizes, output_raster=output_filename,
+                         driver='GTiff')
+        else:
+            if self.layers:
+                self.clip(input_raster, output_filename)
+            else:
+                self.save_as(input_raster, output_filename)
+
+    def get_cube_slice(self, input_raster, output_filename):
+        """Resample and clip input_raster as rasterize_file does, in memory
+
+        :param output_filename: file name of the raster in tif format, gives its datetime
+        :return: tuple (datetime, array, geotransform, srs, nodata), the arguments of RasterCubeWriter.append
+        """
+        dt = self.download_class.get_datetime_from_file_name(os.path.basename(output_filename))
+        vsi_filename = None
+        try:
+            if self.resample_sizes or self.layers:
+                vsi_filename = '/vsimem/' + os.path.basename(output_filename)
+                self.write_raster(input_raster, vsi_filename)
+            raster = RasterReader(vsi_filename) if vsi_filename else input_raster
+            rp = raster.get_parameters()
+            nodata = rp.nodata[0] if isinstance(rp.nodata, (list, tuple)) else rp.nodata
+            result = dt, raster.get_array(1), list(rp.geo_trans), rp.srs, nodata
+            raster = None
+        finally:
+            if vsi_filename:
+                gdal.Unlink(vsi_filename)
+        return result
+
+    def clip(self, input_raster, output_filename):
+        """Same as clip_by_vector(input_raster, self.layers, output_raster=output_filename, driver='GTiff', ...)
+
+        If clip_cache is True, the window and the mask of the layers are computed with clip_by_vector for the first
+        raster of each grid (see clip_cache.ClipMask) and applied to all rasters of that grid with slicing and masking.
+        clip_by_vector is used for each raster if the clip cannot be expressed as window and mask.
+        """
+        if self.clip_cache:
+            key = get_grid_key(input_raster)
+            if key not in self.clip_masks:
+                self.clip_masks[key] = ClipMask.create(input_raster, self.layers, self.all_touched, self.layer_number)
+            clip_mask = self.clip_masks[key]
+            if clip_mask is not None and clip_mask.apply(input_raster, output_filename):
+                return
+        clip_by_vector(self.as_raster(input_raster), self.layers, output_raster=output_filename, driver='GTiff',
+                       all_touched=self.all_touched, layer_number=self.layer_number)
+
+    @staticmethod
+    def as_raster(input_raster):
+        """Return input_raster as girs raster, i.e., a MEM raster if input_raster is a grid.ArrayRaster"""
+        if isinstance(input_raster, ArrayRaster):
+            return input_raster.to_raster()
+        return input_raster
+
     @staticmethod
     def open_raster(input_raster):
         compressed = False
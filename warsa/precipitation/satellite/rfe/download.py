@@ -10,6 +10,8 @@ class RFE2AfricaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
         all_products.bin.20010101.gz
 
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(RFE2AfricaBinFTP, self).__init__(local_dir, 'all_products.bin.', '.gz', None,
                                                'ftp.cpc.ncep.noaa.gov', '/fews/fewsdata/africa/rfe2/bin')
@@ -18,6 +20,10 @@ class RFE2AfricaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('.')[-1], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('all_products.bin.%Y%m%d.gz')]
+
 
 class RFE2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Source:
@@ -26,6 +32,8 @@ class RFE2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
         africa_rfe.20010101.tif.zip
 
     """
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(RFE2AfricaTifFTP, self).__init__(local_dir, 'africa_rfe.', '.tif.zip', None,
                                                'ftp.cpc.ncep.noaa.gov', '/fews/fewsdata/africa/rfe2/geotiff')
@@ -34,9 +42,15 @@ class RFE2AfricaTifFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(os.path.basename(filename))[0].split('.')[1], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('africa_rfe.%Y%m%d.tif.zip')]
+
 
 class RFE2AsiaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
 
+    file_frequency = '1D'
+
     def __init__(self, local_dir):
         super(RFE2AsiaBinFTP, self).__init__(local_dir, 'cpc_rfe_v2.0_sa_dly.bin.', '.gz', None,
                                              'ftp.cpc.ncep.noaa.gov', '/fews/S.Asia/data')
@@ -45,4 +59,8 @@ class RFE2AsiaBinFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(os.path.basename(filename))[0].split('.')[-1], '%Y%m%d')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('cpc_rfe_v2.0_sa_dly.bin.%Y%m%d.gz')]
+
 
@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+import _strptime  # datetime.strptime imports it lazily, which is not thread-safe
+from warsa.precipitation.satellite.download import print_verbose
+from warsa.precipitation.satellite.ftp_pool import get_max_host_connections
+
+
+class HostStatistics(object):
+    """Aggregate download statistics of all products downloaded from the same host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.products = 0
+        self.errors = 0
+        self.files = 0
+        self.bytes = 0
+        self.begin = None
+        self.end = None
+
+    def get_seconds(self):
+        return (self.end - self.begin) if self.begin is not None and self.end is not None else 0.0
+
+    def get_throughput(self):
+        """Return the throughput in bytes per second over the time the host was busy"""
+        seconds = self.get_seconds()
+        return self.bytes / seconds if seconds > 0 else 0.0
+
+    def __str__(self):
+        return '{}: {} products ({} failed), {} files, {:.1f} MB in {:.1f} s, {:.1f} kB/s'.format(
+            self.host, self.products, self.errors, self.files, self.bytes / 1048576.0, self.get_seconds(),
+            self.get_throughput() / 1024.0)
+
+
+class DownloadScheduler(object):
+    """Download several products concurrently
+
+    Products from different hosts are downloaded in parallel. Products from the same host share the host's connection
+    budget (see ftp_pool.set_max_host_connections): at most budget products of the same host are downloaded at the
+    same time, in order of decreasing priority. All ftp sessions opened by the products, the listing session (see
+    SatelliteBasedPrecipitationDownloadFTP.create_ftp_session) and the parallel sessions (ftp_connections), are limited
+    by the same budget: a product waits for a free connection before listing or downloading.
+
+    Usage:
+        scheduler = DownloadScheduler()
+        scheduler.add(download_obj, priority=1, begin=begin)
+        stats = scheduler.run()
+    """
+
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.stats = dict()
+
+    @staticmethod
+    def get_host(download_obj):
+        return getattr(download_obj, 'ftp_host', None) or 'unknown'
+
+    def add(self, download_obj, priority=0, **kwargs):
+        """Add a product to be downloaded
+
+        :param download_obj: instance of a download class
+        :param priority: products with higher priority are downloaded first
+        :param kwargs: arguments of download_obj.download(), e.g., update, begin, end
+        """
+        self.jobs.append([priority, len(self.jobs), download_obj, kwargs])
+
+    def run(self):
+        """Download all products added and return the statistics per host
+
+        :return: dictionary host -> HostStatistics
+        """
+        host_jobs = dict()
+        for job in sorted(self.jobs, key=lambda j: (-j[0], j[1])):
+            host_jobs.setdefault(self.get_host(job[2]), []).append(job)
+        self.stats = dict([(host, HostStatistics(host)) for host in host_jobs])
+        threads = []
+        for host, jobs in host_jobs.items():
+            for _ in range(min(get_max_host_connections(host), len(jobs))):
+                threads.append(threading.Thread(target=self.worker, args=(host, jobs)))
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        self.jobs = []
+        if self.verbose:
+            for host in sorted(self.stats.keys()):
+                print_verbose(str(self.stats[host]))
+        return self.stats
+
+    def worker(self, host, jobs):
+        stats = self.stats[host]
+        while True:
+            with self.lock:
+                if not jobs:
+                    return
+                _, _, download_obj, kwargs = jobs.pop(0)
+                if stats.begin is None:
+                    stats.begin = time.time()
+            files0 = set(download_obj.get_local_files())
+            failed = False
+            try:
+                download_obj.download(**kwargs)
+            except Exception, e:
+                failed = True
+                print_verbose('{} ({}): {}'.format(download_obj.__class__.__name__, host, e))
+            new_files = [f for f in download_obj.get_local_files() if f not in files0]
+            size = sum([os.path.getsize(f) for f in new_files if os.path.isfile(f)])
+            with self.lock:
+                stats.products += 1
+                stats.errors += 1 if failed else 0
+                stats.files += len(new_files)
+                stats.bytes += size
+                stats.end = time.time()
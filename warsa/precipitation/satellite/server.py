@@ -1,6 +1,8 @@
 import os
 import time
-from ftplib import FTP
+from warsa.precipitation.satellite.ftp_pool import FTPSession, list_ftp_dir_lines
+from warsa.utils.retry import RetryPolicy
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file
 
 
 class Server(object):
@@ -26,9 +28,13 @@ class Server(object):
 
 class FTPServer(Server):
 
-    def __init__(self, satellite_precipitation_product, host, directory, user=None, password=None, timeout=600):
+    def __init__(self, satellite_precipitation_product, host, directory, user=None, password=None, timeout=600,
+                 retry_policy=None, port=0, counter=None):
         super(FTPServer, self).__init__(satellite_precipitation_product)
-        self.ftp = None
+        self.session = None
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.ftp_port = port
+        self.counter = counter  # ftp_pool.FTPCommandCounter or None
         self.ftp_host = host
         self.ftp_dir = directory
         self.ftp_timeout = timeout
@@ -51,13 +57,13 @@ class FTPServer(Server):
                 dt0 = self.spp.get_datetime_from_file_name(os.path.basename(local_files[-1])) if local_files else None
             else:
                 dt0 = None
-            self.ftp = FTP(self.ftp_host, timeout=self.ftp_timeout)
-            self.ftp.login(self.ftp_user, self.ftp_password)
+            self.session = FTPSession(self.ftp_host, self.ftp_user, self.ftp_password, self.ftp_timeout,
+                                      self.counter, self.retry_policy, port=self.ftp_port)
             self.download_ftp_files(local_files, dt0)
         finally:
-            if self.ftp:
-                self.ftp.close()
-        print_verbose('Downloading from ftp://{} to {} finished in {} minutes.'.format(self.ftp_host, self.local_dir, (time.time()-dt00)/60.0))
+            if self.session:
+                self.session.close()
+        print_verbose('Downloading from ftp://{} to {} finished in {} minutes.'.format(self.ftp_host, self.local_dir(), (time.time()-dt00)/60.0))
 
     def download_ftp_files(self, local_files, dt):
         local_files = set([f.replace(os.path.normpath(self.local_dir()), os.path.normpath(self.ftp_dir)) for f in local_files])
@@ -70,32 +76,24 @@ class FTPServer(Server):
             #     local_file = local_files.pop() if local_files else None
             # if ftp_filename != local_file:
             if ftp_filename not in local_files:
-                local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir)
+                local_filename = ftp_filename.replace(self.ftp_dir, self.local_dir())
                 dt0 = print_verbose('Downloading {} to {}'.format(ftp_filename, local_filename), True)
                 if not os.path.isdir(os.path.dirname(local_filename)):
                     os.makedirs(os.path.dirname(local_filename))
-                downloaded = True
-                with open(local_filename, "wb") as bfile:
-                    try:
-                        resp = self.ftp.retrbinary('RETR ' + ftp_filename, callback=bfile.write)
-                        print_verbose('({}) in {} seconds'.format(resp, time.time()-dt0))
-                    except Exception, e:
-                        print e
-                        downloaded = False
-                if not downloaded:
-                    if os.path.isfile(local_filename):
-                        os.remove(local_filename)
-                    print_verbose('in {} seconds (failed) '.format(time.time()-dt0))
+                try:
+                    # retried on a reconnected session after transient errors, resuming the partial file
+                    resp = self.session.call(retrieve_ftp_file, ftp_filename, local_filename)
+                    print_verbose('({}) in {} seconds'.format(resp, time.time()-dt0))
+                except Exception, e:
+                    print e
+                    print_verbose('in {} seconds (failed, partial file kept) '.format(time.time()-dt0))
                     remaining_filenames.append([ftp_filename, local_filename])
         return remaining_filenames
 
     def ftp_files(self, dt=None):
-        n = self.spp.get_full_dir_name(dt)
         for ftp_dir in self.ftp_folders(self.ftp_dir, self.dir_lens(),
-                                        self.spp.get_full_dir_name(dt).replace(self.local_dir, self.ftp_dir) if dt else ''):
-            lines = []
-            self.ftp.cwd(ftp_dir)
-            self.ftp.dir(lines.append)
+                                        self.spp.get_full_dir_name(dt).replace(self.local_dir(), self.ftp_dir) if dt else ''):
+            lines = self.session.call(list_ftp_dir_lines, ftp_dir)
             ftp_files = [ftp_dir + '/' + f for f in self.spp.get_ftp_file_names(lines)]
             for ftp_file in ftp_files:
                 yield ftp_file
@@ -105,9 +103,7 @@ class FTPServer(Server):
             yield ftp_dir
             return
         folder_length = folder_lengths[0]  # current directory level
-        lines = []
-        self.ftp.cwd(ftp_dir)
-        self.ftp.dir(lines.append)
+        lines = self.session.call(list_ftp_dir_lines, ftp_dir)
         ftp_dirs = [ftp_dir + '/' + d for d in parse_ftp_dirs(folder_length, lines)]
         if ftp_dirs:
             dir_beg0 = dir_beg[:len(ftp_dirs[0])]
@@ -0,0 +1,60 @@
+import math
+import numpy as np
+
+
+def get_subset_window(bbox, geo_trans, nx, ny):
+    """Return the window of the cells of a north-up grid intersecting bbox
+
+    :param bbox: (lon_min, lat_min, lon_max, lat_max)
+    :param geo_trans: geotransform of the grid [x0, x_res, 0, y0, 0, -y_res]
+    :param nx: number of columns of the grid
+    :param ny: number of rows of the grid
+    :return: tuple (c0, c1, r0, r1), columns c0 to c1 - 1 and rows r0 to r1 - 1
+    :raise ValueError: if bbox does not intersect the grid
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    x0, x_res, _, y0, _, y_res = geo_trans
+    y_res = -y_res
+    c0 = max(0, int(math.floor((lon_min - x0) / x_res)))
+    c1 = min(nx, int(math.ceil((lon_max - x0) / x_res)))
+    r0 = max(0, int(math.floor((y0 - lat_max) / y_res)))
+    r1 = min(ny, int(math.ceil((y0 - lat_min) / y_res)))
+    if c0 >= c1 or r0 >= r1:
+        raise ValueError('bbox {} outside the grid'.format(bbox))
+    return c0, c1, r0, r1
+
+
+def get_subset_geo_trans(geo_trans, window):
+    c0, _, r0, _ = window
+    return [geo_trans[0] + c0 * geo_trans[1], geo_trans[1], 0, geo_trans[3] + r0 * geo_trans[5], 0, geo_trans[5]]
+
+
+def get_native_rows(window, ny, south_up=False):
+    """Return the rows (nr0, nr1) of the native grid (before flipping) containing the rows of window"""
+    _, _, r0, r1 = window
+    return (ny - r1, ny - r0) if south_up else (r0, r1)
+
+
+def read_native_subset(arr, nx, ny, window, south_up=False, shift=0):
+    """Return the cells of window as a new 2-D array, reading only the rows of arr containing them
+
+    The native grid arr is stored row by row, from south to north if south_up, and its columns are rolled by shift
+    with respect to the north-up output grid: output column c is native column (c + shift) % nx (e.g., shift nx / 2
+    for grids from 0 to 360 degrees east and output grids from -180 to 180).
+
+    :param arr: 1-D array (e.g., np.frombuffer or np.memmap) of at least ny * nx cells
+    :param nx: number of columns
+    :param ny: number of rows
+    :param window: (c0, c1, r0, r1) in the output grid, see get_subset_window
+    :param south_up: True if the first row of arr is the southernmost row
+    :param shift: see above
+    :return: array of shape (r1 - r0, c1 - c0), north-up
+    """
+    c0, c1, _, _ = window
+    nr0, nr1 = get_native_rows(window, ny, south_up)
+    rows = arr[nr0 * nx:nr1 * nx].reshape((nr1 - nr0, nx))
+    if shift:
+        sub = rows[:, (np.arange(c0, c1) + shift) % nx]  # also across the 0/360 seam
+    else:
+        sub = rows[:, c0:c1].copy()
+    return sub[::-1].copy() if south_up else sub
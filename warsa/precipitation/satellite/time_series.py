@@ -3,10 +3,14 @@ import time
 import collections
 import numpy as np
 import pandas as pd
-from osgeo import ogr
+from osgeo import gdal, ogr
 from girs.feat.layers import LayersReader
-from girs.rast.raster import RasterReader
+from girs.rast.parameter import RasterParameters
+from girs.rast.raster import RasterReader, RasterWriter
 from girs.rastfeat.zonal import zonal_stats
+from warsa.precipitation.satellite.cube import RasterCubeReader, get_cube_files
+from warsa.precipitation.satellite.geotiff import unscale_array
+from warsa.precipitation.satellite.subset import get_subset_geo_trans, get_subset_window
 from warsa.timeseries.timeseries import read_time_series, write_time_series
 
 
@@ -20,6 +24,31 @@ def print_verbose(msg, verbose=True, same_line=False):
     return None
 
 
+def read_raster_points(raster_filename, points):
+    """Return the values of the cells of the first band containing the points
+
+    Only the blocks containing the points are read, i.e., for tiled GeoTIFFs (see geotiff.write_geotiff) the tiles
+    covering the points instead of the whole raster.
+
+    :param raster_filename: raster file name
+    :param points: list of (x, y) in the coordinate system of the raster
+    :return: array of float32, unscaled (see geotiff.scale_array), NaN for nodata and points outside the raster
+    """
+    ds = gdal.Open(raster_filename)
+    gt = ds.GetGeoTransform()
+    band = ds.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    arr = np.full(len(points), np.nan)
+    for k, (x, y) in enumerate(points):
+        i = int(np.floor((x - gt[0]) / gt[1]))
+        j = int(np.floor((y - gt[3]) / gt[5]))
+        if 0 <= i < ds.RasterXSize and 0 <= j < ds.RasterYSize:
+            v = band.ReadAsArray(i, j, 1, 1)[0, 0]
+            if nodata is None or v != v.dtype.type(nodata):  # nodata as stored, e.g., rounded to float32
+                arr[k] = v
+    return unscale_array(arr, None, band.GetScale(), band.GetOffset())
+
+
 def create_time_series_from_rasters_to_points(df_geo, df_ts, datetime_dict):
     """
 
@@ -43,13 +72,7 @@ def create_time_series_from_rasters_to_points(df_geo, df_ts, datetime_dict):
                 raise e
             if row.name.day == 1:
                 print_verbose('{}-{}: {}'.format(row.name.year, row.name.month, rs_filename))
-            r = RasterReader(rs_filename)
-            nodata = r.get_nodata()
-            arr = r.get_array().astype(np.float32)
-            pixel_coords = [r.world_to_pixel(*geo_dict[name]) for name in row.index]
-            arr = np.array([arr[j][i] for i, j in pixel_coords])
-            arr[arr == nodata] = np.nan
-            return arr
+            return read_raster_points(rs_filename, [geo_dict[name] for name in row.index])
         else:
             return row
 
@@ -58,6 +81,94 @@ def create_time_series_from_rasters_to_points(df_geo, df_ts, datetime_dict):
     return df_ts
 
 
+def create_time_series_from_cubes_to_points(df_geo, columns, cube_reader):
+    """Read the time series of the points from the cubes (see cube.RasterCubeWriter)
+
+    :param df_geo: station names as index and geometry-wkb as column '_GEOM_', in the coordinate system of the cubes
+    :param columns: column names of the time series
+    :param cube_reader: RasterCubeReader
+    :return: DataFrame with datetime as index and columns, NaN for nodata and points outside the cubes
+    """
+    t0 = time.time()
+    print_verbose('Creating time series from cubes to points')
+    points = [ogr.CreateGeometryFromWkb(gb) for gb in df_geo['_GEOM_']]
+    cells = [cube_reader.world_to_pixel(g.GetX(), g.GetY()) for g in points]
+    inside = [k for k, c in enumerate(cells) if c is not None]
+    datetimes, values = cube_reader.read_cells([cells[k] for k in inside])
+    arr = np.full((len(datetimes), len(columns)), np.nan, dtype=np.float32)
+    arr[:, inside] = values
+    df_ts = pd.DataFrame(arr, index=datetimes, columns=columns)
+    print_verbose(' done in {:.2f} seconds'.format(time.time()-t0))
+    return df_ts
+
+
+def get_zone_masks(geometries, geo_trans, nx, ny):
+    """Burn the polygons on the grid once and return the cells of each polygon
+
+    Each polygon is burned alone, so that the cells of overlapping polygons belong to each of them. As for
+    gdal.RasterizeLayer, a cell belongs to a polygon if its center is inside the polygon.
+
+    :param geometries: list of ogr polygons in the coordinate system of the grid
+    :param geo_trans: geotransform of the grid
+    :param nx: number of columns of the grid
+    :param ny: number of rows of the grid
+    :return: tuple (window, masks), window (c0, c1, r0, r1) of the cells intersecting the envelope of all polygons (see
+        subset.get_subset_window) and masks, one 2-D boolean array of the cells of window per polygon
+    """
+    envelopes = [g.GetEnvelope() for g in geometries]  # (x_min, x_max, y_min, y_max)
+    bbox = (min([e[0] for e in envelopes]), min([e[2] for e in envelopes]), max([e[1] for e in envelopes]),
+            max([e[3] for e in envelopes]))
+    window = get_subset_window(bbox, geo_trans, nx, ny)
+    c0, c1, r0, r1 = window
+    ds = gdal.GetDriverByName('MEM').Create('', c1 - c0, r1 - r0, 1, gdal.GDT_Byte)
+    ds.SetGeoTransform(get_subset_geo_trans(geo_trans, window))
+    band = ds.GetRasterBand(1)
+    layer = ogr.GetDriverByName('Memory').CreateDataSource('').CreateLayer('zones')
+    masks = []
+    for g in geometries:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(g)
+        layer.CreateFeature(feature)
+        band.Fill(0)
+        gdal.RasterizeLayer(ds, [1], layer, burn_values=[1])
+        masks.append(band.ReadAsArray() == 1)
+        layer.DeleteFeature(feature.GetFID())
+    return window, masks
+
+
+def create_time_series_from_cubes_to_polygons(df_geo, columns, cube_reader):
+    """Read the time series of the mean of the polygons from the cubes (see cube.RasterCubeWriter)
+
+    The polygons are burned once on the grid of the cubes (see get_zone_masks) and the masked means are computed for
+    all polygons from each time chunk read (see RasterCubeReader.read_zonal_means).
+
+    :param df_geo: polygon names as index and geometry-wkb as column '_GEOM_', in the coordinate system of the cubes
+    :param columns: column names of the time series
+    :param cube_reader: RasterCubeReader
+    :return: DataFrame with datetime as index and columns, NaN if no cell of a polygon has data
+    """
+    t0 = time.time()
+    print_verbose('Creating time series from cubes to polygons')
+    polygons = [ogr.CreateGeometryFromWkb(gb) for gb in df_geo['_GEOM_']]
+    try:
+        window, masks = get_zone_masks(polygons, cube_reader.geo_trans, cube_reader.nx, cube_reader.ny)
+    except ValueError:  # all polygons outside the cubes
+        window, masks = (0, 1, 0, 1), [np.zeros((1, 1), dtype=bool) for _ in polygons]
+    datetimes, values = cube_reader.read_zonal_means(window, masks)
+    df_ts = pd.DataFrame(values, index=datetimes, columns=columns)
+    print_verbose(' done in {:.2f} seconds'.format(time.time()-t0))
+    return df_ts
+
+
+def get_scale_offset(raster_filename):
+    """Return the scale and the offset of the first band of raster_filename, (None, None) if not scaled"""
+    band = gdal.Open(raster_filename).GetRasterBand(1)
+    scale_factor, offset = band.GetScale(), band.GetOffset()
+    if scale_factor in (None, 1.0) and offset in (None, 0.0):
+        return None, None
+    return scale_factor, offset
+
+
 def create_time_series_from_rasters_to_polygons(lrs, layer_fieldname, columns, df, datetime_dict):
     try:
         lrs = LayersReader(lrs)
@@ -70,7 +181,11 @@ def create_time_series_from_rasters_to_polygons(lrs, layer_fieldname, columns, d
         if np.isnan(df.iloc[i].values.tolist()).any():
             rs_filename = datetime_dict[df.index[i].to_datetime()]
             zs = zonal_stats(lrs, rs_filename, layer_fieldname, ['mean'])
-            df.iloc[i] = [zs[column][1][0] for column in columns]
+            values = [zs[column][1][0] for column in columns]
+            scale_factor, offset = get_scale_offset(rs_filename)
+            if scale_factor is not None or offset is not None:  # the mean of scaled integers (see geotiff.scale_array)
+                values = unscale_array(np.array(values, dtype=np.float64), None, scale_factor, offset)
+            df.iloc[i] = values
         if i % 10 == 0:
             t0 = print_verbose('{} - {:d} of {:d}: {:.2f} seconds'.format(rs_filename, i, len_df, time.time()-t0))
 
@@ -139,6 +254,8 @@ def create_time_series(time_series_filename, raster_dir, layers, get_datetime_fr
         :key layer_number:
         :key raster_suffix:
         :key float_format:
+    If raster_dir contains cubes (see cube.RasterCubeWriter), the time series of points and polygons are read from
+    the cubes
 
     :return:
     """
@@ -156,12 +273,18 @@ def create_time_series(time_series_filename, raster_dir, layers, get_datetime_fr
     is_geometry_polygon = layers.is_geometry_polygon().all()
     assert is_geometry_point or is_geometry_polygon
 
-    # create a ordered dictionary {datetime: raster_file_name} sorted by key
-    rasterized_files = get_rasterized_files(raster_dir, raster_suffix)
-    datetime_dict = dict([(get_datetime_from_raster_file(rf), rf) for rf in rasterized_files])
-    datetime_dict = collections.OrderedDict([(k, datetime_dict[k]) for k in sorted(datetime_dict.keys())])
-
-    r = RasterReader(rasterized_files[0])
+    cube_filenames = get_cube_files(raster_dir)  # see Rasterizer output_format 'cube'
+    if cube_filenames:
+        cube_reader = RasterCubeReader(cube_filenames)
+        rp = RasterParameters(1, 1, cube_reader.geo_trans, cube_reader.srs, 1, 0, gdal.GDT_Byte)
+        rp.driverShortName = 'MEM'
+        r = RasterWriter(rp)  # coordinate system of the cubes
+    else:
+        # create a ordered dictionary {datetime: raster_file_name} sorted by key
+        rasterized_files = get_rasterized_files(raster_dir, raster_suffix)
+        datetime_dict = dict([(get_datetime_from_raster_file(rf), rf) for rf in rasterized_files])
+        datetime_dict = collections.OrderedDict([(k, datetime_dict[k]) for k in sorted(datetime_dict.keys())])
+        r = RasterReader(rasterized_files[0])
     layers = layers.transform(r)
 
     # get the field values, which correspond to columns in the time series
@@ -172,6 +295,14 @@ def create_time_series(time_series_filename, raster_dir, layers, get_datetime_fr
         df_geo = layers.get_geometries().sort_index()
         columns = df_geo.index.tolist()  # FID
 
+    if cube_filenames:
+        if is_geometry_point:
+            df_ts = create_time_series_from_cubes_to_points(df_geo, ['P{}'.format(c) for c in columns], cube_reader)
+        else:
+            df_ts = create_time_series_from_cubes_to_polygons(df_geo, ['P{}'.format(c) for c in columns], cube_reader)
+        write_time_series(df_ts, time_series_filename, float_format=float_format)
+        return df_ts
+
     df_ts = None
     if os.path.isfile(time_series_filename):
         # if a time series exists, then its columns must be equal the ones found above
@@ -0,0 +1,147 @@
+import os
+import bz2
+import gzip
+import zlib
+import numpy as np
+from warsa.utils.partfile import replace_file
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+TRANSCODED_DIR = '.transcoded'
+CODECS = {'npy': '.npy', 'zstd': '.zst', 'lz4': '.lz4'}
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.Z')
+
+
+def decompress_file(filename, size=None):
+    """Return the decompressed content of a .gz, .bz2 or .Z file
+
+    :param filename: full path of the compressed file
+    :param size: if given, only the first size bytes of the content are decompressed and returned
+    """
+    s = os.path.splitext(filename)
+    if '.bz2' in s[-1]:
+        if size is not None:
+            bf = bz2.BZ2File(filename, 'rb')
+            try:
+                return bf.read(size)
+            finally:
+                bf.close()
+        with open(filename, 'rb') as f:
+            return bz2.decompress(f.read())
+    elif '.gz' in s[-1]:
+        gf = gzip.GzipFile(filename, 'rb')
+        d = gf.read(size if size is not None else -1)
+        gf.close()
+        return d
+    elif '.Z' in s[-1]:
+        with open(filename) as f:
+            if size is not None:
+                return zlib.decompressobj().decompress(f.read(), size)
+            return zlib.decompress(f.read())
+    else:
+        raise Exception('Rasterizer.read_compressed_file: file type unknown ({}).'.format(filename))
+
+
+def get_transcoded_filename(filename, codec='npy'):
+    """Return the name of the transcoded copy of filename: dir/.transcoded/basename + codec extension"""
+    return os.path.join(os.path.dirname(filename), TRANSCODED_DIR, os.path.basename(filename) + CODECS[codec])
+
+
+def find_transcoded_file(filename):
+    """Return the name of a transcoded copy of filename not older than filename or None if not found"""
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        mtime = None  # only the transcoded copy was kept
+    for codec in ['npy', 'zstd', 'lz4']:
+        transcoded_filename = get_transcoded_filename(filename, codec)
+        if os.path.isfile(transcoded_filename) and (mtime is None or os.path.getmtime(transcoded_filename) >= mtime):
+            return transcoded_filename
+    return None
+
+
+def read_transcoded_file(transcoded_filename):
+    """Return the decompressed content of a transcoded file
+
+    For npy, the content is returned as a read-only memory-mapped uint8 array, which can be passed to np.frombuffer
+    without reading the file.
+    """
+    ext = os.path.splitext(transcoded_filename)[1]
+    if ext == CODECS['npy']:
+        return np.load(transcoded_filename, mmap_mode='r')
+    with open(transcoded_filename, 'rb') as f:
+        data = f.read()
+    if ext == CODECS['zstd']:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return lz4_frame.decompress(data)
+
+
+def transcode_file(filename, codec='npy', overwrite=False):
+    """Save the decompressed content of a .gz, .bz2 or .Z file re-encoded with a fast codec
+
+    The copy is saved as get_transcoded_filename(filename, codec) and preferred by Rasterizer.read_compressed_file.
+    Codecs:
+        npy: uncompressed numpy uint8 array, memory-mapped when read (default)
+        zstd: zstandard compressed (requires zstandard)
+        lz4: lz4 frame compressed (requires lz4)
+
+    :param filename: full path of the compressed product file. Other files are ignored
+    :param codec: see above
+    :param overwrite: if False, an up-to-date transcoded copy is not created again
+    :return: name of the transcoded file or None if filename is not compressed
+    """
+    if not filename.endswith(COMPRESSED_EXTENSIONS):
+        return None
+    transcoded_filename = get_transcoded_filename(filename, codec)
+    if not overwrite and find_transcoded_file(filename) == transcoded_filename:
+        return transcoded_filename
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError('codec zstd requires zstandard (pip install zstandard)')
+    if codec == 'lz4' and lz4_frame is None:
+        raise ImportError('codec lz4 requires lz4 (pip install lz4)')
+    data = decompress_file(filename)
+    d = os.path.dirname(transcoded_filename)
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:  # created meanwhile by another thread
+            if not os.path.isdir(d):
+                raise
+    tmp_filename = transcoded_filename + '.tmp'
+    if codec == 'npy':
+        with open(tmp_filename, 'wb') as f:
+            np.save(f, np.frombuffer(data, dtype=np.uint8))
+    else:
+        data = zstandard.ZstdCompressor().compress(data) if codec == 'zstd' else lz4_frame.compress(data)
+        with open(tmp_filename, 'wb') as f:
+            f.write(data)
+    replace_file(tmp_filename, transcoded_filename)
+    return transcoded_filename
+
+
+def transcode_folder(product_dir, suffix, codec='npy', overwrite=False, verbose=False):
+    """Transcode all product files found in product_dir (see transcode_file)
+
+    :param product_dir: local product directory
+    :param suffix: suffix or tuple of suffixes of the product files, e.g., Rasterizer.suffix
+    :return: number of product files having an up-to-date transcoded copy
+    """
+    suffix = tuple([suffix]) if isinstance(suffix, basestring) else tuple(suffix)
+    n = 0
+    for root, dirs, files in os.walk(product_dir):
+        dirs[:] = sorted([d for d in dirs if not d.startswith('.')])
+        for f in sorted(files):
+            if f.endswith(suffix) and transcode_file(os.path.join(root, f), codec, overwrite):
+                n += 1
+                if verbose:
+                    print '{}; transcoded ({})'.format(f, codec)
+    return n
@@ -0,0 +1,153 @@
+import os
+from ftplib import error_perm, error_reply
+from warsa.utils.partfile import part_filename, replace_file
+
+
+def retrbinary(ftp, cmd, callback, blocksize=8192, rest=None):
+    """Same as ftplib.FTP.retrbinary, but return also the transfer size announced by the server in its 150 reply
+
+    :return: tuple (response of the server, announced size or None)
+    """
+    ftp.voidcmd('TYPE I')
+    conn, size = ftp.ntransfercmd(cmd, rest)
+    try:
+        while 1:
+            data = conn.recv(blocksize)
+            if not data:
+                break
+            callback(data)
+    finally:
+        conn.close()
+    return ftp.voidresp(), size
+
+
+def part_mtime_filename(local_filename):
+    """Return the name of the file keeping the modification time on the server of the file being transferred to the
+    partial file of local_filename (ends with '.part', like the partial file)
+    """
+    return part_filename(local_filename + '.mdtm')
+
+
+def _read_part_mtime(local_filename):
+    filename = part_mtime_filename(local_filename)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename) as f:
+        return f.read().strip() or None
+
+
+def _write_part_mtime(local_filename, remote_mtime):
+    filename = part_mtime_filename(local_filename)
+    if remote_mtime:
+        with open(filename, 'w') as f:
+            f.write(remote_mtime)
+    elif os.path.isfile(filename):
+        os.remove(filename)
+
+
+def get_resume_offset(ftp, ftp_filename, local_filename, remote_mtime=None):
+    """Return the offset at which the transfer of ftp_filename to the partial file of local_filename can restart, 0
+    if there is no partial file or if it is not part of the current file on the server
+
+    The partial file is discarded if it is larger than the file on the server (SIZE), if the modification time of
+    the file on the server differs from the one kept when the partial file was started (see part_mtime_filename) or,
+    if no modification time is known, if it has the size of the file on the server (a complete file may be an older
+    version).
+
+    :param remote_mtime: see retrieve_ftp_file
+    """
+    local_part_filename = part_filename(local_filename)
+    offset = os.path.getsize(local_part_filename) if os.path.isfile(local_part_filename) else 0
+    if not offset:
+        return 0
+    ftp.voidcmd('TYPE I')  # some servers refuse SIZE in ASCII mode
+    remote_size = get_ftp_file_size(ftp, ftp_filename)
+    if remote_size is not None and offset > remote_size:
+        return 0
+    if remote_mtime:
+        return offset if _read_part_mtime(local_filename) == remote_mtime else 0
+    return offset if remote_size is None or offset < remote_size else 0
+
+
+def retrieve_ftp_file(ftp, ftp_filename, local_filename, resume=True, blocksize=8192, remote_mtime=None):
+    """Download ftp_filename to local_filename through a partial file local_filename + '.part'
+
+    If a partial file from a previous (failed) transfer exists and is part of the current file on the server (see
+    get_resume_offset), the transfer restarts at its size using the ftp REST command, otherwise from the beginning.
+    The modification time of the file on the server is kept next to the partial file while it is transferred. The
+    partial file is renamed to local_filename only after the transfer is complete. On failure the partial file is
+    kept, so that the next call resumes it.
+
+    :param ftp: logged-in ftplib.FTP instance
+    :param ftp_filename: full path of the file on the server
+    :param local_filename: full path of the local file
+    :param resume: if False, an existing partial file is discarded
+    :param blocksize: see ftplib.FTP.retrbinary
+    :param remote_mtime: modification time of the file on the server, e.g., the timestamp of a directory listing,
+        None to query it with the MDTM command (one command per file) or False not to check modification times (a
+        partial file is then only checked against the size on the server)
+    :return: response of the server, e.g., '226 Transfer complete.'
+    """
+    return retrieve_ftp_file_with_size(ftp, ftp_filename, local_filename, resume, blocksize, remote_mtime)[0]
+
+
+def retrieve_ftp_file_with_size(ftp, ftp_filename, local_filename, resume=True, blocksize=8192, remote_mtime=None):
+    """Same as retrieve_ftp_file, but return also the size of the file announced by the server when the transfer
+    started (e.g., '150 Opening BINARY mode data connection for f.gz (1024 bytes)'), without additional ftp command
+
+    :return: tuple (response of the server, size or None if not announced or if the transfer was resumed)
+    """
+    local_part_filename = part_filename(local_filename)
+    if remote_mtime is None:
+        remote_mtime = get_ftp_file_mtime(ftp, ftp_filename)
+    offset = get_resume_offset(ftp, ftp_filename, local_filename, remote_mtime) if resume else 0
+    _write_part_mtime(local_filename, remote_mtime)
+    try:
+        try:
+            with open(local_part_filename, 'ab' if offset else 'wb') as f:
+                resp, size = retrbinary(ftp, 'RETR ' + ftp_filename, f.write, blocksize, offset or None)
+        except error_perm, e:
+            if not offset or str(e).startswith('550'):
+                raise
+            # REST not supported by the server: restart from the beginning
+            offset = 0
+            with open(local_part_filename, 'wb') as f:
+                resp, size = retrbinary(ftp, 'RETR ' + ftp_filename, f.write, blocksize)
+    except Exception:
+        # Nothing received (e.g., file not found): do not leave an empty partial file
+        if os.path.isfile(local_part_filename) and os.path.getsize(local_part_filename) == 0:
+            os.remove(local_part_filename)
+            _write_part_mtime(local_filename, None)
+        raise
+    replace_file(local_part_filename, local_filename)
+    _write_part_mtime(local_filename, None)
+    return resp, size if not offset else None  # the size announced after REST may be the remaining size
+
+
+def get_ftp_file_size(ftp, ftp_filename):
+    """Return the size of ftp_filename on the server using the SIZE command, or None if not returned by the server"""
+    try:
+        return ftp.size(ftp_filename)
+    except (error_perm, error_reply):
+        return None
+
+
+def get_ftp_file_mtime(ftp, ftp_filename):
+    """Return the modification time (YYYYMMDDHHMMSS) of ftp_filename on the server using the MDTM command, or None if
+    not returned by the server
+    """
+    try:
+        return ftp.sendcmd('MDTM ' + ftp_filename).split()[-1]
+    except (error_perm, error_reply):
+        return None
+
+
+def get_ftp_file_info(ftp, ftp_filename):
+    """Return the size and the modification time (YYYYMMDDHHMMSS) of ftp_filename on the server
+
+    Uses the SIZE and MDTM commands, which are not supported by all servers. Some servers refuse SIZE in ASCII mode,
+    call it after a binary transfer (retrbinary).
+
+    :return: tuple (size, mtime), each None if not returned by the server
+    """
+    return get_ftp_file_size(ftp, ftp_filename), get_ftp_file_mtime(ftp, ftp_filename)
@@ -22,6 +22,8 @@ class TRMMopen3B40RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
         3B40RT.2000030100.7R2.bin.gz
         3B40RT.2016111109.7.bin.gz
     """
+    file_frequency = '3H'
+
     def __init__(self, local_dir):
         super(TRMMopen3B40RTv7x3hFTP, self).__init__(local_dir, '3B40RT.', '.gz', [4, 2],
                                                      'trmmopen.gsfc.nasa.gov', '/pub/merged/combinedMicro/')
@@ -30,6 +32,10 @@ class TRMMopen3B40RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('.')[1], '%Y%m%d%H')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('3B40RT.%Y%m%d%H') + s for s in ['.7.bin.gz', '.7R2.bin.gz']]
+
 
 class TRMMopen3B41RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Source
@@ -37,6 +43,8 @@ class TRMMopen3B41RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     Format:
         3B41RT.2000030100.7R2.bin.gz
     """
+    file_frequency = '3H'
+
     def __init__(self, local_dir):
         super(TRMMopen3B41RTv7x3hFTP, self).__init__(local_dir, '3B41RT.', '.gz', [4, 2],
                                                      'trmmopen.gsfc.nasa.gov', '/pub/merged/calibratedIR/')
@@ -45,6 +53,10 @@ class TRMMopen3B41RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('.')[1], '%Y%m%d%H')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('3B41RT.%Y%m%d%H') + s for s in ['.7.bin.gz', '.7R2.bin.gz']]
+
 
 class TRMMopen3B42RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Source
@@ -52,6 +64,8 @@ class TRMMopen3B42RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     Format:
         3B42RT.2000030100.7R2.bin.gz
     """
+    file_frequency = '3H'
+
     def __init__(self, local_dir):
         super(TRMMopen3B42RTv7x3hFTP, self).__init__(local_dir, '3B42RT.', '.gz', [4, 2],
                                                      'trmmopen.gsfc.nasa.gov', '/pub/merged/mergeIRMicro/')
@@ -60,6 +74,10 @@ class TRMMopen3B42RTv7x3hFTP(SatelliteBasedPrecipitationDownloadFTP):
     def get_datetime_from_file_name(filename):
         return datetime.datetime.strptime(os.path.splitext(filename)[0].split('.')[1], '%Y%m%d%H')
 
+    @staticmethod
+    def get_file_names_from_datetime(dt):
+        return [dt.strftime('3B42RT.%Y%m%d%H') + s for s in ['.7.bin.gz', '.7R2.bin.gz']]
+
 
 class TRMMopen3B42RTv7x3hGISFTP(SatelliteBasedPrecipitationDownloadFTP):
     """Source
@@ -2,12 +2,14 @@ import os
 import gzip
 import tempfile
 import numpy as np
-from osgeo import gdal, osr
+from osgeo import gdal
 from netCDF4 import Dataset
 from girs.srs import srs_from_epsg
 from girs.rast.raster import RasterWriter
-from girs.rast.parameter import RasterParameters, get_parameters
+from girs.rast.parameter import get_parameters
 from warsa.precipitation.satellite.rasterize import Rasterizer
+from warsa.precipitation.satellite.grid import ArrayRaster, get_grid
+from warsa.precipitation.satellite.subset import get_native_rows, read_native_subset
 
 
 class TRMMnascom3B42RTv7x3hRasterize(Rasterizer):
@@ -17,8 +19,7 @@ class TRMMnascom3B42RTv7x3hRasterize(Rasterizer):
         super(TRMMnascom3B42RTv7x3hRasterize, self).__init__(product_dir, output_raster_dir, suffix='.nc4', **kwargs)
 
     def get_rasters(self, product_filename):
-        output_raster = product_filename[:-4] + '.tif'
-        output_raster = output_raster.replace(self.product_dir, self.output_raster_dir)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         result = []
         if self.overwrite or not os.path.isfile(output_raster):
             rp_sds = get_parameters(gdal.Open(gdal.Open(product_filename, gdal.GA_ReadOnly).GetSubDatasets()[0][0]))
@@ -30,6 +31,9 @@ class TRMMnascom3B42RTv7x3hRasterize(Rasterizer):
         for r in result:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        return [(product_filename[:-4] + '.tif').replace(self.product_dir, self.output_raster_dir)]
+
 
 class TRMMnascom3B42V7x3hRasterize(Rasterizer):
 
@@ -40,8 +44,7 @@ class TRMMnascom3B42V7x3hRasterize(Rasterizer):
     def get_rasters(self, product_filename):
         # nx, ny = 1440, 400
 
-        output_raster = product_filename[:-4] + '.tif'
-        output_raster = output_raster.replace(self.product_dir, self.output_raster_dir)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         results = []
         if self.overwrite or not os.path.isfile(output_raster):
             ds = gdal.Open(gdal.Open(product_filename).GetSubDatasets()[0][0])
@@ -66,6 +69,9 @@ class TRMMnascom3B42V7x3hRasterize(Rasterizer):
         for r in results:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        return [(product_filename[:-4] + '.tif').replace(self.product_dir, self.output_raster_dir)]
+
 
 class TRMMnascom3B42V7xDailyRasterize(Rasterizer):
 
@@ -76,8 +82,7 @@ class TRMMnascom3B42V7xDailyRasterize(Rasterizer):
     def get_rasters(self, product_filename):
         # nx, ny = 1440, 400
 
-        output_raster = product_filename[:-4] + '.tif'
-        output_raster = output_raster.replace(self.product_dir, self.output_raster_dir)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         results = []
         if self.overwrite or not os.path.isfile(output_raster):
             ds = gdal.Open(gdal.Open(product_filename).GetSubDatasets()[0][0])
@@ -93,11 +98,17 @@ class TRMMnascom3B42V7xDailyRasterize(Rasterizer):
         for r in results:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        return [(product_filename[:-4] + '.tif').replace(self.product_dir, self.output_raster_dir)]
+
 
 # =============================================================================
 # TRMM trmmopen
 # =============================================================================
 class TRMMopen3B4xRTv7x3hRasterize(Rasterizer):
+
+    transcodable = True
+
     def __init__(self, product_dir, output_raster_dir, **kwargs):
         super(TRMMopen3B4xRTv7x3hRasterize, self).__init__(product_dir, output_raster_dir, '.gz', **kwargs)
 
@@ -149,35 +160,41 @@ class TRMMopen3B4xRTv7x3hRasterize(Rasterizer):
         nx, ny = 1440, 480
         x_res, y_res = 0.25, 0.25
         nodata = -999.0
-        output_raster = '.'.join(os.path.basename(product_filename).split('.')[:-2]) + '.tif'
-        f = output_raster.split('.')[1]
-        output_raster = os.path.join(self.output_raster_dir, f[:4], f[4:6], output_raster)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         results = []
         if self.overwrite or not os.path.isfile(output_raster):
-            gf = gzip.GzipFile(product_filename, 'rb')
             try:
-                d = gf.read()
-                gf.close()
+                grid = get_grid(nx, ny, [-180.0, x_res, 0, 60.0, 0, -y_res], 4326, nodata)  # wgs1984
+                window = self.get_window(grid.geo_trans, nx, ny)
+                size = (1440 + get_native_rows(window, ny)[1] * nx) * 2 if window else None
+                d = self.read_compressed_file(product_filename, size)
                 arr = np.frombuffer(d, dtype='>i2')
                 arr = arr[1440:692640]  # arr[2880/2, 1440 + (1440 * 480)]
+                if window:
+                    arr = read_native_subset(arr, nx, ny, window, shift=nx/2)
+                    grid = grid.subset(window)
+                else:
+                    arr = arr.reshape((ny, nx))
+                    arr = np.append(arr[:, nx/2:], arr[:, :nx/2], axis=1)
                 arr = arr.astype(np.float32)
                 arr = arr * 0.03  # 3 hourly data scaled by 100 to depth (mm) in the time interval
                 # Set high-latitude HQ+VAR precipitation values and highly ambiguous HQ values to nodata.
                 arr[arr < 0] = nodata
-                arr = arr.reshape((ny, nx))
-                arr = np.append(arr[:, nx/2:], arr[:, :nx/2], axis=1)
-                tran = [-180.0, x_res, 0, 60.0, 0, -y_res]
-                srs = osr.SpatialReference()
-                srs.ImportFromEPSG(4326)  # wgs1984
-                rp = RasterParameters(nx, ny, tran, srs.ExportToWkt(), 1, nodata, gdal.GDT_Float32, 'mem')
-                ds_out = self.create_dataset(rp, arr)
-                results.append([output_raster, ds_out])
+                results.append([output_raster, ArrayRaster(grid, arr)])
             except Exception, e:
                 print e.message, product_filename
 
         for r in results:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        """Return the raster of product_filename in a folder per year and month, e.g.,
+        2000/03/3B42RT.2000030100.7R2.tif
+        """
+        output_raster = '.'.join(os.path.basename(product_filename).split('.')[:-2]) + '.tif'
+        f = output_raster.split('.')[1]
+        return [os.path.join(self.output_raster_dir, f[:4], f[4:6], output_raster)]
+
 
 class TRMMopen3B40RTv7x3hRasterize(TRMMopen3B4xRTv7x3hRasterize):
     def __init__(self, product_dir, output_raster_dir, **kwargs):
@@ -200,8 +217,7 @@ class TRMMopen3B42RTv7x3hGISRasterize(Rasterizer):
 
     def get_rasters(self, product_filename):
         nodata = 999.0
-        bn = os.path.basename(product_filename)
-        output_raster = os.path.join(self.output_raster_dir, bn)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         results = []
         if self.overwrite or not os.path.isfile(output_raster):
             ds, _ = self.open_raster(product_filename)
@@ -216,6 +232,9 @@ class TRMMopen3B42RTv7x3hGISRasterize(Rasterizer):
         for r in results:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        return [os.path.join(self.output_raster_dir, os.path.basename(product_filename))]
+
 
 class TRMMopen3B42v7x3hRasterize(Rasterizer):
     def __init__(self, product_dir, output_raster_dir, **kwargs):
@@ -224,8 +243,7 @@ class TRMMopen3B42v7x3hRasterize(Rasterizer):
     def get_rasters(self, product_filename):
         # nx, ny = 1440, 400
         results = []
-        output_raster = product_filename[:-4] + '.tif'
-        output_raster = output_raster.replace(self.product_dir, self.output_raster_dir)
+        output_raster = self.get_raster_file_names(product_filename)[0]
         if self.overwrite or not os.path.isfile(output_raster):
             tmp_file = tempfile.NamedTemporaryFile(prefix='TRMMopen3B42v7x3hRasterize', suffix='.HDF', delete=False)
             gf = gzip.GzipFile(product_filename, 'rb')
@@ -251,6 +269,9 @@ class TRMMopen3B42v7x3hRasterize(Rasterizer):
         for r in results:
             yield r
 
+    def get_raster_file_names(self, product_filename):
+        return [(product_filename[:-4] + '.tif').replace(self.product_dir, self.output_raster_dir)]
+
 
 class TRMMopen3B42v7x3hGISRasterize(Rasterizer):
     def __init__(self, product_dir, output_raster_dir, **kwargs):
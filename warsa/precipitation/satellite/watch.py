@@ -0,0 +1,197 @@
+import os
+import time
+import datetime
+import threading
+import _strptime  # datetime.strptime imports it lazily, which is not thread-safe
+from ftplib import error_perm
+from warsa.precipitation.satellite.download import print_verbose
+from warsa.precipitation.satellite.ftp_cache import parse_ftp_list_line
+from warsa.precipitation.satellite.ftp_pool import FTPSession, list_ftp_dir_lines
+from warsa.utils.retry import RetryPolicy
+
+
+class ProductWatcher(object):
+    """Download the files of a near-real-time product within seconds of their publication
+
+    The watcher keeps one ftp session open and, at each poll, lists only the newest leaf directories on the server:
+    the directory of now - lookback and the directory of now, i.e., the current directory and, around directory
+    boundaries, the previous one. The listing is compared with the listing of the previous poll kept in memory and only
+    new files are downloaded. At the first poll, files of the listed directories not found locally are downloaded.
+
+    The download object must implement get_ftp_dir_name(dt), valid_filename(name) and download_ftp_file(ftp,
+    ftp_filename), e.g., SatelliteBasedPrecipitationDownloadFTP, GPMImerg3BHHRearlyFTP and CMorphV0x8km30minFTP.
+
+    Usage:
+        watcher = ProductWatcher(GPMImerg3BHHRearlyFTP(local_dir, user, password), interval=60)
+        watcher.run()  # until interrupted or stop() is called
+    """
+
+    def __init__(self, download_obj, interval=60, lookback=datetime.timedelta(days=1), rasterizer=None,
+                 rasterize_workers=1, keepalive=60, verbose=True, utc=True):
+        """
+
+        :param download_obj: download object (see above)
+        :param interval: seconds between two polls
+        :param lookback: timedelta. The directory of now - lookback is listed besides the current one
+        :param rasterizer: Rasterizer instance or None. If given, downloaded files are rasterized (see
+            pipeline.RasterizePipeline)
+        :param rasterize_workers: number of rasterization threads
+        :param keepalive: seconds between two NOOP commands keeping the session open while waiting, None to disable
+        :param verbose: if True, outputs each poll and each downloaded file
+        :param utc: if True, the current time is taken in UTC, otherwise in local time
+        """
+        self.download_obj = download_obj
+        self.interval = interval
+        self.lookback = lookback
+        self.rasterizer = rasterizer
+        self.rasterize_workers = rasterize_workers
+        self.keepalive = keepalive
+        self.verbose = verbose
+        self.utc = utc
+        self.session = None
+        self.pipeline = None
+        self.known = None  # full names of the files listed at the previous poll
+        self.polls = 0
+        self.downloaded = 0
+        self.stop_event = threading.Event()
+
+    def now(self):
+        return datetime.datetime.utcnow() if self.utc else datetime.datetime.now()
+
+    def create_session(self):
+        obj = self.download_obj
+        if hasattr(obj, 'create_ftp_session'):
+            return obj.create_ftp_session()
+        return FTPSession(obj.ftp_host, obj.ftp_user, obj.ftp_password, obj.ftp_timeout,
+                          retry_policy=RetryPolicy(), port=getattr(obj, 'ftp_port', 0))
+
+    def start(self):
+        self.download_obj.verbose = self.verbose
+        self.stop_event.clear()
+        if self.session is None:
+            self.session = self.create_session()
+        if self.rasterizer is not None and self.pipeline is None:
+            from warsa.precipitation.satellite.pipeline import RasterizePipeline
+            self.pipeline = RasterizePipeline(self.rasterizer, self.rasterize_workers, verbose=self.verbose)
+            self.pipeline.start()
+            self.download_obj.add_file_listener(self.pipeline.put)
+
+    def close(self):
+        try:
+            if self.pipeline is not None:
+                try:
+                    self.download_obj.remove_file_listener(self.pipeline.put)
+                finally:
+                    self.pipeline.close()
+                    self.pipeline = None
+        finally:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def stop(self):
+        """Stop run() after the current poll"""
+        self.stop_event.set()
+
+    def get_watch_dirs(self, now):
+        """Return the server directories listed at each poll, the newest last"""
+        ftp_dirs = [self.download_obj.get_ftp_dir_name(now - self.lookback), self.download_obj.get_ftp_dir_name(now)]
+        return sorted(set(ftp_dirs))
+
+    def list_ftp_files(self, ftp_dir):
+        """Return the full names of the product files in ftp_dir, an empty list if ftp_dir does not exist (yet)
+
+        The sizes and modification times listed are passed to the download object (set_remote_entries), so that the
+        downloaded files are verified without querying the server again.
+        """
+        try:
+            lines = self.session.call(list_ftp_dir_lines, ftp_dir)
+        except error_perm, e:
+            if not str(e).startswith('550'):
+                raise
+            return []
+        entries = [parse_ftp_list_line(line) for line in lines if line.strip()]
+        if hasattr(self.download_obj, 'set_remote_entries'):
+            self.download_obj.set_remote_entries(ftp_dir, entries)
+        ftp_files = []
+        for name, is_dir, _, _ in entries:
+            if not is_dir and self.download_obj.valid_filename(name):
+                ftp_files.append('/' + '/'.join([f for f in '/'.join([ftp_dir, name]).split('/') if f]))
+        return ftp_files
+
+    def is_local(self, ftp_filename):
+        obj = self.download_obj
+        return os.path.isfile(ftp_filename.replace(obj.ftp_dir, obj.local_dir, 1))
+
+    def poll(self):
+        """List the newest server directories and download the files published since the previous poll
+
+        :return: list of the downloaded files (server names)
+        """
+        if self.session is None:
+            self.start()
+        listed = set()
+        for ftp_dir in self.get_watch_dirs(self.now()):
+            listed.update(self.list_ftp_files(ftp_dir))
+        if self.known is None:
+            new_files = [f for f in listed if not self.is_local(f)]
+        else:
+            new_files = [f for f in listed if f not in self.known]
+        downloaded = []
+        failed = set()
+        for ftp_filename in sorted(new_files):
+            if self.session.call(self.download_obj.download_ftp_file, ftp_filename):
+                downloaded.append(ftp_filename)
+            else:
+                failed.add(ftp_filename)
+        # failed files are not remembered, so that they are downloaded again at the next poll
+        self.known = listed - failed
+        self.polls += 1
+        self.downloaded += len(downloaded)
+        if self.verbose:
+            print_verbose('{}: poll {}; {} files listed; {} downloaded; {} failed'.format(
+                self.download_obj.__class__.__name__, self.polls, len(listed), len(downloaded), len(failed)))
+        return downloaded
+
+    def wait(self, seconds):
+        """Wait seconds or until stop() is called, sending NOOP every keepalive seconds"""
+        end = time.time() + seconds
+        while not self.stop_event.is_set():
+            remaining = end - time.time()
+            if remaining <= 0:
+                return
+            self.stop_event.wait(min(remaining, self.keepalive or remaining))
+            if self.keepalive and not self.stop_event.is_set() and end - time.time() > 0:
+                try:
+                    self.session.call(lambda ftp: ftp.voidcmd('NOOP'))
+                except Exception, e:
+                    print_verbose('{}: {}'.format(self.download_obj.__class__.__name__, e))
+                    self.session.reset()  # reconnected at the next poll
+
+    def run(self, max_polls=None):
+        """Poll every interval seconds until stop() is called, the process is interrupted or max_polls is reached
+
+        Errors of a poll are reported and the next poll is attempted.
+
+        :param max_polls: maximum number of polls or None
+        """
+        self.start()
+        try:
+            polls = 0
+            while not self.stop_event.is_set():
+                time0 = time.time()
+                try:
+                    self.poll()
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except Exception, e:
+                    print_verbose('{}: {}'.format(self.download_obj.__class__.__name__, e))
+                    self.session.reset()
+                polls += 1
+                if max_polls is not None and polls >= max_polls:
+                    break
+                self.wait(self.interval - (time.time() - time0))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
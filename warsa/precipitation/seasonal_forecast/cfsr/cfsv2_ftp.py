@@ -0,0 +1,113 @@
+import os
+import time
+import datetime
+from calendar import monthrange
+from warsa.precipitation.satellite.download import print_verbose
+from warsa.precipitation.satellite.ftp_cache import FTPListingCache
+from warsa.precipitation.satellite.ftp_crawl import FTPTreeCrawler
+from warsa.precipitation.satellite.ftp_pool import FTPCommandCounter, FTPConnectionPool
+from warsa.precipitation.satellite.transfer import retrieve_ftp_file
+
+# Directory tree of the CFSv2 products on nomads.ncdc.noaa.gov: ftp_dir/YYYY/YYYYMM/YYYYMMDD/YYYYMMDDHH/files
+
+
+def get_dir_end(name):
+    """Return the end of the period of a directory named YYYY, YYYYMM, YYYYMMDD or YYYYMMDDHH or None"""
+    if not name.isdigit():
+        return None
+    y = int(name[:4])
+    if len(name) == 4:
+        return datetime.datetime(y + 1, 1, 1)
+    m = int(name[4:6])
+    if len(name) == 6:
+        return datetime.datetime(y, m, monthrange(y, m)[1]) + datetime.timedelta(days=1)
+    if len(name) == 8:
+        return datetime.datetime(y, m, int(name[6:8])) + datetime.timedelta(days=1)
+    if len(name) == 10:
+        return datetime.datetime(y, m, int(name[6:8]), int(name[8:10])) + datetime.timedelta(hours=1)
+    return None
+
+
+def is_closed_dir(ftp_dir, settle=datetime.timedelta(days=7), now=None):
+    """Return True if the period of ftp_dir (see get_dir_end) ended more than settle ago. The content of such a
+    directory is not expected to change anymore and its listing can be cached
+    """
+    dir_end = get_dir_end(ftp_dir.rstrip('/').split('/')[-1])
+    return dir_end is not None and dir_end + settle < (now or datetime.datetime.now())
+
+
+def cfsv2_ftp_files(crawler, ftp_dir, last_file=None, prefix='flxf.01.', suffix='.avrg.grib.grb2'):
+    """Return the files of the runs starting on the first day of each month at 00 hours, beginning with the run of
+    last_file
+
+    Directory names are compared as strings, which for fixed-width dates is the same as comparing the dates.
+
+    :param crawler: ftp_crawl.FTPTreeCrawler
+    :param ftp_dir: root dir on the server (/modeldata/cfsv2_forecast_mm_9mon)
+    :param last_file: last downloaded file (e.g., flxf.01.2011040100.201104.avrg.grib.grb2) as found on the local disk
+    :param prefix: prefix of the files, followed by the run (YYYYMMDDHH)
+    :param suffix: suffix of the files
+    :return: sorted list of tuples (ftp_filename, size, timestamp), see FTPTreeCrawler.crawl
+    """
+    run = last_file.split('.')[2][:10] if last_file else '0000000000'
+
+    def valid_dir(n, ends_with=''):
+        return lambda d: len(d) == n and d.isdigit() and d >= run[:n] and d.endswith(ends_with)
+
+    def valid_file(ymdh_dir, f):
+        return f.startswith(prefix + os.path.basename(ymdh_dir)) and f.endswith(suffix)
+
+    return crawler.crawl(ftp_dir, [valid_dir(4), valid_dir(6), valid_dir(8, '01'), valid_dir(10, '00')], valid_file,
+                         is_closed_dir)
+
+
+def download_cfsv2_files(ftp_host, ftp_dir, cfs_dir, email_address, last_file=None, ftp_connections=4,
+                         ftp_timeout=600, prefix='flxf.01.', suffix='.avrg.grib.grb2'):
+    """Download the files found by cfsv2_ftp_files to cfs_dir, keeping the folder structure found on the server
+
+    The tree is crawled with ftp_connections parallel sessions and the listings of closed directories (see
+    is_closed_dir) are cached in cfs_dir/.warsa/ftp_listing.json. The files are then downloaded with up to
+    ftp_connections parallel sessions. Local files having the size found on the server are skipped, partial files
+    are resumed.
+
+    :return: list of the ftp files that could not be downloaded
+    """
+    counter = FTPCommandCounter()
+    listing_cache = FTPListingCache(os.path.join(cfs_dir, '.warsa', 'ftp_listing.json'))
+    crawler = FTPTreeCrawler(ftp_host, 'anonymous', email_address, ftp_timeout, ftp_connections, listing_cache,
+                             counter)
+    time0 = print_verbose('Listing ftp://{}{}...'.format(ftp_host, ftp_dir), same_line=True)
+    try:
+        ftp_files = cfsv2_ftp_files(crawler, ftp_dir, last_file, prefix, suffix)
+    finally:
+        listing_cache.save()
+    print_verbose('{} files found in {:.2f} seconds ({} FTP commands)'.format(len(ftp_files), time.time() - time0,
+                                                                            counter.value))
+    items = []
+    for ftp_file, size, _ in ftp_files:
+        local_filename = os.path.join(cfs_dir, os.path.relpath(ftp_file, ftp_dir))
+        if size is not None and os.path.isfile(local_filename) and os.path.getsize(local_filename) == size:
+            continue
+        items.append((ftp_file, local_filename))
+
+    def download(ftp, item):
+        ftp_file, local_filename = item
+        t0 = time.time()
+        d = os.path.dirname(local_filename)
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:  # created meanwhile by another session
+                if not os.path.isdir(d):
+                    raise
+        resp = retrieve_ftp_file(ftp, ftp_file, local_filename)
+        resp = 'OK' if resp == '226 Transfer complete.' else resp
+        print_verbose('Downloading {} to {}: {}; {:.2f} seconds'.format(ftp_file, local_filename, resp,
+                                                                        time.time() - t0))
+        return True
+
+    pool = FTPConnectionPool(ftp_host, 'anonymous', email_address, ftp_timeout, ftp_connections, counter)
+    failed = sorted([item[0] for item, downloaded in pool.map(download, items) if not downloaded])
+    if failed:
+        print_verbose('{} files failed (partial files kept), downloaded again at the next download'.format(len(failed)))
+    return failed
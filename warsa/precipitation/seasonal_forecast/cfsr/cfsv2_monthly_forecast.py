@@ -14,75 +14,27 @@ from girs.feat.layers import LayersWriter
 from girs.rast.parameter import RasterParameters
 from girs.rast.raster import RasterReader, RasterWriter
 from girs.rastfeat.clip import clip_by_vector
-from ftplib import FTP, error_perm
 import pygrib
+from warsa.precipitation.seasonal_forecast.cfsr.cfsv2_ftp import download_cfsv2_files
+from warsa.precipitation.satellite.geotiff import write_output_geotiff
 
 # See: https://data.nodc.noaa.gov/cgi-bin/iso?id=gov.noaa.ncdc:C00877
 # https://www.ncei.noaa.gov/thredds/catalog/model-cfs-allfiles/cfsv2_forecast_mm_9mon/catalog.html
 
 
-def _get_dirs(ftp, ftp_dir, valid_dir):
-    lines = []
-    ftp.cwd(ftp_dir)
-    ftp.dir(lines.append)
-    for line in lines:
-        if line.startswith('d'):
-            try:
-                sub_dir = line.split()[-1]
-                if valid_dir(sub_dir):
-                    yield '/'.join([ftp_dir, sub_dir])
-            except error_perm, _:
-                print 'Folder {} not found'.format(ftp_dir)
-
-
-def _ftp_files(ftp=None, ftp_dir=None, last_file=None):
-    """
-
-    :param ftp: ftp instance: ftplib.FTP()
-    :param ftp_dir: root dir on the server (/modeldata/cfsv2_forecast_mm_9mon)
-    :param last_file: last downloaded file (e.g., flxf.01.2011040100.201104.avrg.grib.grb2) as found on the local disk
-    :return:
-    """
-    dt_y = dt_ym = dt_ymd = dt_ymdh = datetime.datetime(1900, 1, 1)
-    suffix = '.avrg.grib.grb2'
-    if last_file:
-        dt = datetime.datetime.strptime(last_file.split('.')[2], '%Y%m%d%H%M')
-        dt_y = datetime.datetime(dt.year, 1, 1)
-        dt_ym = datetime.datetime(dt.year, dt.month, 1)
-        dt_ymd = datetime.datetime(dt.year, dt.month, dt.day)
-        dt_ymdh = datetime.datetime(dt.year, dt.month, dt.day, dt.hour)
-
-    for y_dir in _get_dirs(ftp, ftp_dir, lambda d: datetime.datetime.strptime(d, '%Y') >= dt_y):
-        for ym_dir in _get_dirs(ftp, y_dir, lambda d: datetime.datetime.strptime(d, '%Y%m') >= dt_ym):
-            for ymd_dir in _get_dirs(ftp, ym_dir, lambda d: datetime.datetime.strptime(d, '%Y%m%d') >= dt_ymd
-                                                            and d.endswith('01')):
-                for ymdh_dir in _get_dirs(ftp, ymd_dir, lambda d: datetime.datetime.strptime(d, '%Y%m%d%H') >= dt_ymdh
-                                                                  and d.endswith('00')):
-                    prefix = 'flxf.01.{}'.format(os.path.basename(ymdh_dir))
-                    lines = []
-                    ftp.cwd(ymdh_dir)
-                    ftp.dir(lines.append)
-                    for line in lines:
-                        if not line.startswith('d'):
-                            f = os.path.basename(line.split()[-1])  # basename for link (l)
-                            if f.startswith(prefix) and f.endswith(suffix):
-                                ftp_file = '/'.join([ymdh_dir, f])
-                                yield '/' + '/'.join([f for f in ftp_file.split('/') if f])
-
-
-def download_cfsv2_forecast_mm_9mon_flxf(cfs_dir, email_address):
+def download_cfsv2_forecast_mm_9mon_flxf(cfs_dir, email_address, ftp_connections=4):
     """Download flxf-files from cfs V2: up to 9 months monthly forecast. it keeps the folder structure found in
     nomads.ncdc.noaa.gov/modeldata/cfsv2_forecast_mm_9mon
 
     :param cfs_dir: local directory where to save the downloaded data
     :param email_address: used in ftp.login('anonymous', email_address)
-    :return:
+    :param ftp_connections: number of parallel ftp sessions used to list the directories and download the files
+    :return: list of the ftp files that could not be downloaded (see cfsv2_ftp.download_cfsv2_files)
     """
     #  ftp://nomads.ncdc.noaa.gov/modeldata/cfsv2_forecast_mm_9mon/
     ftp_host = 'nomads.ncdc.noaa.gov'
     ftp_dir = '/modeldata/cfsv2_forecast_mm_9mon/'
     ftp_timeout = 600
-    ftp = None
 
     if not cfs_dir.endswith('/'):
         cfs_dir = cfs_dir + '/'
@@ -98,35 +50,9 @@ def download_cfsv2_forecast_mm_9mon_flxf(cfs_dir, email_address):
         else:
             return fs0[2] > fs1[2]
     files = [files for _, _, files in os.walk(cfs_dir) if files]
-    last_file = max(sorted([f for f_list in files for f in f_list if f.endswith('.avrg.grib.grb2')], cmp=f_cmp))
-    try:
-        print 'FTP-login...'
-        time0 = time.time()
-        ftp = FTP(ftp_host, timeout=ftp_timeout)
-        ftp.login('anonymous', email_address)
-        print 'done in {} seconds'.format(time.time() - time0)
-        for ftp_file in _ftp_files(ftp, ftp_dir, last_file=last_file):
-            time0 = time.time()
-            local_filename = ftp_file.replace(ftp_dir, cfs_dir)
-            print 'Downloading {} to {}:'.format(ftp_file, local_filename),
-            if not os.path.isdir(os.path.dirname(local_filename)):
-                os.makedirs(os.path.dirname(local_filename))
-            downloaded = True
-            with open(local_filename, "wb") as bfile:
-                try:
-                    resp = ftp.retrbinary('RETR ' + ftp_file, callback=bfile.write)
-                    resp = 'OK' if resp == '226 Transfer complete.' else resp
-                    print '{}; {:.2f} seconds'.format(resp, time.time() - time0)
-                except Exception, e:
-                    print e
-                    downloaded = False
-            if not downloaded:
-                if os.path.isfile(local_filename):
-                    os.remove(local_filename)
-                print 'in {} seconds (failed) '.format(time.time() - time0)
-    finally:
-        if ftp:
-            ftp.close()
+    last_file = sorted([f for f_list in files for f in f_list if f.endswith('.avrg.grib.grb2')], cmp=f_cmp)
+    last_file = max(last_file) if last_file else None
+    return download_cfsv2_files(ftp_host, ftp_dir, cfs_dir, email_address, last_file, ftp_connections, ftp_timeout)
 
 
 def extract_precipitation_from_grib2(f_in, f_out, layers=None, **kwargs):
@@ -136,8 +62,11 @@ def extract_precipitation_from_grib2(f_in, f_out, layers=None, **kwargs):
     :param f_out: directory of the monthly precipitation rasters
     :param layers:
     :param kwargs:  see clip_by_vector
+        :key scale_factor: if given, e.g., 0.1 (mm), the monthly depth is stored as UInt16 scaled integers instead of
+            Float64 (see geotiff.scale_array)
     :return:
     """
+    scale_factor = kwargs.pop('scale_factor', None)
     if not os.path.isdir(os.path.dirname(f_out)):
         os.makedirs(os.path.dirname(f_out))
 
@@ -171,7 +100,23 @@ def extract_precipitation_from_grib2(f_in, f_out, layers=None, **kwargs):
     data_types = [gdal.GDT_Float64]
     rp = RasterParameters(raster_x_size, raster_y_size, geo_trans, srs, number_of_bands, nodata, data_types)
 
-    if not layers:
+    if scale_factor:
+        rp.driverShortName = 'MEM'
+        r_mem = RasterWriter(rp)
+        r_mem.set_array(arr)
+        r_mem.dataset.FlushCache()
+        dataset = r_mem.dataset
+        vsi_filename = '/vsimem/' + os.path.basename(f_out)
+        try:
+            if layers:
+                kwargs['output_raster'] = vsi_filename
+                clip_by_vector(r_mem, layers, **kwargs)
+                dataset = gdal.Open(vsi_filename)
+            write_output_geotiff(dataset, f_out, scale_factor=scale_factor)
+        finally:
+            dataset = None
+            gdal.Unlink(vsi_filename)
+    elif not layers:
         rp.driverShortName = 'GTiff'
         r_out = RasterWriter(rp, source=f_out)
         r_out.set_array(arr)
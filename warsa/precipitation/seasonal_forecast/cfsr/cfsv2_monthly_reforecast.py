@@ -14,63 +14,14 @@ from girs.feat.layers import LayersWriter
 from girs.rast.parameter import RasterParameters
 from girs.rast.raster import RasterReader, RasterWriter
 from girs.rastfeat.clip import clip_by_vector
-from ftplib import FTP, error_perm
 import pygrib
+from warsa.precipitation.seasonal_forecast.cfsr.cfsv2_ftp import download_cfsv2_files
 
 # See: https://data.nodc.noaa.gov/cgi-bin/iso?id=gov.noaa.ncdc:C00877
 # https://www.ncei.noaa.gov/thredds/catalog/model-cfs-allfiles/cfsv2_forecast_mm_9mon/catalog.html
 
 
-def _get_dirs(ftp, ftp_dir, valid_dir):
-    lines = []
-    ftp.cwd(ftp_dir)
-    ftp.dir(lines.append)
-    for line in lines:
-        if line.startswith('d'):
-            try:
-                sub_dir = line.split()[-1]
-                if valid_dir(sub_dir):
-                    yield '/'.join([ftp_dir, sub_dir])
-            except error_perm, _:
-                print 'Folder {} not found'.format(ftp_dir)
-
-
-def _ftp_files(ftp=None, ftp_dir=None, last_file=None):
-    """
-
-    :param ftp: ftp instance: ftplib.FTP()
-    :param ftp_dir: root dir on the server (/modeldata/cfsv2_forecast_mm_9mon)
-    :param last_file: last downloaded file (e.g., flxf.01.2011040100.201104.avrg.grib.grb2) as found on the local disk
-    :return:
-    """
-    dt_y = dt_ym = dt_ymd = dt_ymdh = datetime.datetime(1900, 1, 1)
-    suffix = '.avrg.grib.grb2'
-    if last_file:
-        dt = datetime.datetime.strptime(last_file.split('.')[2], '%Y%m%d%H%M')
-        dt_y = datetime.datetime(dt.year, 1, 1)
-        dt_ym = datetime.datetime(dt.year, dt.month, 1)
-        dt_ymd = datetime.datetime(dt.year, dt.month, dt.day)
-        dt_ymdh = datetime.datetime(dt.year, dt.month, dt.day, dt.hour)
-
-    for y_dir in _get_dirs(ftp, ftp_dir, lambda d: datetime.datetime.strptime(d, '%Y') >= dt_y):
-        for ym_dir in _get_dirs(ftp, y_dir, lambda d: datetime.datetime.strptime(d, '%Y%m') >= dt_ym):
-            for ymd_dir in _get_dirs(ftp, ym_dir, lambda d: datetime.datetime.strptime(d, '%Y%m%d') >= dt_ymd
-                                                            and d.endswith('01')):
-                for ymdh_dir in _get_dirs(ftp, ymd_dir, lambda d: datetime.datetime.strptime(d, '%Y%m%d%H') >= dt_ymdh
-                                                                  and d.endswith('00')):
-                    prefix = 'flxf.01.{}'.format(os.path.basename(ymdh_dir))
-                    lines = []
-                    ftp.cwd(ymdh_dir)
-                    ftp.dir(lines.append)
-                    for line in lines:
-                        if not line.startswith('d'):
-                            f = os.path.basename(line.split()[-1])  # basename for link (l)
-                            if f.startswith(prefix) and f.endswith(suffix):
-                                ftp_file = '/'.join([ymdh_dir, f])
-                                yield '/' + '/'.join([f for f in ftp_file.split('/') if f])
-
-
-def download_cfsv2_reforecast_ts_9mon_prate(cfs_dir, email_address):
+def download_cfsv2_reforecast_ts_9mon_prate(cfs_dir, email_address, ftp_connections=4):
     """
     http://cfs.ncep.noaa.gov/cfsv2.info/CFSv2.Reforecast.Datasets.Whitepaper.doc
 
@@ -83,13 +34,13 @@ def download_cfsv2_reforecast_ts_9mon_prate(cfs_dir, email_address):
 
     :param cfs_dir:
     :param email_address:
-    :return:
+    :param ftp_connections: number of parallel ftp sessions used to list the directories and download the files
+    :return: list of the ftp files that could not be downloaded (see cfsv2_ftp.download_cfsv2_files)
     """
     #  ftp://nomads.ncdc.noaa.gov/modeldata/cfsv2_forecast_mm_9mon/
     ftp_host = 'nomads.ncdc.noaa.gov'
     ftp_dir = '/modeldata/cfs_reforecast_6-hourly_9mon_flxf/'
     ftp_timeout = 600
-    ftp = None
 
     if not cfs_dir.endswith('/'):
         cfs_dir = cfs_dir + '/'
@@ -111,34 +62,7 @@ def download_cfsv2_reforecast_ts_9mon_prate(cfs_dir, email_address):
         last_file = max(last_file)
     else:
         last_file = None
-    try:
-        print 'FTP-login...'
-        time0 = time.time()
-        ftp = FTP(ftp_host, timeout=ftp_timeout)
-        ftp.login('anonymous', email_address)
-        print 'done in {} seconds'.format(time.time() - time0)
-        for ftp_file in _ftp_files(ftp, ftp_dir, last_file=last_file):
-            time0 = time.time()
-            local_filename = ftp_file.replace(ftp_dir, cfs_dir)
-            print 'Downloading {} to {}:'.format(ftp_file, local_filename),
-            if not os.path.isdir(os.path.dirname(local_filename)):
-                os.makedirs(os.path.dirname(local_filename))
-            downloaded = True
-            with open(local_filename, "wb") as bfile:
-                try:
-                    resp = ftp.retrbinary('RETR ' + ftp_file, callback=bfile.write)
-                    resp = 'OK' if resp == '226 Transfer complete.' else resp
-                    print '{}; {:.2f} seconds'.format(resp, time.time() - time0)
-                except Exception, e:
-                    print e
-                    downloaded = False
-            if not downloaded:
-                if os.path.isfile(local_filename):
-                    os.remove(local_filename)
-                print 'in {} seconds (failed) '.format(time.time() - time0)
-    finally:
-        if ftp:
-            ftp.close()
+    return download_cfsv2_files(ftp_host, ftp_dir, cfs_dir, email_address, last_file, ftp_connections, ftp_timeout)
 
 
 def extract_precipitation_from_grib2(f_in, f_out, layers=None, **kwargs):
@@ -0,0 +1,168 @@
+import os
+import base64
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        pass  # e.g., connections closed by the client or by stop()
+
+
+class _FileHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """GET of files below server.root_dir with keep-alive, Range requests (bytes=first-[last]) and optional basic
+    authentication"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.sockets.add(self.connection)
+            self.server.threads.add(threading.current_thread())
+
+    def finish(self):
+        with self.server.lock:
+            self.server.sockets.discard(self.connection)
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        except socket.error:  # closed by stop()
+            pass
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.user:
+            expected = 'Basic ' + base64.b64encode('{}:{}'.format(self.server.user, self.server.password))
+            if self.headers.getheader('Authorization') != expected:
+                self.send_empty(401, {'WWW-Authenticate': 'Basic realm="test"'})
+                return
+        path = self.path.split('?')[0].lstrip('/')
+        filename = os.path.join(self.server.root_dir, *path.split('/'))
+        if not path or not os.path.isfile(filename):
+            self.send_empty(404)
+            return
+        size = os.path.getsize(filename)
+        offset = 0
+        end = size  # exclusive
+        range_header = self.headers.getheader('Range')
+        if self.server.ranges and range_header and range_header.startswith('bytes='):
+            first, last = range_header[6:].split('-', 1)
+            offset = int(first)
+            if last:
+                end = min(size, int(last) + 1)
+            if offset >= size:
+                self.send_empty(416, {'Content-Range': 'bytes */{}'.format(size)})
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(offset, end - 1, size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - offset))
+        self.end_headers()
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            remaining = end - offset
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 16))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+
+
+class LocalHTTPServer(object):
+    """In-process http server serving a local directory read-only, with keep-alive connections, Range requests
+    (resume) and optional basic authentication. It counts connections and requests, e.g., to check connection reuse
+
+    Usage:
+        with LocalHTTPServer(root_dir) as server:
+            pool = HTTPDownloadPool(workers=4)
+            pool.map([(server.url + 'file.zip', local_filename)])
+    """
+
+    def __init__(self, root_dir, user=None, password=None, host='127.0.0.1', port=0, ranges=True):
+        """
+
+        :param root_dir: local directory served as the http root
+        :param user: user name required by basic authentication or None
+        :param password: password of user
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param ranges: if False, Range headers are ignored and whole files are sent
+        """
+        self.root_dir = root_dir
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.ranges = ranges
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(self.host, self.port)
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self.server = _ThreadingHTTPServer((self.host, self.port), _FileHandler)
+        self.server.root_dir = self.root_dir
+        self.server.user = self.user
+        self.server.password = self.password
+        self.server.ranges = self.ranges
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.sockets = set()
+        self.server.threads = set()
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.server.shutdown()
+            self.server.server_close()
+            with self.server.lock:  # idle keep-alive connections
+                for s in list(self.server.sockets):
+                    try:
+                        s.shutdown(socket.SHUT_RDWR)
+                    except socket.error:
+                        pass
+            for t in list(self.server.threads):
+                t.join(5.0)
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,293 @@
+import os
+import time
+import base64
+import socket
+import httplib
+import urllib2
+import urlparse
+import threading
+from Queue import Queue, Empty
+from cookielib import CookieJar
+from warsa.utils.partfile import part_filename, replace_file
+from warsa.utils.retry import RetryPolicy
+
+
+MAX_REDIRECTS = 10
+
+
+class HTTPStatusError(IOError):
+    """Unexpected HTTP response status"""
+
+    def __init__(self, url, status, reason=''):
+        IOError.__init__(self, '{} {}: {}'.format(status, reason, url))
+        self.url = url
+        self.status = status
+
+
+def is_transient_http_error(e):
+    """Return True for errors worth a retry: network errors, incomplete transfers, 5xx and 429 responses (HTTPStatusError
+    or urllib2.HTTPError)
+    """
+    if isinstance(e, HTTPStatusError):
+        return e.status >= 500 or e.status == 429
+    if isinstance(e, urllib2.HTTPError):
+        return e.code >= 500 or e.code == 429
+    return isinstance(e, (socket.error, httplib.HTTPException, IOError))
+
+
+class _CookieResponse(object):
+    """Adapter of httplib.HTTPResponse for CookieJar.extract_cookies"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def info(self):
+        return self.response.msg
+
+
+class HTTPSession(object):
+    """Keep-alive HTTP(S) connections, one per host, used by a single thread
+
+    Redirects are followed, cookies are kept in a cookie jar, which can be shared by several sessions, and basic
+    authentication credentials are sent only to the hosts they are given for (e.g., NASA Earthdata login
+    urs.earthdata.nasa.gov, which redirects back to the data server with a session cookie).
+    """
+
+    def __init__(self, credentials=None, cookie_jar=None, timeout=600):
+        """
+
+        :param credentials: dictionary host -> (user, password)
+        :param cookie_jar: cookielib.CookieJar, default a new one
+        :param timeout: socket timeout in seconds
+        """
+        self.credentials = credentials or dict()
+        self.cookie_jar = cookie_jar if cookie_jar is not None else CookieJar()
+        self.timeout = timeout
+        self.connections = dict()
+        self.requests = 0  # number of requests sent
+        self.connects = 0  # number of connections opened
+
+    def get_connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self.connections:
+            connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            self.connections[key] = connection_class(netloc, timeout=self.timeout)
+            self.connects += 1
+        return self.connections[key]
+
+    def reset(self, scheme=None, netloc=None):
+        """Close the connection to netloc or, if not given, all connections"""
+        for key in list(self.connections.keys()):
+            if netloc is None or key == (scheme, netloc):
+                self.connections.pop(key).close()
+
+    def close(self):
+        self.reset()
+
+    def send(self, method, url, headers=None):
+        """Send one request and return the response. A connection closed by the server while idle is reopened"""
+        parts = urlparse.urlsplit(url)
+        path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        request = urllib2.Request(url, headers=headers or dict())
+        self.cookie_jar.add_cookie_header(request)
+        headers = dict(request.header_items())
+        hostname = parts.hostname
+        if hostname in self.credentials:
+            user, password = self.credentials[hostname]
+            headers['Authorization'] = 'Basic ' + base64.b64encode('{}:{}'.format(user, password))
+        for attempt in range(2):
+            reused = (parts.scheme, parts.netloc) in self.connections
+            connection = self.get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request(method, path, headers=headers)
+                self.requests += 1
+                response = connection.getresponse()
+                break
+            except (socket.error, httplib.BadStatusLine, httplib.CannotSendRequest, httplib.ResponseNotReady), _:
+                self.reset(parts.scheme, parts.netloc)
+                if not reused or attempt:
+                    raise
+        self.cookie_jar.extract_cookies(_CookieResponse(response), request)
+        return response
+
+    def open(self, url, headers=None):
+        """Send a GET request following redirects
+
+        :param url: http or https url
+        :param headers: dictionary of request headers
+        :return: tuple (response, url), the body of response was not read yet. It must be read completely before
+            the next request to the same host, so that the connection can be reused
+        :raise HTTPStatusError: if the final status is not 2xx
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.send('GET', url, headers)
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader('location')
+                response.read()
+                if not location:
+                    raise HTTPStatusError(url, response.status, response.reason)
+                url = urlparse.urljoin(url, location)
+                continue
+            if response.status >= 300 and response.status != 416:
+                response.read()
+                raise HTTPStatusError(url, response.status, response.reason)
+            return response, url
+        raise HTTPStatusError(url, 310, 'too many redirects')
+
+
+def get_complete_length(content_range):
+    """Return the complete length of the resource from the Content-Range header of a 416 response, 'bytes */<size>',
+    or None if not given or unknown ('*')
+    """
+    if not content_range:
+        return None
+    unit, _, value = content_range.strip().partition(' ')
+    length = value.rpartition('/')[2].strip()
+    if unit.lower() != 'bytes' or not length.isdigit():
+        return None
+    return int(length)
+
+
+def retrieve_http_file(session, url, local_filename, resume=True, blocksize=1 << 16):
+    """Download url to local_filename through a partial file local_filename + '.part'
+
+    The body is written in blocks of blocksize bytes while received. If a partial file from a previous (failed)
+    transfer exists, the transfer restarts at its size using a Range request (servers ignoring Range send the whole
+    file, which then replaces the partial file). The partial file is renamed to local_filename only after the
+    transfer is complete (see partfile.replace_file). If the server answers the Range request with 416 (range not
+    satisfiable), the partial file is taken as complete only if its size is the length given in Content-Range;
+    otherwise it is discarded and the whole file is downloaded again.
+
+    :param session: HTTPSession
+    :param url: http or https url
+    :param local_filename: full path of the local file
+    :param resume: if False, an existing partial file is discarded
+    :param blocksize: size of the blocks read and written
+    :return: number of bytes received
+    :raise IOError: if the connection was closed before the end of the body. The partial file is kept
+    """
+    local_part_filename = part_filename(local_filename)
+    offset = os.path.getsize(local_part_filename) if resume and os.path.isfile(local_part_filename) else 0
+    headers = {'Range': 'bytes={}-'.format(offset)} if offset else None
+    response, _ = session.open(url, headers)
+    if response.status == 416:  # range not satisfiable: the partial file may be complete
+        response.read()
+        if get_complete_length(response.getheader('content-range')) == offset:
+            replace_file(local_part_filename, local_filename)
+            return 0
+        os.remove(local_part_filename)
+        return retrieve_http_file(session, url, local_filename, False, blocksize)
+    mode = 'ab' if response.status == 206 else 'wb'
+    length = response.getheader('content-length')
+    length = int(length) if length is not None else None
+    received = 0
+    try:
+        with open(local_part_filename, mode) as f:
+            while True:
+                block = response.read(blocksize)
+                if not block:
+                    break
+                f.write(block)
+                received += len(block)
+    except Exception:
+        session.reset()
+        raise
+    if length is not None and received < length:
+        session.reset()
+        raise IOError('{}: incomplete transfer ({} of {} bytes)'.format(url, received, length))
+    replace_file(local_part_filename, local_filename)
+    return received
+
+
+class HTTPDownloadPool(object):
+    """Download files with parallel workers, each keeping its connections alive between files
+
+    Workers share the cookie jar, so that a login (e.g., Earthdata) is done only once per worker connection.
+    Transient errors (see is_transient_http_error) are retried following the retry policy, partial files are resumed.
+
+    Usage:
+        pool = HTTPDownloadPool(workers=4, credentials={'urs.earthdata.nasa.gov': (user, password)})
+        results = pool.map([(url, local_filename), ...])
+    """
+
+    def __init__(self, workers=4, credentials=None, timeout=600, retry_policy=None, verbose=True):
+        """
+
+        :param workers: number of parallel workers
+        :param credentials: see HTTPSession
+        :param timeout: socket timeout in seconds
+        :param retry_policy: retry.RetryPolicy, default RetryPolicy()
+        :param verbose: if True, outputs each downloaded file
+        """
+        self.workers = max(1, int(workers))
+        self.credentials = credentials
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.verbose = verbose
+        self.cookie_jar = CookieJar()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+
+    def download(self, session, url, local_filename):
+        """Download one file, retrying after transient errors
+
+        :return: True if downloaded, otherwise False
+        """
+        delays = self.retry_policy.delays()
+        time0 = time.time()
+        while True:
+            try:
+                size = retrieve_http_file(session, url, local_filename)
+                if self.verbose:
+                    print '{}; {} bytes; {:.2f} seconds'.format(os.path.basename(local_filename), size,
+                                                              time.time() - time0)
+                return True
+            except Exception, e:
+                delay = next(delays, None) if is_transient_http_error(e) else None
+                if delay is None:
+                    print '{}; failed (partial file kept): {}'.format(os.path.basename(local_filename), e)
+                    return False
+                print '{} (retrying in {:.0f} seconds)'.format(e, delay)
+                time.sleep(delay)
+
+    def map(self, items):
+        """Download the files
+
+        :param items: list of tuples (url, local_filename)
+        :return: list of tuples (url, local_filename, downloaded) in the order of items
+        """
+        queue = Queue()
+        for i, item in enumerate(items):
+            queue.put((i, item))
+        results = [None] * len(items)
+
+        def worker():
+            session = HTTPSession(self.credentials, self.cookie_jar, self.timeout)
+            try:
+                while True:
+                    try:
+                        i, (url, local_filename) = queue.get_nowait()
+                    except Empty:
+                        return
+                    d = os.path.dirname(local_filename)
+                    if d and not os.path.isdir(d):
+                        try:
+                            os.makedirs(d)
+                        except OSError:  # created meanwhile by another worker
+                            if not os.path.isdir(d):
+                                raise
+                    results[i] = (url, local_filename, self.download(session, url, local_filename))
+            finally:
+                session.close()
+                with self.lock:
+                    self.requests += session.requests
+                    self.connects += session.connects
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.workers, len(items)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
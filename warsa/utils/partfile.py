@@ -0,0 +1,19 @@
+import os
+
+
+PART_SUFFIX = '.part'
+
+
+def part_filename(local_filename):
+    return local_filename + PART_SUFFIX
+
+
+def is_part_file(filename):
+    return filename.endswith(PART_SUFFIX)
+
+
+def replace_file(src, dst):
+    """Rename src to dst, replacing dst if it exists (os.rename does not overwrite on Windows)"""
+    if os.path.isfile(dst):
+        os.remove(dst)
+    os.rename(src, dst)
@@ -0,0 +1,22 @@
+class RetryPolicy(object):
+    """Number of retries and exponential backoff delays after transient errors"""
+
+    def __init__(self, retries=3, delay=2.0, max_delay=60.0, factor=2.0):
+        """
+
+        :param retries: number of retries after the first attempt
+        :param delay: seconds to wait before the first retry
+        :param max_delay: maximum seconds to wait before a retry
+        :param factor: the delay is multiplied by factor after each retry
+        """
+        self.retries = max(0, int(retries))
+        self.delay = delay
+        self.max_delay = max_delay
+        self.factor = factor
+
+    def delays(self):
+        """Yield the delay before each retry"""
+        delay = self.delay
+        for _ in range(self.retries):
+            yield min(delay, self.max_delay)
+            delay *= self.factor